@@ -6,32 +6,80 @@ Now with:
 - Gallery page fully uses translations (and some extra labels localized)
 """
 
-import requests
 import time
+import asyncio
+import atexit
 import subprocess
 import os
 import sys
 import select
 import serial
+import signal
 import shutil
 import json
+import base64
+import csv
+import errno
+import gzip
+import mimetypes
+import hashlib
+import html
+import importlib
+import io
+import math
 import re
+import sqlite3
 import threading
-from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
-from urllib.parse import urlparse, parse_qs
+from array import array
+from collections import OrderedDict, deque, namedtuple
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from bisect import bisect_left
+from itertools import chain, islice
+from types import MappingProxyType
+from http.client import parse_headers
+from http.server import SimpleHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
 from datetime import datetime, timedelta, timezone
-from skyfield.api import load, wgs84, EarthSatellite
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-from glob import glob
-import numpy as np
+
+STARTED = time.monotonic()  # startup timings are reported against this
+
+class _Lazy:
+    # stands in for a heavy module (or one of its attributes) and imports it
+    # on first use, so the HTTP server and a cached plan come up first
+    def __init__(self, module, attr=None):
+        self.__dict__.update(_module=module, _attr=attr, _obj=None)
+
+    def _load(self):
+        obj = self.__dict__["_obj"]
+        if obj is None:
+            obj = importlib.import_module(self._module)
+            if self._attr:
+                obj = getattr(obj, self._attr)
+            self.__dict__["_obj"] = obj
+        return obj
+
+    def __getattr__(self, name):
+        val = getattr(self._load(), name)
+        self.__dict__[name] = val
+        return val
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+requests = _Lazy("requests")
+np = _Lazy("numpy")
+load = _Lazy("skyfield.api", "load")
+wgs84 = _Lazy("skyfield.api", "wgs84")
+EarthSatellite = _Lazy("skyfield.api", "EarthSatellite")
 
 # ---------------- Paths ----------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SEKIMAS_TXT     = os.path.join(BASE_DIR, "sekimas.txt")
 SELECTION_JSON  = os.path.join(BASE_DIR, "selection.json")
 CURRENT_JSON    = os.path.join(BASE_DIR, "current.json")
+PLAN_CACHE_JSON = os.path.join(BASE_DIR, "plan_cache.json")
+RUN_STATE_JSON  = os.path.join(BASE_DIR, "run_state.json")
 NUSTATYMAI_TXT  = os.path.join(BASE_DIR, "nustatymai.txt")
 TLE_FILENAME    = os.path.join(BASE_DIR, "tle.txt")
 LAIKAI_FILENAME = os.path.join(BASE_DIR, "laikai.txt")
@@ -56,7 +104,8 @@ DEFAULT_SETTINGS = {
     "SATDUMP_LEAD": 10,
     "SATDUMP_TAIL": 120,
     "USE_MANUAL_TLE": 0,
-    "GALLERY_KEEP_DAYS": 0
+    "GALLERY_KEEP_DAYS": 0,
+    "TILES_ENABLE": 0
 }
 
 SETTINGS = DEFAULT_SETTINGS.copy()
@@ -81,6 +130,7 @@ SATDUMP_RATE_ARG = "-s"
 SATDUMP_DEVICE_ARGS = DEFAULT_SETTINGS["SATDUMP_DEVICE_ARGS"]
 SATDUMP_OUT_ROOT = ""
 GALLERY_KEEP_DAYS = DEFAULT_SETTINGS["GALLERY_KEEP_DAYS"]
+TILES_ENABLE = DEFAULT_SETTINGS["TILES_ENABLE"]
 
 # Aliases for SatDump satellite names
 SATDUMP_ALIASES = {
@@ -92,6 +142,13 @@ SATDUMP_ALIASES = {
 
 THUMB_SIZE = 300
 
+# Responsive derivatives (long edge, px) served instead of full-size products
+DERIV_SIZES = {"thumb": 320, "preview": 1024, "large": 2048}
+DERIV_QUALITY = 82
+
+# Deep-zoom (DZI) pyramid, only for images larger than the "large" derivative
+TILE_SIZE = 256
+
 # Local time zone
 try:
     from zoneinfo import ZoneInfo
@@ -99,18 +156,32 @@ try:
 except Exception:
     LOCAL_TZ = timezone(timedelta(hours=3))
 
-# Thumbnails (optional)
+# Brotli variants of written assets (optional, gzip is always written)
 try:
-    from PIL import Image
-    PIL_OK = True
+    import brotli
 except Exception:
-    PIL_OK = False
+    brotli = None
+
+# Thumbnails (optional); Pillow is only imported by the first thumbnail job
+Image = _Lazy("PIL.Image")
+_deriv_fmt = {}
+
+def deriv_ext():
+    # "webp" when this Pillow can write it, "jpg" otherwise, None without Pillow
+    if "ext" not in _deriv_fmt:
+        try:
+            from PIL import features
+            _deriv_fmt["ext"] = "webp" if features.check("webp") else "jpg"
+        except Exception:
+            _deriv_fmt["ext"] = None
+    return _deriv_fmt["ext"]
 
 # ---------------- I18N: translations ----------------
 SEED_LT = {
     "nav_laikai": "Laikai",
     "nav_galerija": "Galerija",
     "nav_nustatymai": "Nustatymai",
+    "nav_zemelapis": "Zemelapis",
     "nav_local_time": "Vietos laikas",
     "nav_lang_lt": "LT",
     "nav_lang_en": "EN",
@@ -126,7 +197,7 @@ SEED_LT = {
     "gallery_title": "Galerija",
     "settings_title": "Nustatymai",
     "btn_save": "Issaugoti",
-    "saved_alert": "Nustatymai issaugoti. Kai kurie pokyciai isigalios po skripto perkrovimo.",
+    "saved_alert": "Nustatymai issaugoti ir pritaikyti.",
     "save_err_alert": "Nepavyko issaugoti nustatymu.",
     "replan_button": "Perplanuoti",
     "replan_processing": "Perplanuojama...",
@@ -172,11 +243,25 @@ SEED_LT = {
     "cleanup_done": "Istrinta katalogu: {n}",
     "btn_add": "Prideti",
     "btn_remove": "Salinti",
+    "original_link": "Originalas",
+    "tiles_enable": "Didinamos plyteles",
+    "tiles_on": "Ijungta",
+    "tiles_hint": "Plyteliu piramide didesniems nei 2048 px vaizdams (daugiau vietos SD korteleje).",
+    "filter_all_sats": "Visi palydovai",
+    "filter_from": "Nuo",
+    "filter_to": "Iki",
+    "live_title": "Dabar",
+    "live_idle": "Laukiama",
+    "plan_empty": "Suplanuotu praejimu nera",
+    "skyplot": "Dangaus trajektorija",
+    "map_title": "Trasos ir matomumo zonos",
+    "map_passes": "Praejimu kiekvienam palydovui",
 }
 SEED_EN = {
     "nav_laikai": "Passes",
     "nav_galerija": "Gallery",
     "nav_nustatymai": "Settings",
+    "nav_zemelapis": "Map",
     "nav_local_time": "Local time",
     "nav_lang_lt": "LT",
     "nav_lang_en": "EN",
@@ -192,7 +277,7 @@ SEED_EN = {
     "gallery_title": "Gallery",
     "settings_title": "Settings",
     "btn_save": "Save",
-    "saved_alert": "Settings saved. Some changes apply after script restart.",
+    "saved_alert": "Settings saved and applied.",
     "save_err_alert": "Failed to save settings.",
     "replan_button": "Replan",
     "replan_processing": "Replanning...",
@@ -238,6 +323,19 @@ SEED_EN = {
     "cleanup_done": "Deleted folders: {n}",
     "btn_add": "Add",
     "btn_remove": "Remove",
+    "original_link": "Original",
+    "tiles_enable": "Deep-zoom tiles",
+    "tiles_on": "On",
+    "tiles_hint": "Tile pyramid for images larger than 2048 px (more SD card space).",
+    "filter_all_sats": "All satellites",
+    "filter_from": "From",
+    "filter_to": "To",
+    "live_title": "Live",
+    "live_idle": "Idle",
+    "plan_empty": "No planned passes",
+    "skyplot": "Sky plot",
+    "map_title": "Ground tracks and footprints",
+    "map_passes": "Passes per satellite",
 }
 
 def ensure_language_files():
@@ -310,7 +408,7 @@ def load_settings_file():
                 k = k.strip(); v = v.strip()
                 if k not in cfg:
                     continue
-                if k in ("HTTP_PORT","BAUDRATE","UPDATE_INTERVAL","SATDUMP_RATE","SATDUMP_LEAD","SATDUMP_TAIL","USE_MANUAL_TLE","GALLERY_KEEP_DAYS"):
+                if k in ("HTTP_PORT","BAUDRATE","UPDATE_INTERVAL","SATDUMP_RATE","SATDUMP_LEAD","SATDUMP_TAIL","USE_MANUAL_TLE","GALLERY_KEEP_DAYS","TILES_ENABLE"):
                     try: cfg[k] = int(float(v.replace("_","")))
                     except Exception: pass
                 elif k in ("KOORD_LAT","KOORD_LON","ALTITUDE_LIMIT"):
@@ -332,44 +430,125 @@ def save_settings_file(cfg: dict):
     except Exception as e:
         print("[ERR] save_settings_file:", e)
 
-def apply_settings(cfg: dict):
-    global SETTINGS, LANG, L
-    SETTINGS = cfg.copy()
-    LANG = (cfg.get("LANG") or "lt").lower()
+# Settings are published as one immutable snapshot (CONFIG). apply_settings
+# builds the next one completely, swaps it in with a single assignment and
+# then notifies subscribers of the keys that changed. The module-level
+# mirrors stay for page code; the tracker and SatDump read CONFIG once per
+# step so they never see half of an update.
+Config = namedtuple("Config", "version settings lang strings tle_url lat lon serial_port baudrate "
+                              "update_interval altitude_limit http_port out_dir satdump_mode satdump_lead "
+                              "satdump_tail satdump_source satdump_rate satdump_device_args keep_days tiles_enable")
+CONFIG = None
+CONFIG_LOCK = threading.Lock()
+CONFIG_SUBSCRIBERS = []
+
+def subscribe_config(fn, *keys):
+    # fn(old, new) runs after a swap that changed any of the given settings keys
+    CONFIG_SUBSCRIBERS.append((fn, set(keys)))
+
+def build_config(cfg: dict, version: int) -> Config:
+    lang = (cfg.get("LANG") or "lt").lower()
     ensure_language_files()
-    L = load_language(LANG)
+    out_dir = cfg["NUOTRAUKU_KATALOGAS"]
+    mode = cfg["SATDUMP_MODE"].strip().lower()
+    return Config(
+        version=version,
+        settings=MappingProxyType(dict(cfg)),
+        lang=lang,
+        strings=MappingProxyType(load_language(lang)),
+        tle_url=cfg["TLE_URL"],
+        lat=float(cfg["KOORD_LAT"]),
+        lon=float(cfg["KOORD_LON"]),
+        serial_port=cfg["SERIAL_PORT"],
+        baudrate=int(cfg["BAUDRATE"]),
+        update_interval=int(cfg["UPDATE_INTERVAL"]),
+        altitude_limit=float(cfg["ALTITUDE_LIMIT"]),
+        http_port=int(cfg["HTTP_PORT"]),
+        out_dir=out_dir if os.path.isabs(out_dir) else os.path.join(BASE_DIR, out_dir),
+        satdump_mode=mode if mode in ("start", "end") else "start",
+        satdump_lead=int(cfg["SATDUMP_LEAD"]),
+        satdump_tail=int(cfg["SATDUMP_TAIL"]),
+        satdump_source=cfg["SATDUMP_SOURCE"],
+        satdump_rate=int(cfg["SATDUMP_RATE"]),
+        satdump_device_args=cfg["SATDUMP_DEVICE_ARGS"],
+        keep_days=int(cfg.get("GALLERY_KEEP_DAYS", 0)),
+        tiles_enable=int(cfg.get("TILES_ENABLE", 0)),
+    )
 
+def _swap_config(cfg: dict):
+    global CONFIG, SETTINGS, LANG, L
     global TLE_URL, KOORD_LAT, KOORD_LON, SERIAL_PORT, BAUDRATE
     global UPDATE_INTERVAL, ALTITUDE_LIMIT, HTTP_PORT, NUOTRAUKU_KATALOGAS
     global SATDUMP_MODE, SATDUMP_LEAD, SATDUMP_TAIL, SATDUMP_SOURCE, SATDUMP_RATE, SATDUMP_DEVICE_ARGS
-    global GALLERY_KEEP_DAYS
-
-    TLE_URL = cfg["TLE_URL"]
-    KOORD_LAT = float(cfg["KOORD_LAT"])
-    KOORD_LON = float(cfg["KOORD_LON"])
-    SERIAL_PORT = cfg["SERIAL_PORT"]
-    BAUDRATE = int(cfg["BAUDRATE"])
-    UPDATE_INTERVAL = int(cfg["UPDATE_INTERVAL"])
-    ALTITUDE_LIMIT = float(cfg["ALTITUDE_LIMIT"])
-    HTTP_PORT = int(cfg["HTTP_PORT"])
+    global GALLERY_KEEP_DAYS, TILES_ENABLE
+
+    with CONFIG_LOCK:
+        old = CONFIG
+        new = build_config(cfg, old.version + 1 if old else 1)
+        CONFIG = new
+
+        SETTINGS = dict(new.settings)
+        LANG, L = new.lang, new.strings
+        TLE_URL, KOORD_LAT, KOORD_LON = new.tle_url, new.lat, new.lon
+        SERIAL_PORT, BAUDRATE = new.serial_port, new.baudrate
+        UPDATE_INTERVAL, ALTITUDE_LIMIT, HTTP_PORT = new.update_interval, new.altitude_limit, new.http_port
+        NUOTRAUKU_KATALOGAS = new.out_dir
+        SATDUMP_MODE, SATDUMP_LEAD, SATDUMP_TAIL = new.satdump_mode, new.satdump_lead, new.satdump_tail
+        SATDUMP_SOURCE, SATDUMP_RATE, SATDUMP_DEVICE_ARGS = new.satdump_source, new.satdump_rate, new.satdump_device_args
+        GALLERY_KEEP_DAYS, TILES_ENABLE = new.keep_days, new.tiles_enable
+    bump_state("settings")
+    return old, new
+
+def _notify_config(old, new, changed, skip=()):
+    # runs subscribers for the changed keys; returns {key: error} of the ones that failed
+    errors = {}
+    for fn, keys in list(CONFIG_SUBSCRIBERS):
+        if fn in skip or not (changed & keys):
+            continue
+        try:
+            fn(old, new)
+        except Exception as e:
+            print(f"[CONFIG] {fn.__name__} failed:", e)
+            for k in changed & keys:
+                errors[k] = f"{k}: {e}"
+            skip = tuple(skip) + (fn,)
+    return errors, skip
 
-    out_dir = cfg["NUOTRAUKU_KATALOGAS"]
-    NUOTRAUKU_KATALOGAS = out_dir if os.path.isabs(out_dir) else os.path.join(BASE_DIR, out_dir)
-
-    SATDUMP_MODE = cfg["SATDUMP_MODE"].strip().lower()
-    if SATDUMP_MODE not in ("start", "end"):
-        SATDUMP_MODE = "start"
-    SATDUMP_LEAD = int(cfg["SATDUMP_LEAD"])
-    SATDUMP_TAIL = int(cfg["SATDUMP_TAIL"])
-    SATDUMP_SOURCE = cfg["SATDUMP_SOURCE"]
-    SATDUMP_RATE = int(cfg["SATDUMP_RATE"])
-    SATDUMP_DEVICE_ARGS = cfg["SATDUMP_DEVICE_ARGS"]
-    GALLERY_KEEP_DAYS = int(cfg.get("GALLERY_KEEP_DAYS", 0))
+def apply_settings(cfg: dict):
+    # returns (applied keys, {key: error}); both empty on first load. Keys whose
+    # subscriber failed are put back to their old value in CONFIG and the file,
+    # so nothing claims a port or device that never actually switched.
+    old, new = _swap_config(cfg)
+    if old is None:
+        return set(), {}
+    changed = {k for k in new.settings if old.settings.get(k) != new.settings.get(k)}
+    errors, failed = _notify_config(old, new, changed)
+    if errors:
+        back = dict(new.settings)
+        for k in errors:
+            back[k] = old.settings.get(k)
+        save_settings_file(back)
+        bad, good = _swap_config(back)
+        # subscribers that did switch to the rejected values follow them back
+        _notify_config(bad, good, set(errors), skip=failed)
+        print(f"[CONFIG] rolled back: {', '.join(sorted(errors))}")
+    applied = changed - set(errors)
+    if applied:
+        print(f"[CONFIG] v{CONFIG.version} applied: {', '.join(sorted(applied))}")
+    return applied, errors
 
 # ---------------- Helpers ----------------
 def now_utc():
     return datetime.now(timezone.utc)
 
+_startup_marks = set()
+
+def startup_mark(what: str):
+    # one line per milestone, seconds since the process started
+    if what not in _startup_marks:
+        _startup_marks.add(what)
+        print(f"[STARTUP] {what} after {time.monotonic() - STARTED:.2f}s")
+
 def to_local_naive(dt_utc: datetime):
     return dt_utc.astimezone(LOCAL_TZ).replace(tzinfo=None)
 
@@ -378,42 +557,482 @@ def sanitize_name(s: str) -> str:
     s = re.sub(r"[^A-Za-z0-9_\-]", "", s)
     return s[:64] if len(s) > 64 else s
 
-def get_current_pass_id():
+# Version counters of everything the dynamic pages are rendered from.
+STATE_LOCK = threading.Lock()
+STATE_VERSIONS = {"plan": 0, "gallery": 0, "settings": 0, "selection": 0}
+STATE_TIMES = {k: time.time() for k in STATE_VERSIONS}
+
+def bump_state(*keys):
+    with STATE_LOCK:
+        for k in keys:
+            STATE_VERSIONS[k] += 1
+            STATE_TIMES[k] = time.time()
+
+def state_snapshot(*keys):
+    with STATE_LOCK:
+        return tuple(STATE_VERSIONS[k] for k in keys), max(STATE_TIMES[k] for k in keys)
+
+def atomic_write_text(path: str, text: str):
+    atomic_write_bytes(path, text.encode("utf-8"))
+
+def atomic_write_bytes(path: str, data: bytes):
+    # readers see either the old or the new file, never a half-written one
+    d = os.path.dirname(path) or "."
+    tmp = os.path.join(d, f".{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp")
     try:
-        with open(CURRENT_JSON, "r", encoding="utf-8") as f:
-            j = json.load(f)
-            return j.get("id") or ""
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
     except Exception:
-        return ""
+        try: os.remove(tmp)
+        except OSError: pass
+        raise
+
+def get_current_pass_id():
+    return STATE.current or ""
 
 # ---- TLE and satellites list (laikai.txt) ----
+# TLE_URL may list several sources (group files, a local mirror) separated by
+# commas or spaces. Each one is fetched conditionally through a pooled session
+# and its last good copy is kept, so an unreachable source still contributes
+# its previous elements. Entries are merged by NORAD id; newest epoch wins.
+TLE_SOURCES_DIR = os.path.join(BASE_DIR, "_tle_sources")
+TLE_SOURCES_META = os.path.join(TLE_SOURCES_DIR, "meta.json")
+TLE_FETCH_TIMEOUT = 8
+TLE_FETCH_RETRIES = 3
+TLE_FETCH_WORKERS = 4
+_tle_http = {"session": None}
+_tle_http_lock = threading.Lock()
+
+def tle_sources(value=None):
+    return [s for s in re.split(r"[,\s]+", TLE_URL if value is None else value) if s]
+
+def tle_session():
+    # one keep-alive pool for every source, retries with backoff on 429/5xx
+    with _tle_http_lock:
+        if _tle_http["session"] is None:
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            retry = Retry(total=TLE_FETCH_RETRIES, backoff_factor=0.5,
+                          status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset(["GET"]))
+            adapter = HTTPAdapter(pool_connections=TLE_FETCH_WORKERS, pool_maxsize=TLE_FETCH_WORKERS,
+                                  max_retries=retry)
+            sess = requests.Session()
+            sess.mount("http://", adapter)
+            sess.mount("https://", adapter)
+            _tle_http["session"] = sess
+        return _tle_http["session"]
+
+# Checksum digit per character: digits count their value, '-' counts 1.
+_TLE_CKSUM = bytes((c - 48) if 48 <= c <= 57 else (1 if c == 45 else 0) for c in range(256))
+_ALPHA5 = "ABCDEFGHJKLMNPQRSTUVWXYZ"
+
+def tle_checksum_ok(line: str) -> bool:
+    if len(line) < 69 or not line[68].isdigit():
+        return False
+    return sum(line[:68].encode("ascii", "replace").translate(_TLE_CKSUM)) % 10 == ord(line[68]) - 48
+
+def tle_checksum(line68: str) -> str:
+    return line68 + str(sum(line68.encode("ascii", "replace").translate(_TLE_CKSUM)) % 10)
+
+def tle_epoch(l1: str) -> float:
+    # YYDDD.DDDDDDDD as year*1000 + day, so epochs compare as plain floats
+    yy = int(l1[18:20])
+    return (1900 + yy if yy >= 57 else 2000 + yy) * 1000 + float(l1[20:32])
+
+def norad_int(norad: str) -> int:
+    # Alpha-5 ("A0001" = 100001) for catalogue numbers past 99999
+    norad = norad.strip()
+    if norad[:1].isalpha():
+        return (_ALPHA5.index(norad[0].upper()) + 10) * 10000 + int(norad[1:])
+    return int(norad)
+
+def _tle_record(name, l1, l2):
+    # (name, norad, epoch, l1, l2) or None when the pair is not valid
+    l1, l2 = l1[:69], l2[:69]
+    if not (tle_checksum_ok(l1) and tle_checksum_ok(l2)) or l1[2:7] != l2[2:7]:
+        return None
+    try:
+        norad = l1[2:7].strip()
+        return (name or norad, norad, tle_epoch(l1), l1, l2)
+    except ValueError:
+        return None
+
+def _iter_tle_lines(lines):
+    # 3LE (name, "0 name" or none at all = 2LE) one line at a time; a broken
+    # entry is dropped without shifting the entries after it
+    name = l1 = None
+    for raw in lines:
+        ln = raw.rstrip()
+        if l1 is not None:
+            if ln.startswith("2 "):
+                rec = _tle_record(name, l1, ln)
+                if rec:
+                    yield rec
+                name = l1 = None
+                continue
+            l1 = None
+        if ln.startswith("1 ") and len(ln) >= 69:
+            l1 = ln
+            continue
+        s = ln.strip()
+        if s:
+            name = s[2:].strip() if s.startswith("0 ") else s
+
+def _tle_exp(x: float) -> str:
+    # TLE "assumed decimal point" exponent field: 0.12345e-4 -> " 12345-4"
+    if not x:
+        return " 00000-0"
+    e = math.floor(math.log10(abs(x))) + 1
+    mant = round(abs(x) / 10 ** e * 1e5)
+    if mant >= 100000:
+        mant, e = mant // 10, e + 1
+    return ("-" if x < 0 else " ") + f"{mant:05d}" + ("-" if e < 0 else "+") + str(abs(e))[:1]
+
+def _omm_record(r):
+    # CelesTrak OMM (JSON object or CSV row) -> TLE lines, so everything
+    # downstream keeps working with line pairs
+    try:
+        v = r.get
+        num = int(float(v("NORAD_CAT_ID")))
+        norad = _ALPHA5[num // 10000 - 10] + f"{num % 10000:04d}" if num > 99999 else f"{num:05d}"
+        ep = datetime.fromisoformat(str(v("EPOCH")).rstrip("Z"))
+        day = ep.timetuple().tm_yday + (ep.hour * 3600 + ep.minute * 60 + ep.second + ep.microsecond / 1e6) / 86400
+        oid = str(v("OBJECT_ID") or "")
+        intl = oid[2:4] + oid[5:] if len(oid) > 5 and oid[4] == "-" else oid
+        ndot = float(v("MEAN_MOTION_DOT") or 0)
+        l1 = tle_checksum("1 %s%s %-8.8s %02d%012.8f %s%s %s %s %d %4d" % (
+            norad, str(v("CLASSIFICATION_TYPE") or "U")[0], intl, ep.year % 100, day,
+            "-" if ndot < 0 else " ", ("%.8f" % abs(ndot))[1:], _tle_exp(float(v("MEAN_MOTION_DDOT") or 0)),
+            _tle_exp(float(v("BSTAR") or 0)), int(float(v("EPHEMERIS_TYPE") or 0)),
+            int(float(v("ELEMENT_SET_NO") or 0)) % 10000))
+        l2 = tle_checksum("2 %s %8.4f %8.4f %07d %8.4f %8.4f %11.8f%5d" % (
+            norad, float(v("INCLINATION")), float(v("RA_OF_ASC_NODE")),
+            min(9999999, round(float(v("ECCENTRICITY")) * 1e7)), float(v("ARG_OF_PERICENTER")),
+            float(v("MEAN_ANOMALY")), float(v("MEAN_MOTION")), int(float(v("REV_AT_EPOCH") or 0)) % 100000))
+        # built with valid checksums, no need to run them through _tle_record
+        return (str(v("OBJECT_NAME") or "").strip() or norad, norad, ep.year * 1000 + round(day, 8), l1, l2)
+    except Exception:
+        return None
+
+def iter_elements(f):
+    # streams 3LE/2LE text, OMM JSON or OMM CSV (detected from the first
+    # non-blank line) and yields (name, norad, epoch, l1, l2)
+    head = []
+    for ln in f:
+        head.append(ln)
+        if ln.strip():
+            break
+    first = head[-1].lstrip() if head else ""
+    rest = chain(head, f)
+    if first[:1] in ("[", "{"):
+        data = json.loads("".join(rest))
+        recs = (_omm_record(r) for r in (data if isinstance(data, list) else [data]) if isinstance(r, dict))
+    elif "NORAD_CAT_ID" in first.upper() and "," in first:
+        recs = (_omm_record(r) for r in csv.DictReader(rest))
+    else:
+        recs = _iter_tle_lines(rest)
+    for rec in recs:
+        if rec:
+            yield rec
+
+def parse_elements(text: str):
+    return list(iter_elements(io.StringIO(text)))
+
+def _tle_cache_path(src: str) -> str:
+    return os.path.join(TLE_SOURCES_DIR, hashlib.sha1(src.encode("utf-8")).hexdigest()[:16] + ".txt")
+
+def fetch_tle_source(src: str, meta: dict):
+    # (entries, status); status is fresh / not-modified / local / cached / failed
+    path = _tle_cache_path(src)
+    try:
+        if not re.match(r"^https?://", src, re.I):
+            local = src[7:] if src.startswith("file://") else src
+            local = local if os.path.isabs(local) else os.path.join(BASE_DIR, local)
+            with open(local, "r", encoding="utf-8", errors="replace") as f:
+                entries = parse_elements(f.read())
+            if not entries:
+                raise ValueError("no valid TLE")
+            return entries, "local"
+
+        headers = {}
+        m = meta.get(src) or {}
+        if os.path.exists(path):
+            if m.get("etag"):
+                headers["If-None-Match"] = m["etag"]
+            if m.get("modified"):
+                headers["If-Modified-Since"] = m["modified"]
+        r = tle_session().get(src, headers=headers, timeout=TLE_FETCH_TIMEOUT)
+        if r.status_code == 304:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                return parse_elements(f.read()), "not-modified"
+        r.raise_for_status()
+        entries = parse_elements(r.text)
+        if not entries:
+            raise ValueError("no valid TLE in response")
+        os.makedirs(TLE_SOURCES_DIR, exist_ok=True)
+        atomic_write_text(path, r.text)
+        meta[src] = {"etag": r.headers.get("ETag"), "modified": r.headers.get("Last-Modified"),
+                     "fetched": time.time(), "objects": len(entries)}
+        return entries, "fresh"
+    except Exception as e:
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                return parse_elements(f.read()), f"cached ({type(e).__name__})"
+        except OSError:
+            return [], f"failed ({type(e).__name__}: {str(e)[:80]})"
+
+def merge_tle(entry_lists):
+    # one entry per NORAD id, the newest epoch wins; first-seen order and the
+    # first real name are kept so laikai.txt selections keep matching
+    best = {}
+    for entries in entry_lists:
+        for e in entries:
+            cur = best.get(e[1])
+            if cur is None:
+                best[e[1]] = e
+                continue
+            name = cur[0] if cur[0] != cur[1] else e[0]
+            best[e[1]] = (name,) + (e[1:] if e[2] > cur[2] else cur[1:])
+    return list(best.values())
+
 def atsisiusti_tle():
     if SETTINGS.get("USE_MANUAL_TLE"):
         print("USE_MANUAL_TLE=1 -> using local tle.txt (skip download).")
         if not os.path.exists(TLE_FILENAME):
             print("Local tle.txt not found.")
         return
+    from concurrent.futures import ThreadPoolExecutor
+
+    sources = tle_sources()
     try:
-        r = requests.get(TLE_URL, timeout=8)
-        r.raise_for_status()
-        with open(TLE_FILENAME, "w", encoding="utf-8") as f:
-            f.write(r.text)
-        print("TLE downloaded.")
+        with open(TLE_SOURCES_META, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except Exception:
+        meta = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(TLE_FETCH_WORKERS, len(sources)))) as ex:
+        results = list(ex.map(lambda src: fetch_tle_source(src, meta), sources))
+    for src, (entries, status) in zip(sources, results):
+        print(f"[TLE] {src}: {status}, {len(entries)} objects")
+
+    merged = merge_tle([entries for entries, _ in results if entries])
+    if not merged:
+        # a scheduled refresh keeps the old file; main() decides whether to exit
+        print("Failed to download TLE: no usable source.")
+        return False
+    text = "".join(f"{name}\n{l1}\n{l2}\n" for name, _, _, l1, l2 in merged)
+    try:
+        with open(TLE_FILENAME, "r", encoding="utf-8", errors="replace") as f:
+            unchanged = f.read() == text
+    except OSError:
+        unchanged = False
+    try:
+        if not unchanged:
+            atomic_write_text(TLE_FILENAME, text)
+        os.makedirs(TLE_SOURCES_DIR, exist_ok=True)
+        atomic_write_text(TLE_SOURCES_META, json.dumps(meta, indent=1))
     except Exception as e:
-        print("Failed to download TLE:", e)
-        if not os.path.exists(TLE_FILENAME):
-            print("No local TLE file. Exiting.")
-            sys.exit(1)
+        print("Failed to write TLE:", e)
+        return False
+    print(f"TLE {'unchanged' if unchanged else 'updated'}: {len(merged)} objects from {len(sources)} source(s).")
+    return True
+
+# tle.txt is loaded once per change into parallel arrays (one fixed-width
+# 138-byte slot per object for both lines) instead of a dict per satellite.
+class TleCatalog:
+    REC = 138
+
+    def __init__(self):
+        self.names = []
+        self.norad = array("l")
+        self.epoch = array("d")
+        self.lines = bytearray()
+        self.by_name = {}
+        self.by_norad = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, norad, epoch, l1, l2):
+        row = len(self.names)
+        self.names.append(name)
+        n = norad_int(norad)
+        self.norad.append(n)
+        self.epoch.append(epoch)
+        self.lines += (l1.ljust(69) + l2.ljust(69)).encode("ascii", "replace")
+        self.by_name.setdefault(name, row)
+        self.by_norad.setdefault(n, row)
+
+    def find(self, key: str):
+        # row for a name, else for a NORAD id (2LE entries are named by it)
+        row = self.by_name.get(key)
+        if row is None and key.strip().isalnum():
+            try:
+                row = self.by_norad.get(norad_int(key))
+            except (ValueError, IndexError):
+                pass
+        return row
+
+    def tle(self, row: int):
+        rec = self.lines[row * self.REC:(row + 1) * self.REC].decode("ascii")
+        return rec[:69].rstrip(), rec[69:].rstrip()
+
+_tle_catalog = {"sig": None, "cat": TleCatalog()}
+_tle_catalog_lock = threading.Lock()
+
+def tle_catalog() -> TleCatalog:
+    try:
+        st = os.stat(TLE_FILENAME)
+        sig = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        sig = None
+    with _tle_catalog_lock:
+        if sig != _tle_catalog["sig"]:
+            cat = TleCatalog()
+            if sig is not None:
+                t0 = time.perf_counter()
+                with open(TLE_FILENAME, "r", encoding="utf-8", errors="replace") as f:
+                    for rec in iter_elements(f):
+                        cat.add(*rec)
+                print(f"[TLE] catalog: {len(cat)} objects in {time.perf_counter() - t0:.3f}s")
+            _tle_catalog.update(sig=sig, cat=cat)
+        return _tle_catalog["cat"]
 
 def read_tle_names():
-    names = []
-    if not os.path.isfile(TLE_FILENAME):
-        return names
-    with open(TLE_FILENAME, "r", encoding="utf-8", errors="replace") as f:
-        lines = [line.strip() for line in f if line.strip()]
-    for i in range(0, len(lines), 3):
-        names.append(lines[i])
-    return names
+    return list(tle_catalog().names)
+
+# ---- TLE search ----
+# Built once per catalog: normalized names sorted for bisect prefix queries
+# (whole name and each word), trigram postings for fuzzy matches, and sorted
+# international designators. Answers are cached per query.
+TLE_SEARCH_LIMIT = 200
+TLE_SEARCH_CACHE = 256
+TLE_FUZZY_MIN = 0.3
+_NAME_NORM_RE = re.compile(r"[^0-9A-Z]+")
+_INTL_Q_RE = re.compile(r"^(?:19|20)?(\d{2})-?(\d{3})([A-Z]{0,3})$")
+
+def norm_name(s: str) -> str:
+    return _NAME_NORM_RE.sub(" ", s.upper()).strip()
+
+def _trigrams(s: str):
+    s = f"  {s} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+class TleIndex:
+    def __init__(self, cat: TleCatalog):
+        self.cat = cat
+        self.norm = [norm_name(n) for n in cat.names]
+        self.full, self.words, self.intl = [], [], []
+        grams, ngrams = {}, []
+        for row, n in enumerate(self.norm):
+            self.full.append((n, row))
+            pos = n.find(" ")
+            while pos >= 0:
+                self.words.append((n[pos + 1:], row))
+                pos = n.find(" ", pos + 1)
+            tg = _trigrams(n)
+            ngrams.append(len(tg))
+            for g in tg:
+                grams.setdefault(g, []).append(row)
+            off = row * TleCatalog.REC
+            intl = cat.lines[off + 9:off + 17].decode("ascii").strip()
+            if intl:
+                self.intl.append((intl, row))
+        self.full.sort()
+        self.words.sort()
+        self.intl.sort()
+        # postings as int arrays so fuzzy scoring is one bincount
+        self.grams = {g: np.array(rows, dtype=np.int32) for g, rows in grams.items()}
+        self.ngrams = np.array(ngrams, dtype=np.float64)
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _prefix(arr, q, cap):
+        i = bisect_left(arr, (q,))
+        while i < len(arr) and cap > 0 and arr[i][0].startswith(q):
+            yield arr[i]
+            i += 1
+            cap -= 1
+
+    def search(self, q: str, limit: int = TLE_SEARCH_LIMIT):
+        key = (norm_name(q), limit)
+        with self.lock:
+            hit = self.cache.get(key)
+            if hit is not None:
+                self.cache.move_to_end(key)
+                return hit
+        res = self._search(key[0], limit)
+        with self.lock:
+            self.cache[key] = res
+            while len(self.cache) > TLE_SEARCH_CACHE:
+                self.cache.popitem(last=False)
+        return res
+
+    def _search(self, nq, limit):
+        # rank 0 exact name / NORAD / designator, 1 name prefix, 2 word prefix, 3 fuzzy
+        cat = self.cat
+        if not nq:
+            return [self._item(row) for row in range(min(limit, len(cat)))]
+        ranked = {}
+
+        def hit(row, rank, tie):
+            cur = ranked.get(row)
+            if cur is None or (rank, tie) < cur:
+                ranked[row] = (rank, tie)
+
+        compact = nq.replace(" ", "")
+        if len(compact) <= 9 and compact.isalnum():
+            try:
+                row = cat.by_norad.get(norad_int(compact))
+                if row is not None:
+                    hit(row, 0, 0)
+            except (ValueError, IndexError):
+                pass
+        m = _INTL_Q_RE.match(compact)
+        if m:
+            for intl, row in self._prefix(self.intl, "".join(m.groups()), limit):
+                hit(row, 0 if len(intl) == len(m.group(0)) else 1, len(intl))
+
+        for name, row in self._prefix(self.full, nq, limit):
+            hit(row, 0 if name == nq else 1, len(name))
+        for name, row in self._prefix(self.words, nq, limit):
+            hit(row, 2, len(self.norm[row]))
+
+        if len(ranked) < limit and len(nq) >= 3:
+            qg = _trigrams(nq)
+            lists = [self.grams[g] for g in qg if g in self.grams]
+            if lists:
+                counts = np.bincount(np.concatenate(lists), minlength=len(self.norm))
+                score = counts / (len(qg) + self.ngrams - counts)
+                cand = np.flatnonzero(score >= TLE_FUZZY_MIN)
+                if len(cand) > limit:
+                    cand = cand[np.argsort(-score[cand], kind="stable")[:limit]]
+                for row in cand.tolist():
+                    hit(row, 3, -float(score[row]))
+
+        rows = sorted(ranked, key=lambda r: (ranked[r], self.norm[r]))[:limit]
+        return [self._item(row) for row in rows]
+
+    def _item(self, row):
+        off = row * TleCatalog.REC
+        return {"name": self.cat.names[row], "norad": self.cat.lines[off + 2:off + 7].decode("ascii").strip(),
+                "intl": self.cat.lines[off + 9:off + 17].decode("ascii").strip()}
+
+_tle_index = {"index": None}
+_tle_index_lock = threading.Lock()
+
+def tle_index() -> TleIndex:
+    cat = tle_catalog()
+    with _tle_index_lock:
+        idx = _tle_index["index"]
+        if idx is None or idx.cat is not cat:
+            t0 = time.perf_counter()
+            idx = TleIndex(cat)
+            _tle_index["index"] = idx
+            if len(cat):
+                print(f"[TLE] search index: {len(cat)} objects in {time.perf_counter() - t0:.3f}s")
+        return idx
 
 def laikai_read_list():
     lst = []
@@ -491,51 +1110,168 @@ def pasirinkti_palydovus():
             sys.exit()
 
 def gauti_tle(pav):
-    with open(TLE_FILENAME, "r", encoding="utf-8", errors="replace") as f:
-        lines = [line.strip() for line in f if line.strip()]
-    for i in range(0, len(lines), 3):
-        if lines[i] == pav:
-            return lines[i+1], lines[i+2]
-    return None, None
+    cat = tle_catalog()
+    row = cat.find(pav)
+    return cat.tle(row) if row is not None else (None, None)
+
+# ---- Horizon mask ----
+# horizontas.txt holds "azimuth elevation" pairs in degrees, one per line
+# ('#' starts a comment). The mask is interpolated linearly between points,
+# wrapping at north, and passes are cut to the part that clears both the
+# mask and ALTITUDE_LIMIT. Without the file nothing changes.
+HORIZON_FILENAME = os.path.join(BASE_DIR, "horizontas.txt")
+HORIZON_STEP = 10         # seconds between samples when clipping a pass
+HORIZON_MERGE_GAP = 120   # blockages shorter than this do not split a pass
+HORIZON_MIN_PASS = 60     # visible windows shorter than this are dropped
+_horizon = {"sig": None, "mask": None}
+_horizon_lock = threading.Lock()
+
+def horizon_mask():
+    # (azimuths, elevations) as arrays sorted by azimuth, or None
+    try:
+        st = os.stat(HORIZON_FILENAME)
+        sig = [st.st_mtime_ns, st.st_size]
+    except OSError:
+        sig = None
+    with _horizon_lock:
+        if sig != _horizon["sig"]:
+            pts = []
+            if sig:
+                try:
+                    with open(HORIZON_FILENAME, "r", encoding="utf-8", errors="replace") as f:
+                        for line in f:
+                            parts = line.split("#", 1)[0].replace(",", " ").split()
+                            if len(parts) >= 2:
+                                try:
+                                    pts.append((float(parts[0]) % 360.0, float(parts[1])))
+                                except ValueError:
+                                    pass
+                except Exception as e:
+                    print("[HORIZON] read error:", e)
+            mask = None
+            if pts:
+                pts.sort()
+                mask = (np.array([p[0] for p in pts]), np.array([p[1] for p in pts]))
+                print(f"[HORIZON] {len(pts)} points, {mask[1].min():.1f}..{mask[1].max():.1f} deg")
+            _horizon.update(sig=sig, mask=mask)
+        return _horizon["mask"]
+
+def horizon_sig():
+    # changes whenever the mask file does; stored with the plan cache
+    horizon_mask()
+    return _horizon["sig"]
+
+def horizon_at(az_deg, mask):
+    return np.interp(np.asarray(az_deg, dtype=float) % 360.0, mask[0], mask[1], period=360.0)
+
+def _visible_segments(jd, margin):
+    # [(jd_start, jd_end)] where margin >= 0; crossings interpolated linearly
+    vis = margin >= 0
+    if not vis.any():
+        return []
+    segs, cur = [], (jd[0] if vis[0] else None)
+    for i in np.flatnonzero(np.diff(vis.astype(np.int8))):
+        x = jd[i] + (jd[i + 1] - jd[i]) * margin[i] / (margin[i] - margin[i + 1])
+        if vis[i]:
+            segs.append([cur, x])
+            cur = None
+        else:
+            cur = x
+    if cur is not None:
+        segs.append([cur, jd[-1]])
+    merged = [segs[0]]
+    for a, b in segs[1:]:
+        if (a - merged[-1][1]) * 86400 < HORIZON_MERGE_GAP:
+            merged[-1][1] = b
+        else:
+            merged.append([a, b])
+    return [(a, b) for a, b in merged if (b - a) * 86400 >= HORIZON_MIN_PASS]
+
+def _clip_to_horizon(sat, ts, vieta, pav, windows, mask, floor):
+    # windows: (rise, culmination, set) against the lowest possible cutoff;
+    # one vectorized propagation for all of them, then per-window clipping
+    jds = [np.linspace(tr.tt, te.tt, max(2, int((te.tt - tr.tt) * 86400 / HORIZON_STEP) + 2))
+           for tr, tc, te in windows]
+    alt, az, _ = (sat - vieta).at(ts.tt_jd(np.concatenate(jds))).altaz()
+    alt = alt.degrees
+    margin = alt - np.maximum(floor, horizon_at(az.degrees, mask))
+    out = []
+    start = 0
+    for (tr, tc, te), jd in zip(windows, jds):
+        sl = slice(start, start + len(jd))
+        start += len(jd)
+        for a, b in _visible_segments(jd, margin[sl]):
+            if a <= tc.tt <= b:
+                tcs = tc
+                max_elev = float((sat - vieta).at(tc).altaz()[0].degrees)
+            else:
+                inside = np.flatnonzero((jd >= a) & (jd <= b))
+                k = inside[int(np.argmax(alt[sl][inside]))] if len(inside) else 0
+                tcs, max_elev = ts.tt_jd(jd[k]), float(alt[sl][k])
+            out.append((ts.tt_jd(a), ts.tt_jd(b), pav, sat, tcs, max_elev))
+    return out
+
+PASS_LOOKBACK = timedelta(minutes=30)  # longer than any LEO pass
 
 def rasti_langus(sat: EarthSatellite, ts, vieta, pav):
-    t0 = ts.from_datetime(now_utc())
-    t1 = ts.from_datetime(now_utc() + timedelta(hours=24))
-    t, e = sat.find_events(vieta, t0, t1, altitude_degrees=ALTITUDE_LIMIT)
-    out = []
+    # search from a bit in the past so a pass already above the horizon keeps
+    # its real rise time (and pass id) instead of being dropped
+    now = now_utc()
+    t0 = ts.from_datetime(now - PASS_LOOKBACK)
+    t1 = ts.from_datetime(now + timedelta(hours=24))
+    floor = CONFIG.altitude_limit
+    mask = horizon_mask()
+    # with a mask, find candidates against its lowest point and clip them below
+    cutoff = max(floor, float(mask[1].min())) if mask is not None else floor
+    t, e = sat.find_events(vieta, t0, t1, altitude_degrees=cutoff)
+    windows = []
     i = 0
     while i + 2 < len(e):
         if e[i] == 0 and e[i+1] == 1 and e[i+2] == 2:
-            tr, tc, te = t[i], t[i+1], t[i+2]
-            alt_c, _, _ = (sat - vieta).at(tc).altaz()
-            max_elev = float(alt_c.degrees)
-            out.append((tr, te, pav, sat, tc, max_elev))
+            if t[i+2].utc_datetime() > now:
+                windows.append((t[i], t[i+1], t[i+2]))
             i += 3
         else:
             i += 1
+
+    if mask is not None:
+        return [p for p in _clip_to_horizon(sat, ts, vieta, pav, windows, mask, floor)
+                if p[1].utc_datetime() > now]
+    out = []
+    for tr, tc, te in windows:
+        alt_c, _, _ = (sat - vieta).at(tc).altaz()
+        out.append((tr, te, pav, sat, tc, float(alt_c.degrees)))
     return out
 
 # ---------------- SatDump ----------------
 def _satdump_name(pav: str) -> str:
     return SATDUMP_ALIASES.get(pav, pav)
 
+def _satdump_cmd(name: str, outdir: str):
+    cfg = CONFIG
+    cmd = [
+        "satdump", "--no-gui", "--auto",
+        "--source", cfg.satdump_source,
+        "--satellite", name,
+        SATDUMP_RATE_ARG, str(cfg.satdump_rate),
+        "-o", outdir
+    ]
+    if cfg.satdump_device_args:
+        cmd += ["--device-args", cfg.satdump_device_args]
+    return cmd
+
 def satdump_start(pav: str, outdir: str):
     os.makedirs(outdir, exist_ok=True)
     name = _satdump_name(pav)
     try:
-        cmd = [
-            "satdump", "--no-gui", "--auto",
-            "--source", SATDUMP_SOURCE,
-            "--satellite", name,
-            SATDUMP_RATE_ARG, str(SATDUMP_RATE),
-            "-o", outdir
-        ]
-        if SATDUMP_DEVICE_ARGS:
-            cmd += ["--device-args", SATDUMP_DEVICE_ARGS]
+        cmd = _satdump_cmd(name, outdir)
         print("SatDump START:", " ".join(cmd))
-        return subprocess.Popen(cmd)
+        proc = subprocess.Popen(cmd)
+        LIVE.publish("satdump", state="running", mode="start", pid=proc.pid, satellite=name)
+        return proc
     except FileNotFoundError:
         print("SatDump not found.")
+        LIVE.publish("satdump", state="missing", mode="start", satellite=name)
         return None
     except Exception as e:
         print("SatDump start error:", e)
@@ -548,22 +1284,25 @@ def dekoduoti_satdump(pav, t1, t2, outdir: str):
     name = _satdump_name(pav)
     print(f"SatDump END {name} ~{timeout}s -> {outdir}")
     try:
-        cmd = [
-            "satdump", "--no-gui", "--auto",
-            "--source", SATDUMP_SOURCE,
-            "--satellite", name,
-            SATDUMP_RATE_ARG, str(SATDUMP_RATE),
-            "-o", outdir
-        ]
-        if SATDUMP_DEVICE_ARGS:
-            cmd += ["--device-args", SATDUMP_DEVICE_ARGS]
-        subprocess.run(cmd, timeout=timeout)
+        cmd = _satdump_cmd(name, outdir)
+        LIVE.publish("satdump", state="running", mode="end", satellite=name, timeout=timeout)
+        rc = subprocess.run(cmd, timeout=timeout).returncode
+        LIVE.publish("satdump", state="stopped", mode="end", satellite=name, returncode=rc)
     except subprocess.TimeoutExpired:
         print("SatDump finished by timeout.")
+        LIVE.publish("satdump", state="stopped", mode="end", satellite=name, returncode=None)
     except FileNotFoundError:
         print("SatDump not found.")
+        LIVE.publish("satdump", state="missing", mode="end", satellite=name)
     except Exception as e:
         print("SatDump error:", e)
+        LIVE.publish("satdump", state="error", mode="end", satellite=name, error=str(e))
+
+def _on_satdump_settings(old, new):
+    print("[CONFIG] SatDump settings take effect from the next SatDump start")
+
+subscribe_config(_on_satdump_settings, "SATDUMP_SOURCE", "SATDUMP_RATE", "SATDUMP_DEVICE_ARGS",
+                 "SATDUMP_MODE", "SATDUMP_LEAD", "SATDUMP_TAIL")
 
 def satdump_stop(proc):
     if not proc:
@@ -575,80 +1314,442 @@ def satdump_stop(proc):
     except Exception:
         try: proc.kill()
         except Exception: pass
+    LIVE.publish("satdump", state="stopped", mode="start", pid=proc.pid, returncode=proc.poll())
 
 # ---------------- Thumbs ----------------
 VALID_EXTS = {".png", ".jpg", ".jpeg"}
+DERIVED_DIRS = {"_thumbs", "_derivs", "_tiles"}
+THUMB_MANIFEST = "manifest.json"
+THUMB_POOL_TIMEOUT = 600  # s, whole pass
+DERIV_INDEX = "index.json"
+REDUCE_MODES = {"L", "LA", "RGB", "RGBA", "I", "F"}
+
+def _fit(im, box, tw, th):
+    # cheap box-reduce of the region first, LANCZOS only for the last step
+    bw, bh = box[2] - box[0], box[3] - box[1]
+    factor = min(bw // (tw * 2), bh // (th * 2))
+    if factor > 1:
+        if im.mode not in REDUCE_MODES:
+            im = im.convert("RGB")
+        im = im.reduce(factor, box=box)
+    elif box != (0, 0) + im.size:
+        im = im.crop(box)
+    return im.resize((tw, th), Image.LANCZOS)
+
+def _square_thumb(im, size):
+    w, h = im.size
+    side = min(w, h)
+    left = (w - side) // 2
+    top = (h - side) // 2
+    return _fit(im, (left, top, left + side, top + side), size, size)
+
+def _make_derivatives(src: str, thumb_dst: str, deriv_dir: str, size=THUMB_SIZE, fn=None):
+    # decode once: square gallery thumb + every DERIV_SIZES variant
+    ext = deriv_ext()
+    if not ext:
+        return None
+    fn = fn or os.path.basename(src)
+    try:
+        with Image.open(src) as im:
+            src_size = list(im.size)
+            im.draft("RGB", (max(DERIV_SIZES.values()),) * 2)
+            im.load()
+            os.makedirs(os.path.dirname(thumb_dst), exist_ok=True)
+            _square_thumb(im, size).save(thumb_dst)
+
+            if im.mode not in ("RGB", "L"):
+                im = im.convert("RGB")
+            dims = {}
+            cur = im
+            for variant, edge in sorted(DERIV_SIZES.items(), key=lambda kv: -kv[1]):
+                w, h = cur.size
+                if max(w, h) > edge:
+                    k = edge / max(w, h)
+                    cur = _fit(cur, (0, 0, w, h), max(1, round(w * k)), max(1, round(h * k)))
+                out = os.path.join(deriv_dir, variant, f"{fn}.{ext}")
+                os.makedirs(os.path.dirname(out), exist_ok=True)
+                if ext == "webp":
+                    cur.save(out, "WEBP", quality=DERIV_QUALITY, method=4)
+                else:
+                    cur.save(out, "JPEG", quality=DERIV_QUALITY, optimize=True, progressive=True)
+                dims[variant] = list(cur.size)
+            dims["ext"] = ext
+            dims["src"] = src_size
+            return dims
+    except Exception as e:
+        print("Derivative error:", src, e)
+        return None
 
-def _make_thumb(src: str, dst: str, size=THUMB_SIZE):
-    os.makedirs(os.path.dirname(dst), exist_ok=True)
-    if PIL_OK:
-        try:
-            with Image.open(src) as im:
-                w, h = im.size
-                if w != h:
-                    side = min(w, h)
-                    left = (w - side) // 2
-                    top = (h - side) // 2
-                    im = im.crop((left, top, left + side, top + side))
-                im = im.resize((size, size), Image.LANCZOS)
-                im.save(dst)
-                return
-        except Exception as e:
-            print("Thumb error:", src, e)
+def _make_tiles(src: str, tiles_dir: str, fn=None):
+    fn = fn or os.path.basename(src)
+    ext = deriv_ext() or "jpg"
+    files_dir = os.path.join(tiles_dir, f"{fn}_files")
+    dzi_path = os.path.join(tiles_dir, f"{fn}.dzi")
+    try:
+        with Image.open(src) as im:
+            im.load()
+            if im.mode not in ("RGB", "L"):
+                im = im.convert("RGB")
+            w, h = im.size
+            max_level = max(0, math.ceil(math.log2(max(w, h))))
+            if os.path.isdir(files_dir):
+                shutil.rmtree(files_dir)
+            level_im = im
+            for level in range(max_level, -1, -1):
+                lw, lh = level_im.size
+                d = os.path.join(files_dir, str(level))
+                os.makedirs(d, exist_ok=True)
+                for row, y in enumerate(range(0, lh, TILE_SIZE)):
+                    for col, x in enumerate(range(0, lw, TILE_SIZE)):
+                        tile = level_im.crop((x, y, min(x + TILE_SIZE, lw), min(y + TILE_SIZE, lh)))
+                        out = os.path.join(d, f"{col}_{row}.{ext}")
+                        if ext == "webp":
+                            tile.save(out, "WEBP", quality=DERIV_QUALITY, method=2)
+                        else:
+                            tile.save(out, "JPEG", quality=DERIV_QUALITY)
+                if level:
+                    level_im = level_im.reduce(2)
+        # the .dzi descriptor is written last and marks the pyramid complete
+        with open(dzi_path, "w", encoding="utf-8") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>'
+                    f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{TILE_SIZE}" Overlap="0" Format="{ext}">'
+                    f'<Size Width="{w}" Height="{h}"/></Image>')
+        return [w, h]
+    except Exception as e:
+        print("Tile error:", src, e)
+        return None
 
-def generate_thumbs_in_place(pass_dir: str):
+def _thumb_job(job):
+    rel, name, src, dst, deriv_dir, size, tiles_dir = job
+    dims = _make_derivatives(src, dst, deriv_dir, size, name)
+    if dims and tiles_dir and max(dims["src"]) > DERIV_SIZES["large"]:
+        dzi = _make_tiles(src, tiles_dir, name)
+        if dzi:
+            dims["dzi"] = dzi
+    return rel, dims
+
+def _deriv_name(rel: str) -> str:
+    # output name under _thumbs/_derivs/_tiles; products in subdirectories
+    # (MSU-MR/ and "MSU-MR (Filled)/" share file names) get a per-directory
+    # prefix so parallel jobs never write the same paths
+    sub, _, fn = rel.rpartition("/")
+    if not sub:
+        return fn
+    return hashlib.sha1(sub.encode("utf-8")).hexdigest()[:8] + "-" + fn
+
+def _iter_pass_images(pass_dir: str, rel=""):
+    try:
+        entries = list(os.scandir(os.path.join(pass_dir, rel) if rel else pass_dir))
+    except OSError:
+        return
+    for e in entries:
+        r = f"{rel}/{e.name}" if rel else e.name
+        if e.is_dir(follow_symlinks=False):
+            if e.name not in DERIVED_DIRS:
+                yield from _iter_pass_images(pass_dir, r)
+        elif os.path.splitext(e.name)[1].lower() in VALID_EXTS:
+            try:
+                st = e.stat()
+            except OSError:
+                continue
+            yield r, e.path, st
+
+def _load_manifest(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            j = json.load(f)
+            return j if isinstance(j, dict) else {}
+    except Exception:
+        return {}
+
+def _save_manifest(path: str, data: dict):
+    try:
+        atomic_write_text(path, json.dumps(data, separators=(",", ":")))
+    except Exception as e:
+        print("[THUMBS] manifest write error:", e)
+
+def generate_thumbs_in_place(pass_dir: str, workers=None):
+    t0 = time.monotonic()
     thumbs_dir = os.path.join(pass_dir, "_thumbs")
     os.makedirs(thumbs_dir, exist_ok=True)
-    for dirpath, _, files in os.walk(pass_dir):
-        if os.path.basename(dirpath) == "_thumbs":
+    deriv_dir = os.path.join(pass_dir, "_derivs")
+    manifest_path = os.path.join(thumbs_dir, THUMB_MANIFEST)
+    manifest = _load_manifest(manifest_path)
+    index_path = os.path.join(deriv_dir, DERIV_INDEX)
+    deriv_index = _load_manifest(index_path)
+    tiles_dir = os.path.join(pass_dir, "_tiles") if TILES_ENABLE else None
+    spec = f"{THUMB_SIZE}:{deriv_ext()}:{DERIV_QUALITY}:" + ",".join(f"{k}={v}" for k, v in sorted(DERIV_SIZES.items()))
+    if tiles_dir:
+        spec += f":dzi{TILE_SIZE}"
+
+    jobs = []; stamps = {}; skipped = 0
+    for rel, src, st in _iter_pass_images(pass_dir):
+        stamp = [st.st_size, st.st_mtime_ns, spec]
+        if manifest.get(rel) == stamp:
+            skipped += 1
             continue
-        for fn in files:
-            ext = os.path.splitext(fn)[1].lower()
-            if ext in VALID_EXTS:
-                src = os.path.join(dirpath, fn)
-                dst = os.path.join(thumbs_dir, fn)
-                if not os.path.exists(dst) or os.path.getmtime(dst) < os.path.getmtime(src):
-                    _make_thumb(src, dst, THUMB_SIZE)
-
-def rasyti_praejo_meta(pass_dir: str, sat: str, t1_local: datetime, t2_local: datetime):
+        stamps[rel] = stamp
+        name = _deriv_name(rel)
+        jobs.append((rel, name, src, os.path.join(thumbs_dir, name), deriv_dir, THUMB_SIZE, tiles_dir))
+
+    made = 0
+    if jobs:
+        workers = workers or min(len(jobs), os.cpu_count() or 1)
+        if workers > 1:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor, wait
+            try:
+                # the daemon has HTTP/serial threads running: fork() could copy a held lock
+                # into the children, so workers come from a clean forkserver process
+                pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+                try:
+                    futs = [pool.submit(_thumb_job, j) for j in jobs]
+                    done, late = wait(futs, timeout=THUMB_POOL_TIMEOUT)
+                    if late:
+                        print(f"[THUMBS] {len(late)} job(s) still running after {THUMB_POOL_TIMEOUT}s, giving up on them")
+                    results = [f.result() if f in done else (j[0], None) for j, f in zip(jobs, futs)]
+                finally:
+                    pool.shutdown(wait=False, cancel_futures=True)
+            except Exception as e:
+                print("[THUMBS] pool error, falling back to serial:", e)
+                results = [_thumb_job(j) for j in jobs]
+        else:
+            results = [_thumb_job(j) for j in jobs]
+        for rel, dims in results:
+            if dims:
+                manifest[rel] = stamps[rel]
+                deriv_index[_deriv_name(rel)] = dims
+                made += 1
+        _save_manifest(manifest_path, manifest)
+        if deriv_index:
+            os.makedirs(deriv_dir, exist_ok=True)
+            _save_manifest(index_path, deriv_index)
+
+    dt = time.monotonic() - t0
+    print(f"[THUMBS] {os.path.basename(pass_dir)}: made={made} skipped={skipped} failed={len(jobs) - made} in {dt:.2f}s")
+    return {"made": made, "skipped": skipped, "failed": len(jobs) - made, "seconds": round(dt, 3)}
+
+def rasyti_praejo_meta(pass_dir: str, sat: str, t1_local: datetime, t2_local: datetime, thumbs=None):
     meta = {
         "satellite": sat,
         "start_local": t1_local.isoformat(timespec="seconds"),
         "end_local": t2_local.isoformat(timespec="seconds"),
         "created_utc": now_utc().isoformat(timespec="seconds"),
     }
+    if thumbs:
+        meta["thumbs"] = thumbs
     with open(os.path.join(pass_dir, "meta.json"), "w", encoding="utf-8") as f:
         json.dump(meta, f, ensure_ascii=False, indent=2)
 
-def nuskaityti_praejimus():
-    out = []
-    if not os.path.isdir(NUOTRAUKU_KATALOGAS):
-        return out
-    for name in sorted(os.listdir(NUOTRAUKU_KATALOGAS), reverse=True):
-        d = os.path.join(NUOTRAUKU_KATALOGAS, name)
-        if not os.path.isdir(d):
-            continue
-        meta_path = os.path.join(d, "meta.json")
-        thumbs = sorted(glob(os.path.join(d, "_thumbs", "*")))
-        images = sorted([p for p in glob(os.path.join(d, "*")) if os.path.splitext(p)[1].lower() in VALID_EXTS])
-        meta = None
-        if os.path.isfile(meta_path):
-            try:
-                with open(meta_path, "r", encoding="utf-8") as f:
-                    meta = json.load(f)
-            except Exception:
-                meta = None
-        out.append({
-            "dir": d, "name": name, "meta": meta,
-            "thumbs": thumbs, "images": images,
-        })
-    def keyfun(item):
-        try:
-            return item["meta"]["start_local"]
-        except Exception:
-            return item["name"]
-    out.sort(key=keyfun, reverse=True)
-    return out
+# ---------------- Gallery index ----------------
+# One SQLite row per pass directory, kept next to the passes. Updated when a
+# pass completes or is deleted; rebuilt with os.scandir at startup.
+GALLERY_DB_NAME = "galerija.sqlite"
+GALLERY_LOCK = threading.Lock()
+_gallery_db = {"path": None, "conn": None}
+
+def _gallery_conn():
+    path = os.path.join(NUOTRAUKU_KATALOGAS, GALLERY_DB_NAME)
+    if _gallery_db["path"] != path:
+        if _gallery_db["conn"] is not None:
+            try: _gallery_db["conn"].close()
+            except Exception: pass
+        os.makedirs(NUOTRAUKU_KATALOGAS, exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS passes("
+            " name TEXT PRIMARY KEY, satellite TEXT, start_local TEXT, sort_key TEXT,"
+            " meta TEXT, thumbs TEXT, images TEXT, derivs TEXT, updated REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS passes_sort ON passes(sort_key DESC, name DESC)")
+        conn.execute("CREATE INDEX IF NOT EXISTS passes_sat ON passes(satellite, sort_key)")
+        conn.commit()
+        _gallery_db["path"] = path
+        _gallery_db["conn"] = conn
+    return _gallery_db["conn"]
+
+def _scan_pass_dir(d: str, name: str):
+    images = []
+    try:
+        with os.scandir(d) as it:
+            for e in it:
+                if e.is_file() and os.path.splitext(e.name)[1].lower() in VALID_EXTS:
+                    images.append(e.name)
+    except OSError:
+        return None
+    thumbs = []
+    try:
+        with os.scandir(os.path.join(d, "_thumbs")) as it:
+            thumbs = [e.name for e in it if os.path.splitext(e.name)[1].lower() in VALID_EXTS]
+    except OSError:
+        pass
+    meta = _load_manifest(os.path.join(d, "meta.json")) or None
+    start_local = (meta or {}).get("start_local") or None
+    sort_key = start_local
+    if not sort_key:
+        try: sort_key = datetime.strptime(name[:13], "%Y%m%d_%H%M").isoformat()
+        except ValueError: sort_key = name
+    return (
+        name,
+        (meta or {}).get("satellite") or name.split("_", 2)[-1],
+        start_local,
+        sort_key,
+        json.dumps(meta, ensure_ascii=False) if meta else None,
+        json.dumps(sorted(thumbs)),
+        json.dumps(sorted(images)),
+        json.dumps(_load_manifest(os.path.join(d, "_derivs", DERIV_INDEX))),
+        time.time(),
+    )
+
+def _keep_unchanged(old, rows):
+    # rows whose content matches the index (old: name -> row) keep their "updated"
+    # stamp, so only passes that really changed get new pass-page ETags
+    out, dirty = [], []
+    for r in rows:
+        prev = old.get(r[0])
+        if prev is not None and tuple(prev[:-1]) == r[:-1]:
+            out.append(tuple(prev))
+        else:
+            out.append(r); dirty.append(r[0])
+    return out, dirty
+
+def gallery_index_update(pass_dir: str):
+    name = os.path.basename(os.path.normpath(pass_dir))
+    row = _scan_pass_dir(pass_dir, name)
+    with GALLERY_LOCK:
+        conn = _gallery_conn()
+        if row is None:
+            dirty = conn.execute("DELETE FROM passes WHERE name=?", (name,)).rowcount
+        else:
+            prev = conn.execute("SELECT * FROM passes WHERE name=?", (name,)).fetchone()
+            (row,), dirty = _keep_unchanged({name: prev} if prev else {}, [row])
+            if dirty:
+                conn.execute("INSERT OR REPLACE INTO passes VALUES (?,?,?,?,?,?,?,?,?)", row)
+        conn.commit()
+    if dirty:
+        bump_state("gallery")
+
+def gallery_index_remove(name: str):
+    with GALLERY_LOCK:
+        conn = _gallery_conn()
+        conn.execute("DELETE FROM passes WHERE name=?", (name,))
+        conn.commit()
+    bump_state("gallery")
+
+def gallery_index_rebuild():
+    t0 = time.monotonic()
+    rows = []
+    try:
+        with os.scandir(NUOTRAUKU_KATALOGAS) as it:
+            dirs = [(e.path, e.name) for e in it if e.is_dir()]
+    except OSError:
+        dirs = []
+    for d, name in dirs:
+        row = _scan_pass_dir(d, name)
+        if row:
+            rows.append(row)
+    with GALLERY_LOCK:
+        conn = _gallery_conn()
+        old = {r[0]: r for r in conn.execute("SELECT * FROM passes")}
+        rows, dirty = _keep_unchanged(old, rows)
+        gone = old.keys() - {r[0] for r in rows}
+        conn.executemany("DELETE FROM passes WHERE name=?", [(n,) for n in gone])
+        dirty = set(dirty)
+        conn.executemany("INSERT OR REPLACE INTO passes VALUES (?,?,?,?,?,?,?,?,?)", [r for r in rows if r[0] in dirty])
+        conn.commit()
+    if dirty or gone:
+        bump_state("gallery")
+    print(f"[GALLERY] index rebuilt: {len(rows)} passes ({len(dirty)} changed) in {time.monotonic() - t0:.2f}s")
+    return len(rows)
+
+def gallery_index_rebuild_async():
+    th = threading.Thread(target=gallery_index_rebuild, daemon=True)
+    th.start()
+    return th
+
+def gallery_index_open():
+    # first start with this output dir -> build synchronously, else reconcile in background
+    fresh = not os.path.isfile(os.path.join(NUOTRAUKU_KATALOGAS, GALLERY_DB_NAME))
+    if fresh:
+        gallery_index_rebuild()
+    else:
+        gallery_index_rebuild_async()
+
+def _gallery_row(r):
+    name, _sat, _start, _key, meta, thumbs, images, derivs, *updated = r
+    d = os.path.join(NUOTRAUKU_KATALOGAS, name)
+    return {
+        "dir": d, "name": name,
+        "meta": json.loads(meta) if meta else None,
+        "thumbs": [os.path.join(d, "_thumbs", fn) for fn in json.loads(thumbs or "[]")],
+        "images": [os.path.join(d, fn) for fn in json.loads(images or "[]")],
+        "derivs": json.loads(derivs or "{}"),
+        "updated": updated[0] if updated else None,
+    }
+
+GALLERY_PAGE_SIZE = 24
+
+def _encode_cursor(sort_key, name):
+    return base64.urlsafe_b64encode(json.dumps([sort_key, name]).encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_key, name = json.loads(raw)
+        return str(sort_key), str(name)
+    except Exception:
+        return None
+
+def gallery_query(cursor=None, limit=GALLERY_PAGE_SIZE, sat=None, date_from=None, date_to=None):
+    # keyset pagination over passes_sort: cost depends on limit, not on gallery size
+    where = ["(thumbs != '[]' OR images != '[]')"]
+    args = []
+    after = _decode_cursor(cursor) if cursor else None
+    if after:
+        where.append("(sort_key < ? OR (sort_key = ? AND name < ?))")
+        args += [after[0], after[0], after[1]]
+    if sat:
+        where.append("satellite = ?")
+        args.append(sat)
+    if date_from:
+        where.append("sort_key >= ?")
+        args.append(date_from)
+    if date_to:
+        where.append("sort_key <= ?")
+        args.append(date_to + "T23:59:59" if len(date_to) == 10 else date_to)
+    limit = max(1, min(int(limit or GALLERY_PAGE_SIZE), 100))
+    with GALLERY_LOCK:
+        rows = _gallery_conn().execute(
+            "SELECT name, satellite, start_local, sort_key, meta, thumbs, images, derivs FROM passes"
+            f" WHERE {' AND '.join(where)} ORDER BY sort_key DESC, name DESC LIMIT ?",
+            args + [limit + 1]).fetchall()
+    nxt = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        nxt = _encode_cursor(rows[-1][3], rows[-1][0])
+    return [_gallery_row(r) for r in rows], nxt
+
+def gallery_satellites():
+    with GALLERY_LOCK:
+        return [r[0] for r in _gallery_conn().execute(
+            "SELECT DISTINCT satellite FROM passes WHERE satellite IS NOT NULL ORDER BY satellite")]
+
+def gallery_get(name: str):
+    with GALLERY_LOCK:
+        r = _gallery_conn().execute(
+            "SELECT name, satellite, start_local, sort_key, meta, thumbs, images, derivs, updated"
+            " FROM passes WHERE name=?", (name,)).fetchone()
+    return _gallery_row(r) if r else None
+
+def nuskaityti_praejimus(limit=None):
+    with GALLERY_LOCK:
+        conn = _gallery_conn()
+        rows = conn.execute(
+            "SELECT name, satellite, start_local, sort_key, meta, thumbs, images, derivs"
+            " FROM passes ORDER BY sort_key DESC, name DESC LIMIT ?",
+            (-1 if limit is None else int(limit),)).fetchall()
+    return [_gallery_row(r) for r in rows]
 
 # ---------------- Gallery cleanup ----------------
 def _pass_datetime_local(pass_dir):
@@ -688,22 +1789,29 @@ def cleanup_gallery(days: int):
     cutoff = to_local_naive(now_utc()) - timedelta(days=days)
     current_id = get_current_pass_id()
     deleted = kept = scanned = skipped_current = 0
-    for name in os.listdir(NUOTRAUKU_KATALOGAS):
+    with GALLERY_LOCK:
+        rows = _gallery_conn().execute("SELECT name, start_local FROM passes").fetchall()
+    for name, start_local in rows:
         d = os.path.join(NUOTRAUKU_KATALOGAS, name)
-        if not os.path.isdir(d):
-            continue
         scanned += 1
         if name == current_id and current_id:
             skipped_current += 1
             kept += 1
             continue
-        dt = _pass_datetime_local(d)
+        dt = None
+        if start_local:
+            try: dt = datetime.fromisoformat(start_local)
+            except Exception: dt = None
+        if dt is None:
+            dt = _pass_datetime_local(d)
         if dt is None:
             kept += 1
             continue
         if dt < cutoff:
             try:
-                shutil.rmtree(d)
+                if os.path.isdir(d):
+                    shutil.rmtree(d)
+                gallery_index_remove(name)
                 deleted += 1
             except Exception as e:
                 print("[CLEANUP] remove error:", d, e)
@@ -714,20 +1822,78 @@ def cleanup_gallery(days: int):
     return {"deleted": deleted, "kept": kept, "scanned": scanned, "skipped_current": skipped_current}
 
 # ---------------- Conflict choices ----------------
-def set_current_pass(pass_id: str):
-    try:
-        with open(CURRENT_JSON, "w", encoding="utf-8") as f:
-            json.dump({"id": pass_id}, f)
-    except Exception as e:
-        print("[ERR] set_current_pass:", e)
+# Selection and current pass live in memory behind one lock; the files are
+# only a persisted copy. Changes mark the store dirty and a single delayed
+# flush writes them (atomically), so a burst of /api/select calls costs one
+# write per file.
+STATE_FLUSH_DELAY = 0.5
+
+class StateStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.io_lock = threading.Lock()
+        self.selected = None
+        self.current = None     # unknown until first set, so the file gets rewritten
+        self.dirty = set()
+        self.timer = None
+
+    def _load(self):
+        # caller holds self.lock
+        if self.selected is None:
+            self.selected = _read_selection_files()
+
+    def selection(self):
+        with self.lock:
+            self._load()
+            return list(self.selected)
+
+    def update_selection(self, fn):
+        # fn(old ids) -> new ids, applied atomically; returns (ids, changed)
+        with self.lock:
+            self._load()
+            ids = list(dict.fromkeys(i.strip() for i in fn(list(self.selected)) if i and i.strip()))
+            changed = ids != self.selected
+            if changed:
+                self.selected = ids
+                self._schedule("selection")
+            return list(ids), changed
+
+    def set_current(self, pass_id):
+        with self.lock:
+            if pass_id != self.current:
+                self.current = pass_id
+                self._schedule("current")
+
+    def _schedule(self, what):
+        # caller holds self.lock
+        self.dirty.add(what)
+        if self.timer is None:
+            self.timer = threading.Timer(STATE_FLUSH_DELAY, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        with self.io_lock:
+            with self.lock:
+                dirty, self.dirty = self.dirty, set()
+                if self.timer is not None and self.timer is not threading.current_thread():
+                    self.timer.cancel()
+                self.timer = None
+                ids, current = list(self.selected or []), self.current
+            try:
+                if "selection" in dirty:
+                    atomic_write_text(SELECTION_JSON, json.dumps({"ids": ids, "updated": now_utc().isoformat()}))
+                    atomic_write_text(SEKIMAS_TXT, "".join(pid + "\n" for pid in ids))
+                if "current" in dirty:
+                    atomic_write_text(CURRENT_JSON, json.dumps({"id": current}))
+            except Exception as e:
+                print("[ERR] state flush:", e)
 
-def save_selected_list_to_file(ids):
-    try:
-        with open(SEKIMAS_TXT, "w", encoding="utf-8") as f:
-            for pid in ids:
-                f.write(pid.strip() + "\n")
-    except Exception as e:
-        print("[ERR] save_selected_list_to_file:", e)
+STATE = StateStore()
+atexit.register(STATE.flush)
+
+def set_current_pass(pass_id: str):
+    STATE.set_current(pass_id)
 
 def load_selected_list_from_file():
     ids = []
@@ -741,7 +1907,7 @@ def load_selected_list_from_file():
         pass
     return ids
 
-def get_selected_ids():
+def _read_selection_files():
     try:
         with open(SELECTION_JSON, "r", encoding="utf-8") as f:
             j = json.load(f)
@@ -753,35 +1919,35 @@ def get_selected_ids():
         pass
     return load_selected_list_from_file()
 
+def get_selected_ids():
+    return STATE.selection()
+
+def _update_selection(fn):
+    ids, changed = STATE.update_selection(fn)
+    if changed:
+        bump_state("selection")
+        print(f"[API] Updated selection: {ids}")
+    return ids
+
 def set_selected_ids(ids):
-    ids = [i.strip() for i in ids if i and i.strip()]
-    ids = list(dict.fromkeys(ids))
-    try:
-        with open(SELECTION_JSON, "w", encoding="utf-8") as f:
-            json.dump({"ids": ids, "updated": now_utc().isoformat()}, f)
-    except Exception as e:
-        print("[ERR] set_selected_ids (json):", e)
-    save_selected_list_to_file(ids)
-    print(f"[API] Updated selection: {ids}")
+    _update_selection(lambda old: ids)
 
 def add_selected_id(pid):
-    ids = set(get_selected_ids())
-    if pid:
-        ids.add(pid)
-    set_selected_ids(sorted(ids))
+    _update_selection(lambda old: sorted(set(old) | ({pid} if pid else set())))
 
 def remove_selected_id(pid):
-    ids = [i for i in get_selected_ids() if i != pid]
-    set_selected_ids(ids)
+    _update_selection(lambda old: [i for i in old if i != pid])
 
 def clear_selected_ids():
     set_selected_ids([])
 
 # ---------------- Planning ----------------
-def compute_passes_next_24h():
+def compute_passes_next_24h(selected=None):
+    cfg = CONFIG
     ts = load.timescale()
-    vieta = wgs84.latlon(latitude_degrees=KOORD_LAT, longitude_degrees=KOORD_LON)
-    selected = laikai_read_list()
+    vieta = wgs84.latlon(latitude_degrees=cfg.lat, longitude_degrees=cfg.lon)
+    if selected is None:
+        selected = laikai_read_list()
 
     all_passes = []
     for name in selected:
@@ -807,26 +1973,794 @@ def build_pass_index(langai):
         }
     return idx
 
+# The scheduler owns one immutable plan. Replan builds a fresh snapshot and
+# swaps it in whole; pages, API handlers and the tracker only read PLAN, so
+# nothing but a replan ever propagates orbits.
+Plan = namedtuple("Plan", "version created ts vieta lat lon passes index tle")
+PLAN = None
+PLAN_LOCK = threading.Lock()
+PLAN_EVENT = threading.Event()  # set on every publish; wakes the daemon loop
+
+def build_plan(selected=None) -> Plan:
+    cfg = CONFIG
+    ts, vieta, all_passes = compute_passes_next_24h(selected)
+    tle = {pav: gauti_tle(pav) for pav in {p[2] for p in all_passes}}
+    return Plan(version=0, created=time.time(), ts=ts, vieta=vieta, lat=cfg.lat, lon=cfg.lon,
+                passes=tuple(all_passes), index=MappingProxyType(build_pass_index(all_passes)),
+                tle=MappingProxyType(tle))
+
+def publish_plan(plan: Plan) -> Plan:
+    global PLAN
+    with PLAN_LOCK:
+        plan = plan._replace(version=PLAN.version + 1 if PLAN else 1)
+        PLAN = plan
+    bump_state("plan")
+    PLAN_EVENT.set()
+    print(f"[PLAN] v{plan.version} published, passes={len(plan.passes)}")
+    try:
+        save_plan_cache(plan)
+    except Exception as e:
+        print("[ERR] plan cache:", e)
+    return plan
+
+def current_plan():
+    # None until the first plan is published
+    return PLAN
+
+# A restart starts from the last published plan (TLE lines + pass times), so
+# the tracker is ready before the TLE download and propagation have finished.
+def save_plan_cache(plan: Plan):
+    ep = lambda t: round(t.utc_datetime().timestamp(), 3)
+    data = {"created": plan.created, "lat": plan.lat, "lon": plan.lon,
+            "altitude_limit": CONFIG.altitude_limit,
+            "selected": sorted(laikai_read_list()), "horizon": horizon_sig(),
+            "tle": {k: list(v) for k, v in plan.tle.items()},
+            "passes": [[pav, ep(t1), ep(t2), ep(tculm), round(float(max_elev), 2)]
+                       for t1, t2, pav, sat, tculm, max_elev in plan.passes]}
+    atomic_write_text(PLAN_CACHE_JSON, json.dumps(data, separators=(",", ":")))
+
+def load_plan_cache():
+    # None when missing, for another place, elevation floor or satellite list,
+    # or already over
+    try:
+        with open(PLAN_CACHE_JSON, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return None
+    cfg = CONFIG
+    now = time.time()
+    if (data.get("lat"), data.get("lon"), data.get("altitude_limit")) != (cfg.lat, cfg.lon, cfg.altitude_limit):
+        return None
+    if sorted(laikai_read_list()) != data.get("selected") or data.get("horizon") != horizon_sig():
+        return None
+    rows = [r for r in data.get("passes") or [] if r[2] > now and r[0] in data.get("tle", {})]
+    if not rows:
+        return None
+
+    ts = load.timescale()
+    vieta = wgs84.latlon(latitude_degrees=cfg.lat, longitude_degrees=cfg.lon)
+    at = lambda x: ts.from_datetime(datetime.fromtimestamp(x, timezone.utc))
+    sats, passes = {}, []
+    for pav, aos, los, tmax, max_elev in rows:
+        if pav not in sats:
+            l1, l2 = data["tle"][pav]
+            sats[pav] = EarthSatellite(l1, l2, pav, ts)
+        passes.append((at(aos), at(los), pav, sats[pav], at(tmax), max_elev))
+    return Plan(version=0, created=float(data.get("created") or 0), ts=ts, vieta=vieta,
+                lat=cfg.lat, lon=cfg.lon, passes=tuple(passes),
+                index=MappingProxyType(build_pass_index(passes)),
+                tle=MappingProxyType({k: tuple(v) for k, v in data["tle"].items()}))
+
 REPLAN_LOCK = threading.Lock()
 
-def replan_and_refresh():
+def replan_and_refresh(job=None):
     with REPLAN_LOCK:
         print("[REPLAN] start")
         if GALLERY_KEEP_DAYS and GALLERY_KEEP_DAYS > 0:
+            job_stage(job, "cleanup")
             cleanup_gallery(GALLERY_KEEP_DAYS)
 
+        job_stage(job, "tle")
         atsisiusti_tle()
-        ts, vieta, all_passes = compute_passes_next_24h()
-        nubraizyti_elevaciju_grafika(all_passes, ts, vieta)
-        atnaujinti_galerija(all_passes, ts, vieta)
-        print(f"[REPLAN] done. passes={len(all_passes)}")
-        return len(all_passes)
+        tle_index()  # rebuilt here rather than on the next search keystroke
+        job_stage(job, "passes")
+        plan = publish_plan(build_plan())
+        job_stage(job, None)
+        print(f"[REPLAN] done. plan v{plan.version}, passes={len(plan.passes)}")
+        return len(plan.passes)
+
+# ---------------- Background jobs ----------------
+# Long operations run in a worker thread; HTTP only gets a job id back.
+# A request for a kind that is already queued/running joins that job.
+JOBS_LOCK = threading.Lock()
+JOBS = OrderedDict()
+JOBS_KEEP = 20
+ACTIVE_JOBS = {}
+
+def job_stage(job, name):
+    # closes the running stage and (if name) opens the next one
+    if job is None:
+        return
+    now = time.time()
+    with JOBS_LOCK:
+        if job["stages"] and job["stages"][-1]["seconds"] is None:
+            st = job["stages"][-1]
+            st["seconds"] = round(now - st["started"], 3)
+        if name:
+            job["stages"].append({"name": name, "started": now, "seconds": None})
+        job["stage"] = name
+
+def _run_job(job, fn):
+    with JOBS_LOCK:
+        job["state"] = "running"
+        job["started"] = time.time()
+    try:
+        result, state, error = fn(job), "done", None
+    except Exception as e:
+        print(f"[JOBS] {job['kind']} {job['id']} failed:", e)
+        result, state, error = None, "error", str(e)
+    job_stage(job, None)
+    with JOBS_LOCK:
+        job.update(state=state, result=result, error=error, finished=time.time())
+        if ACTIVE_JOBS.get(job["kind"]) is job:
+            del ACTIVE_JOBS[job["kind"]]
+
+def submit_job(kind: str, fn):
+    # returns (job id, coalesced)
+    with JOBS_LOCK:
+        job = ACTIVE_JOBS.get(kind)
+        if job is not None:
+            job["requests"] += 1
+            return job["id"], True
+        job = {"id": os.urandom(6).hex(), "kind": kind, "state": "queued", "stage": None,
+               "stages": [], "created": time.time(), "started": None, "finished": None,
+               "result": None, "error": None, "requests": 1}
+        JOBS[job["id"]] = job
+        ACTIVE_JOBS[kind] = job
+        while len(JOBS) > JOBS_KEEP:
+            old_id, old = next(iter(JOBS.items()))
+            if old["state"] in ("queued", "running"):
+                break
+            del JOBS[old_id]
+    threading.Thread(target=_run_job, args=(job, fn), daemon=True, name=f"job-{kind}").start()
+    return job["id"], False
+
+def job_status(job_id: str):
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+        if job is None:
+            return None
+        out = dict(job)
+        out["stages"] = [{"name": st["name"], "seconds": st["seconds"] if st["seconds"] is not None
+                          else round(time.time() - st["started"], 3), "done": st["seconds"] is not None}
+                         for st in job["stages"]]
+    end = out["finished"] or time.time()
+    out["elapsed"] = round(end - out["started"], 3) if out["started"] else 0.0
+    return out
+
+def _on_location(old, new):
+    # passes depend on where we are; re-plan in the background
+    if current_plan() is not None:
+        job_id, _ = submit_job("replan", replan_and_refresh)
+        print(f"[CONFIG] location changed -> replan job {job_id}")
+
+def _on_output_dir(old, new):
+    gallery_index_rebuild_async()
+
+subscribe_config(_on_location, "KOORD_LAT", "KOORD_LON", "ALTITUDE_LIMIT")
+subscribe_config(_on_output_dir, "NUOTRAUKU_KATALOGAS")
+
+# ---------------- Live stream ----------------
+# The tracking loop publishes small events; each is serialized once into an
+# SSE frame and kept in a ring. Publishing is O(1) whatever the number of
+# clients: one deque append plus a single wake-up on the HTTP event loop,
+# after which every client copies the shared frames from its own cursor.
+LIVE_RING = 512
+LIVE_PRODUCT_SCAN = 10
+SSE_MAX_CLIENTS = 32
+SSE_PING = 15
+ROTOR_POS_RE = re.compile(rb"AZ\s*(-?\d+(?:\.\d+)?)\s*EL\s*(-?\d+(?:\.\d+)?)")
+
+class LiveFeed:
+    def __init__(self, size):
+        self.lock = threading.Lock()
+        self.ring = deque(maxlen=size)
+        self.latest = {}
+        self.seq = 0
+        self.event = None
+        self.clients = 0
+
+    def publish(self, kind, **data):
+        with self.lock:
+            self.seq += 1
+            data["ts"] = round(time.time(), 3)
+            frame = f"id: {self.seq}\nevent: {kind}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+            self.ring.append((self.seq, frame))
+            self.latest[kind] = (self.seq, frame)
+        loop = HTTP_STATE.get("loop")
+        if loop is not None and self.clients:
+            try: loop.call_soon_threadsafe(self._wake)
+            except RuntimeError: pass
+
+    def _wake(self):
+        # event loop thread only
+        ev, self.event = self.event, None
+        if ev is not None:
+            ev.set()
+
+    def waiter(self):
+        if self.event is None:
+            self.event = asyncio.Event()
+        return self.event
+
+    def since(self, seq):
+        # frames after seq; a client that fell off the ring gets the latest state instead
+        with self.lock:
+            if seq > self.seq:
+                seq = -1  # Last-Event-ID from before a restart: start over
+            if self.ring and self.ring[0][0] <= seq + 1:
+                # ring seqs are consecutive, so the first unseen frame sits at a known offset
+                out = [fr for _, fr in islice(self.ring, seq + 1 - self.ring[0][0], None)]
+            else:
+                out = [fr for s_, fr in sorted(self.latest.values()) if s_ > seq]
+            return out, self.seq
+
+LIVE = LiveFeed(LIVE_RING)
+
+def rotor_feedback(ser):
+    # controllers that report "AZx ELy" back on the line; None when nothing arrived
+    try:
+        n = ser.in_waiting
+        if not n:
+            return None
+        m = ROTOR_POS_RE.findall(ser.read(n))
+        return [float(m[-1][0]), float(m[-1][1])] if m else None
+    except Exception:
+        return None
+
+# Rotor serial link lives here so a port/baud change in settings reopens it
+# between two commands instead of waiting for a restart.
+ROTOR = {"ser": None, "port": None}
+ROTOR_LOCK = threading.Lock()
+
+def rotor_open(cfg=None):
+    cfg = cfg or CONFIG
+    with ROTOR_LOCK:
+        if ROTOR["ser"]:
+            try: ROTOR["ser"].close()
+            except Exception: pass
+        ROTOR["ser"], ROTOR["port"] = None, None
+        try:
+            ser = serial.Serial(cfg.serial_port, cfg.baudrate, timeout=1)
+            time.sleep(2)
+            ROTOR["ser"], ROTOR["port"] = ser, (cfg.serial_port, cfg.baudrate)
+            print(f"Serial open {cfg.serial_port} @ {cfg.baudrate}")
+        except Exception as e:
+            print("Cannot open serial:", e)
+            print("Will track without sending.")
+    return ROTOR["ser"]
+
+def rotor_close():
+    with ROTOR_LOCK:
+        if ROTOR["ser"]:
+            try: ROTOR["ser"].close()
+            except Exception: pass
+        ROTOR["ser"], ROTOR["port"] = None, None
+
+def rotor_send(cmd: str):
+    # returns (sent, feedback); prints the command when no rotor is attached
+    with ROTOR_LOCK:
+        ser = ROTOR["ser"]
+        startup_mark("first rotor command")
+        if not ser:
+            print(cmd.strip())
+            return False, None
+        try:
+            ser.write(cmd.encode("ascii"))
+        except Exception as e:
+            print("Serial write error:", e, "cmd:", cmd.strip())
+            return False, None
+        return True, rotor_feedback(ser)
+
+def _on_serial(old, new):
+    print(f"[CONFIG] rotor link -> {new.serial_port} @ {new.baudrate}")
+    rotor_open(new)
+
+subscribe_config(_on_serial, "SERIAL_PORT", "BAUDRATE")
+
+def _publish_new_products(pass_id, pass_dir, known):
+    try:
+        now = {rel for rel, _ in _iter_pass_images(pass_dir, "")}
+    except Exception:
+        return known
+    for rel in sorted(now - known):
+        LIVE.publish("product", id=pass_id, file=rel,
+                     url=_rel(os.path.join(pass_dir, rel)))
+    return now
+
+# ---------------- Sky plots ----------------
+# Polar az/el plot per pass, drawn as SVG on first request and kept in a
+# small disk cache; least recently used files are evicted past the byte cap.
+# Recency lives in memory (seeded from file mtimes) so hits keep their ETag.
+# Files are named <pass id>.<source digest>.svg, so a plot drawn from older
+# elements, another station or another horizon window is never served again.
+SKYPLOT_DIR = os.path.join(BASE_DIR, "_skyplots")
+SKYPLOT_CACHE_BYTES = 8 * 1024 * 1024
+SKYPLOT_POINTS = 120
+SKYPLOT_LOCK = threading.Lock()
+SKYPLOT_LRU = OrderedDict()
+_skyplot_state = {"seeded": False}
+SKYPLOT_RE = re.compile(r"^/api/skyplot/([A-Za-z0-9_\-]+)\.svg$")
+
+def _skyplot_source(pid: str):
+    # (sat, t1, t2, tculm, pav) from the current plan, else from a recorded pass
+    plan = current_plan()
+    if plan is not None and pid in plan.index:
+        for t1, t2, pav, sat, tculm, max_elev in plan.passes:
+            if f"{to_local_naive(t1.utc_datetime()).strftime('%Y%m%d_%H%M')}_{sanitize_name(pav)}" == pid:
+                return plan.ts, plan.vieta, sat, t1, t2, tculm, pav
+    p = gallery_get(pid)
+    meta = (p or {}).get("meta") or {}
+    if not meta.get("satellite") or not meta.get("start_local") or not meta.get("end_local"):
+        return None
+    l1, l2 = gauti_tle(meta["satellite"])
+    if not l1:
+        return None
+    ts = plan.ts if plan else load.timescale()
+    vieta = plan.vieta if plan else wgs84.latlon(latitude_degrees=KOORD_LAT, longitude_degrees=KOORD_LON)
+    t1 = ts.from_datetime(datetime.fromisoformat(meta["start_local"]).replace(tzinfo=LOCAL_TZ))
+    t2 = ts.from_datetime(datetime.fromisoformat(meta["end_local"]).replace(tzinfo=LOCAL_TZ))
+    return ts, vieta, EarthSatellite(l1, l2, meta["satellite"], ts), t1, t2, None, meta["satellite"]
+
+def render_skyplot_svg(ts, vieta, sat, t1, t2, tculm, pav):
+    alt, az, _ = (sat - vieta).at(ts.linspace(t1, t2, SKYPLOT_POINTS)).altaz()
+    el = np.clip(alt.degrees, 0, 90)
+    a = np.radians(az.degrees)
+    R, C = 140, 160
+    r = (90 - el) / 90 * R
+    xs, ys = C + r * np.sin(a), C - r * np.cos(a)
+    pts = " ".join(f"{x:.1f},{y:.1f}" for x, y in zip(xs, ys))
+    k = int(np.argmax(el)) if tculm is None else None
+    if tculm is not None:
+        ca, caz, _ = (sat - vieta).at(tculm).altaz()
+        cr = (90 - max(0.0, ca.degrees)) / 90 * R
+        cx, cy, cmax = C + cr * math.sin(math.radians(caz.degrees)), C - cr * math.cos(math.radians(caz.degrees)), ca.degrees
+    else:
+        cx, cy, cmax = xs[k], ys[k], el[k]
+    st = to_local_naive(t1.utc_datetime()).strftime("%Y-%m-%d %H:%M")
+    en = to_local_naive(t2.utc_datetime()).strftime("%H:%M")
+    f = io.StringIO()
+    f.write("<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 320 350' width='320' height='350' font-family='sans-serif'>")
+    f.write("<rect width='320' height='350' fill='#111'/>")
+    for e in (0, 30, 60):
+        f.write(f"<circle cx='{C}' cy='{C}' r='{(90 - e) / 90 * R:.1f}' fill='none' stroke='#333'/>")
+        f.write(f"<text x='{C + 3}' y='{C - (90 - e) / 90 * R + 11:.1f}' fill='#666' font-size='9'>{e}&#176;</text>")
+    f.write(f"<line x1='{C - R}' y1='{C}' x2='{C + R}' y2='{C}' stroke='#262626'/><line x1='{C}' y1='{C - R}' x2='{C}' y2='{C + R}' stroke='#262626'/>")
+    for lbl, x, y in (("N", C, C - R - 5), ("E", C + R + 9, C + 4), ("S", C, C + R + 14), ("W", C - R - 9, C + 4)):
+        f.write(f"<text x='{x}' y='{y}' fill='#aaa' font-size='11' text-anchor='middle'>{lbl}</text>")
+    f.write(f"<polyline points='{pts}' fill='none' stroke='#0f0' stroke-width='2'/>")
+    f.write(f"<circle cx='{xs[0]:.1f}' cy='{ys[0]:.1f}' r='4' fill='#4caf50'/><circle cx='{xs[-1]:.1f}' cy='{ys[-1]:.1f}' r='4' fill='#e53935'/>")
+    f.write(f"<circle cx='{cx:.1f}' cy='{cy:.1f}' r='3' fill='#ffd54f'/>")
+    f.write(f"<text x='160' y='322' fill='#eee' font-size='13' text-anchor='middle'>{html.escape(pav)} &#183; {cmax:.0f}&#176;</text>")
+    f.write(f"<text x='160' y='340' fill='#999' font-size='11' text-anchor='middle'>{st} - {en}</text>")
+    f.write("</svg>")
+    return f.getvalue()
+
+def _skyplot_key(pid: str, src) -> str:
+    ts, vieta, sat, t1, t2, tculm, pav = src
+    # t1/t2 are already clipped to the horizon mask, so a mask edit changes them too
+    sig = _digest([pav, sat.epoch.tt, vieta.latitude.degrees, vieta.longitude.degrees, t1.tt, t2.tt])
+    return f"{pid}.{sig[:12]}"
+
+def _skyplot_seed():
+    # caller holds SKYPLOT_LOCK
+    _skyplot_state["seeded"] = True
+    try:
+        files = [(e.stat().st_mtime, e.name[:-4], e.stat().st_size)
+                 for e in os.scandir(SKYPLOT_DIR) if e.name.endswith(".svg")]
+    except OSError:
+        return
+    for _, key, size in sorted(files):
+        SKYPLOT_LRU[key] = size
+
+def skyplot_file(pid: str):
+    # path of the cached plot, None if the pass is unknown
+    src = _skyplot_source(pid)
+    if src is None:
+        return None
+    key = _skyplot_key(pid, src)
+    path = os.path.join(SKYPLOT_DIR, key + ".svg")
+    with SKYPLOT_LOCK:
+        if not _skyplot_state["seeded"]:
+            _skyplot_seed()
+        if key in SKYPLOT_LRU and os.path.isfile(path):
+            SKYPLOT_LRU.move_to_end(key)
+            return path
+    svg = render_skyplot_svg(*src)
+    with SKYPLOT_LOCK:
+        os.makedirs(SKYPLOT_DIR, exist_ok=True)
+        atomic_write_text(path, svg)
+        # older versions of this pass's plot are dead weight now
+        for old in [k for k in SKYPLOT_LRU if k != key and (k == pid or k.startswith(pid + "."))]:
+            SKYPLOT_LRU.pop(old)
+            try: os.remove(os.path.join(SKYPLOT_DIR, old + ".svg"))
+            except OSError: pass
+        SKYPLOT_LRU[key] = len(svg.encode("utf-8"))
+        total = sum(SKYPLOT_LRU.values())
+        while len(SKYPLOT_LRU) > 1 and total > SKYPLOT_CACHE_BYTES:
+            old, size = SKYPLOT_LRU.popitem(last=False)
+            total -= size
+            try: os.remove(os.path.join(SKYPLOT_DIR, old + ".svg"))
+            except OSError: pass
+    return path
+
+# ---------------- Map ----------------
+# Ground tracks of the next passes plus the station visibility footprint as
+# GeoJSON. One vectorized propagation per satellite covers all its passes;
+# tracks are thinned with Douglas-Peucker so straight stretches cost nothing.
+MAP_PASSES = 3
+MAP_MAX_PASSES = 10
+MAP_STEP = 20           # s between propagated samples
+MAP_MARGIN = 600        # s of track drawn before AOS / after LOS
+MAP_TOLERANCE = 0.05    # deg
+MAP_TILE_URL = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+# shown over the tiles whenever MAP_TILE_URL is set; keep it in step with the tile source
+MAP_TILE_ATTRIBUTION = "&copy; <a href='https://www.openstreetmap.org/copyright' target='_blank'>OpenStreetMap</a> contributors"
+EARTH_R_KM = 6371.0
+
+def _decimate(x, y, tol):
+    keep = np.zeros(len(x), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(x) - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b <= a + 1:
+            continue
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        d = np.abs(dy * (x[a+1:b] - x[a]) - dx * (y[a+1:b] - y[a])) / (math.hypot(dx, dy) or 1e-12)
+        i = int(np.argmax(d))
+        if d[i] > tol:
+            k = a + 1 + i
+            keep[k] = True
+            stack += [(a, k), (k, b)]
+    return keep
+
+def _track_lines(lon, lat):
+    # unwrap, thin, wrap back and split at the antimeridian
+    ulon = np.degrees(np.unwrap(np.radians(lon)))
+    keep = _decimate(ulon, lat, MAP_TOLERANCE)
+    lines, cur, prev = [], [], None
+    for x, y in zip(ulon[keep], lat[keep]):
+        x = (x + 180.0) % 360.0 - 180.0
+        if prev is not None and abs(x - prev) > 180:
+            lines.append(cur)
+            cur = []
+        cur.append([round(float(x), 2), round(float(y), 2)])
+        prev = x
+    lines.append(cur)
+    return [ln for ln in lines if len(ln) > 1]
+
+def _footprint(lat0, lon0, alt_km, min_el, n=72):
+    e = math.radians(max(0.0, min_el))
+    lam = math.acos(EARTH_R_KM / (EARTH_R_KM + alt_km) * math.cos(e)) - e
+    br = np.linspace(0, 2 * math.pi, n + 1)
+    p1, l1 = math.radians(lat0), math.radians(lon0)
+    p2 = np.arcsin(math.sin(p1) * math.cos(lam) + math.cos(p1) * math.sin(lam) * np.cos(br))
+    l2 = l1 + np.arctan2(np.sin(br) * math.sin(lam) * math.cos(p1), math.cos(lam) - math.sin(p1) * np.sin(p2))
+    lon = (np.degrees(l2) + 180.0) % 360.0 - 180.0
+    return [[round(float(x), 2), round(float(y), 2)] for x, y in zip(lon, np.degrees(p2))]
+
+def map_last_ended(plan, now):
+    # LOS of the newest pass that is already over; the map drops ended passes,
+    # so its content changes exactly when this does, not only on a replan
+    return max((t2.utc_datetime().timestamp() for t1, t2, *_ in (plan.passes if plan else ())
+                if t2.utc_datetime().timestamp() < now), default=0.0)
+
+def render_map_geojson(n=MAP_PASSES, now=None):
+    plan = current_plan()
+    langai, ts = (plan.passes, plan.ts) if plan else ((), None)
+    now = now_utc().timestamp() if now is None else now
+    by_sat = OrderedDict()
+    for t1, t2, pav, sat, tculm, max_elev in langai:
+        if t2.utc_datetime().timestamp() < now:
+            continue
+        lst = by_sat.setdefault(pav, (sat, []))[1]
+        if len(lst) < n:
+            lst.append((t1, t2, max_elev))
+    feats = [{"type": "Feature", "geometry": {"type": "Point", "coordinates": [KOORD_LON, KOORD_LAT]},
+              "properties": {"kind": "station"}}]
+    for pav, (sat, lst) in by_sat.items():
+        a = lst[0][0].tt - MAP_MARGIN / 86400.0
+        b = lst[-1][1].tt + MAP_MARGIN / 86400.0
+        steps = int((b - a) * 86400.0 / MAP_STEP) + 2
+        geo = sat.at(ts.tt_jd(np.linspace(a, b, steps)))
+        lat_a, lon_a = wgs84.latlon_of(geo)
+        lat, lon = lat_a.degrees, lon_a.degrees
+        alt_km = float(np.mean(wgs84.height_of(geo).km))
+        feats.append({"type": "Feature", "geometry": {"type": "Polygon",
+                      "coordinates": [_footprint(KOORD_LAT, KOORD_LON, alt_km, ALTITUDE_LIMIT)]},
+                      "properties": {"kind": "footprint", "sat": pav, "alt_km": round(alt_km)}})
+        step_d = (b - a) / (steps - 1)
+        for t1, t2, max_elev in lst:
+            i_aos = int(round((t1.tt - a) / step_d))
+            i_los = int(round((t2.tt - a) / step_d))
+            i0 = max(0, i_aos - int(MAP_MARGIN / MAP_STEP))
+            i1 = min(steps - 1, i_los + int(MAP_MARGIN / MAP_STEP))
+            props = {"sat": pav, "aos": int(t1.utc_datetime().timestamp()),
+                     "los": int(t2.utc_datetime().timestamp()), "max": round(float(max_elev), 1),
+                     "id": f"{to_local_naive(t1.utc_datetime()).strftime('%Y%m%d_%H%M')}_{sanitize_name(pav)}"}
+            for kind, j0, j1 in (("track", i0, i1), ("visible", i_aos, i_los)):
+                lines = _track_lines(lon[j0:j1 + 1], lat[j0:j1 + 1])
+                if lines:
+                    feats.append({"type": "Feature", "geometry": {"type": "MultiLineString", "coordinates": lines},
+                                  "properties": dict(props, kind=kind)})
+    return json.dumps({"type": "FeatureCollection", "features": feats}, separators=(",", ":"))
 
 # ---------------- HTTP server ----------------
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("application/xml", ".dzi")
+STATIC_COMPRESSIBLE = {".html", ".css", ".js", ".json", ".svg", ".txt", ".xml", ".dzi"}
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+SENDFILE_CHUNK = 1 << 20
+
+def accepts_encoding(accept: str, enc: str) -> bool:
+    for part in (accept or "").split(","):
+        token, _, params = part.strip().partition(";")
+        if token.strip().lower() in (enc, "*"):
+            q = params.strip()
+            return not (q.startswith("q=") and _to_number(q[2:], float) == 0)
+    return False
+
+def is_fresh(headers, etag: str, mtime: float) -> bool:
+    inm = headers.get("If-None-Match")
+    if inm:
+        tags = [x.strip() for x in inm.split(",")]
+        return etag in tags or "*" in tags
+    ims = headers.get("If-Modified-Since")
+    if ims:
+        try: return int(mtime) <= parsedate_to_datetime(ims).timestamp()
+        except Exception: return False
+    return False
+
+def _static_file(url_path: str):
+    root = os.path.realpath(BASE_DIR)
+    full = os.path.realpath(os.path.join(root, unquote(url_path).lstrip("/")))
+    if full != root and not full.startswith(root + os.sep):
+        return None
+    return full if os.path.isfile(full) else None
+
+def _is_pass_product(full: str) -> bool:
+    # original product images of a finished pass never change in place; the
+    # running pass might, and meta.json, manifests and _thumbs/_derivs/_tiles
+    # are rewritten under the same URL (resume, TILES_ENABLE, DERIV_SIZES)
+    out_root = os.path.realpath(NUOTRAUKU_KATALOGAS) + os.sep
+    if not full.startswith(out_root) or os.path.splitext(full)[1].lower() not in VALID_EXTS:
+        return False
+    parts = full[len(out_root):].split(os.sep)
+    return len(parts) > 1 and parts[0] != get_current_pass_id() and not DERIVED_DIRS.intersection(parts[1:-1])
+
+def _parse_range(value: str, size: int):
+    # single "bytes=a-b" range -> (start, end) inclusive; None = ignore, False = unsatisfiable
+    if not value or not value.startswith("bytes=") or "," in value:
+        return None
+    a, _, b = value[6:].strip().partition("-")
+    try:
+        if a == "":
+            n = int(b)
+            if n <= 0:
+                return False
+            return max(0, size - n), size - 1
+        start = int(a)
+        end = int(b) if b else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+def static_plan(url_path: str, headers):
+    # transport-neutral description of a static file response
+    full = _static_file(url_path)
+    if not full:
+        return None
+    st = os.stat(full)
+    ext = os.path.splitext(full)[1].lower()
+    ctype = mimetypes.guess_type(full)[0] or "application/octet-stream"
+    if ctype.startswith("text/") or ext in (".js", ".json", ".svg"):
+        ctype += "; charset=utf-8"
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    mtime = st.st_mtime
+    out = [("Content-Type", ctype), ("Accept-Ranges", "bytes")]
+    send_path, size, encoding = full, st.st_size, None
+
+    if ext in STATIC_COMPRESSIBLE:
+        out.append(("Vary", "Accept-Encoding"))
+        for enc, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if not accepts_encoding(headers.get("Accept-Encoding"), enc):
+                continue
+            try:
+                cst = os.stat(full + suffix)
+            except OSError:
+                continue
+            if cst.st_mtime_ns >= st.st_mtime_ns:
+                send_path, size, encoding = full + suffix, cst.st_size, enc
+                etag = etag[:-1] + "-" + enc + '"'
+                out.append(("Content-Encoding", enc))
+                break
+
+    out.append(("ETag", etag))
+    out.append(("Last-Modified", formatdate(mtime, usegmt=True)))
+    out.append(("Cache-Control", IMMUTABLE_CACHE if _is_pass_product(full) or _is_asset(full) else "no-cache"))
+
+    if is_fresh(headers, etag, mtime):
+        return {"status": 304, "headers": out, "path": send_path, "offset": 0, "length": 0}
+
+    status, offset, length = 200, 0, size
+    rng = _parse_range(headers.get("Range"), size) if encoding is None else None
+    if_range = headers.get("If-Range")
+    if rng is not None and if_range and if_range != etag and if_range != formatdate(mtime, usegmt=True):
+        rng = None
+    if rng is False:
+        out.append(("Content-Range", f"bytes */{size}"))
+        out.append(("Content-Length", "0"))
+        return {"status": 416, "headers": out, "path": send_path, "offset": 0, "length": 0}
+    if rng:
+        status, offset, length = 206, rng[0], rng[1] - rng[0] + 1
+        out.append(("Content-Range", f"bytes {rng[0]}-{rng[1]}/{size}"))
+    out.append(("Content-Length", str(length)))
+    return {"status": status, "headers": out, "path": send_path, "offset": offset, "length": length}
+
+class RenderCache:
+    # LRU of rendered pages; keys carry the state versions they were built from,
+    # so stale entries are never hit and simply age out.
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, render):
+        with self.lock:
+            hit = self.items.get(key)
+            if hit is not None:
+                self.items.move_to_end(key)
+                return hit
+        body = render().encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest()[:24] + '"'
+        entry = (body, etag, gzip.compress(body, 6), etag[:-1] + '-gzip"')
+        with self.lock:
+            self.items[key] = entry
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+        return entry
+
+RENDER_CACHE = RenderCache()
+PASS_PAGE_RE = re.compile(r"^/pass-([A-Za-z0-9_\-]+)\.html$")
+
 class Handler(SimpleHTTPRequestHandler):
+    def _send_static(self, plan, head_only=False):
+        self.send_response(plan["status"])
+        for k, v in plan["headers"]:
+            self.send_header(k, v)
+        self.end_headers()
+        if head_only or not plan["length"]:
+            return
+        with open(plan["path"], "rb") as fh:
+            offset, left = plan["offset"], plan["length"]
+            try:
+                # zero-copy: file pages go straight to the socket
+                out_fd = self.connection.fileno()
+                while left > 0:
+                    sent = os.sendfile(out_fd, fh.fileno(), offset, min(left, SENDFILE_CHUNK))
+                    if sent == 0:
+                        return
+                    offset += sent; left -= sent
+                return
+            except (AttributeError, io.UnsupportedOperation):
+                pass
+            except OSError as e:
+                if e.errno not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK, errno.EOPNOTSUPP) or offset != plan["offset"]:
+                    return
+            fh.seek(offset)
+            while left > 0:
+                chunk = fh.read(min(left, 64 * 1024))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                left -= len(chunk)
+
+    def do_HEAD(self):
+        # same render/cache path as GET so the ETag matches what GET would send
+        if self._try_dynamic_page(urlparse(self.path).path):
+            return
+        plan = static_plan(urlparse(self.path).path, self.headers)
+        if plan:
+            return self._send_static(plan, head_only=True)
+        return SimpleHTTPRequestHandler.do_HEAD(self)
+
+    def _send_rendered(self, page, deps, render, ctype="text/html; charset=utf-8", updated=None):
+        # updated: per-item stamp for pages that depend on one row, not a whole state key
+        versions, mtime = state_snapshot(*deps)
+        if updated is not None:
+            versions, mtime = versions + (updated,), max(mtime, updated)
+        body, etag, gz_body, gz_etag = RENDER_CACHE.get((page, LANG) + versions, render)
+        gz = accepts_encoding(self.headers.get("Accept-Encoding"), "gzip")
+        if gz:
+            body, etag = gz_body, gz_etag
+        if is_fresh(self.headers, etag, mtime):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Vary", "Accept-Encoding")
+        if gz:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(mtime, usegmt=True))
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _try_dynamic_page(self, path):
+        if path in ("/", "/index.html"):
+            self._send_rendered("index", ("plan", "gallery", "selection", "settings"),
+                                lambda: render_index_page(getattr(current_plan(), "passes", ()), nuskaityti_praejimus(limit=8)))
+            return True
+        if path == "/galerija.html":
+            self._send_rendered("gallery", ("gallery", "settings"), render_gallery_page)
+            return True
+        if path == "/nustatymai.html":
+            self._send_rendered("settings", ("settings",), render_settings_page)
+            return True
+        if path == "/zemelapis.html":
+            self._send_rendered("map", ("settings",), render_map_page)
+            return True
+        m = PASS_PAGE_RE.match(path)
+        if m:
+            p = gallery_get(m.group(1))
+            if p:
+                self._send_rendered("pass:" + p["name"], ("settings",), lambda: render_pass_page(p),
+                                    updated=p["updated"] or 0.0)
+                return True
+        return False
+
     def do_GET(self):
         parsed = urlparse(self.path)
 
+        if self._try_dynamic_page(parsed.path):
+            return
+
+        if parsed.path == "/api/map":
+            qs = parse_qs(parsed.query)
+            n = _to_number((qs.get("n") or [MAP_PASSES])[0], int) or MAP_PASSES
+            n = max(1, min(MAP_MAX_PASSES, n))
+            now = now_utc().timestamp()
+            self._send_rendered(f"map.geojson:{n}", ("plan", "settings"), lambda: render_map_geojson(n, now),
+                                "application/geo+json; charset=utf-8", updated=map_last_ended(current_plan(), now))
+            return
+
+        if parsed.path == "/api/plan":
+            self._send_rendered("plan.json", ("plan",), render_plan_json, "application/json; charset=utf-8")
+            return
+
+        m = SKYPLOT_RE.match(parsed.path)
+        if m:
+            try:
+                path = skyplot_file(m.group(1))
+            except Exception as e:
+                print("[SKYPLOT] error:", e)
+                path = None
+            plan = static_plan(_rel(path) if path else "", self.headers) if path else None
+            if not plan:
+                self.send_error(404, "File not found")
+                return
+            self._send_static(plan, head_only=self.command == "HEAD")
+            return
+
         if parsed.path == "/api/select":
             qs = parse_qs(parsed.query)
             pid = (qs.get("id") or [""])[0]
@@ -858,11 +2792,27 @@ class Handler(SimpleHTTPRequestHandler):
 
         if parsed.path == "/api/tle_names":
             qs = parse_qs(parsed.query)
-            q = (qs.get("q") or [""])[0].strip().upper()
-            names = read_tle_names()
-            if q:
-                names = [n for n in names if q in n.upper()]
-            data = json.dumps({"ok": True, "names": names[:200]}).encode("utf-8")
+            q = (qs.get("q") or [""])[0].strip()
+            results = tle_index().search(q)
+            data = json.dumps({"ok": True, "names": [r["name"] for r in results],
+                               "results": results}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        if parsed.path == "/api/gallery":
+            qs = parse_qs(parsed.query)
+            arg = lambda k: (qs.get(k) or [""])[0].strip() or None
+            try:
+                limit = int(arg("limit") or GALLERY_PAGE_SIZE)
+            except ValueError:
+                limit = GALLERY_PAGE_SIZE
+            passes, nxt = gallery_query(arg("cursor"), limit, arg("sat"), arg("from"), arg("to"))
+            items = [c for c in (card_info(p) for p in passes) if c]
+            data = json.dumps({"ok": True, "items": items, "next": nxt}, ensure_ascii=False).encode("utf-8")
             self.send_response(200)
             self.send_header("Content-Type", "application/json; charset=utf-8")
             self.send_header("Content-Length", str(len(data)))
@@ -881,21 +2831,27 @@ class Handler(SimpleHTTPRequestHandler):
             return
 
         if parsed.path == "/api/replan":
-            try:
-                count = replan_and_refresh()
-                data = json.dumps({"ok": True, "count": count}).encode("utf-8")
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json; charset=utf-8")
-                self.send_header("Content-Length", str(len(data)))
-                self.end_headers()
-                self.wfile.write(data)
-            except Exception as e:
-                msg = json.dumps({"ok": False, "error": str(e)}).encode("utf-8")
-                self.send_response(500)
-                self.send_header("Content-Type", "application/json; charset=utf-8")
-                self.send_header("Content-Length", str(len(msg)))
-                self.end_headers()
-                self.wfile.write(msg)
+            job_id, coalesced = submit_job("replan", replan_and_refresh)
+            print(f"[API] /api/replan -> job {job_id}{' (coalesced)' if coalesced else ''}")
+            data = json.dumps({"ok": True, "job": job_id, "coalesced": coalesced,
+                               "status": f"/api/jobs/{job_id}"}).encode("utf-8")
+            self.send_response(202)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        if parsed.path.startswith("/api/jobs/"):
+            job = job_status(parsed.path[len("/api/jobs/"):])
+            data = json.dumps(job if job else {"ok": False, "error": "unknown job"}).encode("utf-8")
+            self.send_response(200 if job else 404)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(data)
             return
 
         if parsed.path == "/api/tle_txt":
@@ -925,11 +2881,6 @@ class Handler(SimpleHTTPRequestHandler):
             except Exception:
                 days = GALLERY_KEEP_DAYS
             res = cleanup_gallery(days)
-            try:
-                ts, vieta, all_passes = compute_passes_next_24h()
-                atnaujinti_galerija(all_passes, ts, vieta)
-            except Exception as e:
-                print("[CLEANUP] refresh pages error:", e)
             data = json.dumps({"ok": True, "days": days, "result": res}).encode("utf-8")
             self.send_response(200)
             self.send_header("Content-Type", "application/json; charset=utf-8")
@@ -954,6 +2905,9 @@ class Handler(SimpleHTTPRequestHandler):
             self.end_headers()
             return
 
+        plan = static_plan(parsed.path, self.headers)
+        if plan:
+            return self._send_static(plan)
         return SimpleHTTPRequestHandler.do_GET(self)
 
     def do_POST(self):
@@ -972,7 +2926,7 @@ class Handler(SimpleHTTPRequestHandler):
                 if key in qs:
                     raw = qs[key][0].strip()
                     raw_norm = raw.replace(",", ".")
-                    if key in ("HTTP_PORT","BAUDRATE","UPDATE_INTERVAL","SATDUMP_RATE","SATDUMP_LEAD","SATDUMP_TAIL","GALLERY_KEEP_DAYS"):
+                    if key in ("HTTP_PORT","BAUDRATE","UPDATE_INTERVAL","SATDUMP_RATE","SATDUMP_LEAD","SATDUMP_TAIL","GALLERY_KEEP_DAYS","TILES_ENABLE"):
                         try: new_cfg[key] = int(float(raw_norm.replace("_","")))
                         except Exception: pass
                     elif key in ("KOORD_LAT","KOORD_LON","ALTITUDE_LIMIT"):
@@ -991,9 +2945,15 @@ class Handler(SimpleHTTPRequestHandler):
                 new_cfg["LANG"] = lang
 
             save_settings_file(new_cfg)
-            apply_settings(new_cfg)
-
-            resp = json.dumps({"ok": True, "saved": new_cfg, "note": "restart_maybe"}).encode("utf-8")
+            try:
+                changed, errors = apply_settings(new_cfg)
+                resp = {"ok": not errors, "saved": dict(CONFIG.settings), "applied": sorted(changed), "version": CONFIG.version}
+                if errors:
+                    resp["error"] = "; ".join(errors[k] for k in sorted(errors))
+            except Exception as e:
+                print("[CONFIG] apply failed:", e)
+                resp = {"ok": False, "saved": new_cfg, "error": str(e)}
+            resp = json.dumps(resp).encode("utf-8")
             self.send_response(200)
             self.send_header("Content-Type", "application/json; charset=utf-8")
             self.send_header("Content-Length", str(len(resp)))
@@ -1011,7 +2971,7 @@ class Handler(SimpleHTTPRequestHandler):
             changed = False
 
             if op == "add" and name:
-                if name not in cur and name in read_tle_names():
+                if name not in cur and tle_catalog().find(name) is not None:
                     cur.append(name); changed = True
             elif op == "remove" and name:
                 if name in cur:
@@ -1052,12 +3012,184 @@ class Handler(SimpleHTTPRequestHandler):
         self.send_response(404)
         self.end_headers()
 
+# ---- asyncio front end ----
+# One event loop thread owns every connection (keep-alive, static files via
+# loop.sendfile). Routes implemented by Handler run on a small bounded
+# executor against in-memory buffers, so replan/cleanup never block the loop.
+HTTP_MAX_CONCURRENCY = 16
+HTTP_WORKERS = 4
+HTTP_KEEPALIVE = 15
+HTTP_KEEPALIVE_MAX = 200
+HTTP_MAX_BODY = 16 * 1024 * 1024
+HTTP_STATE = {"loop": None, "executor": None, "slots": None, "server": None}
+
+class BufferedHandler(Handler):
+    protocol_version = "HTTP/1.1"
+
+    def __init__(self, raw: bytes, client_address):
+        self.rfile = io.BytesIO(raw)
+        self.wfile = io.BytesIO()
+        self.client_address = client_address
+        self.directory = BASE_DIR
+        self.server = None
+        self.close_connection = True
+        try:
+            self.handle_one_request()
+        except Exception as e:
+            print("[HTTP] handler error:", e)
+            if not self.wfile.getvalue():
+                self.wfile.write(b"HTTP/1.1 500 Internal Server Error\r\nContent-Length: 0\r\n\r\n")
+
+def _run_handler(raw: bytes, peer):
+    return BufferedHandler(raw, peer).wfile.getvalue()
+
+def _is_dynamic_page(path: str) -> bool:
+    return path in ("/", "/index.html", "/galerija.html", "/nustatymai.html", "/zemelapis.html") or bool(PASS_PAGE_RE.match(path))
+
+def _finish_response(resp: bytes, keep: bool, head_only: bool):
+    head, sep, body = resp.partition(b"\r\n\r\n")
+    lines = head.split(b"\r\n")
+    names = {ln.split(b":", 1)[0].strip().lower() for ln in lines[1:]}
+    if b"connection: close" in head.lower():
+        keep = False
+    try:
+        code = int(lines[0].split()[1])
+    except Exception:
+        code = 500
+    if b"content-length" not in names and code >= 200 and code not in (204, 304) and not head_only:
+        lines.append(b"Content-Length: " + str(len(body)).encode())
+    if b"connection" not in names:
+        lines.append(b"Connection: keep-alive" if keep else b"Connection: close")
+    return b"\r\n".join(lines) + b"\r\n\r\n" + body, keep
+
+async def _send_static_async(writer, plan, head_only: bool, keep: bool):
+    status = plan["status"]
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+             f"Date: {formatdate(usegmt=True)}", "Server: t40",
+             "Connection: keep-alive" if keep else "Connection: close"]
+    lines += [f"{k}: {v}" for k, v in plan["headers"]]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    if not head_only and plan["length"]:
+        with open(plan["path"], "rb") as fh:
+            await asyncio.get_running_loop().sendfile(
+                writer.transport, fh, plan["offset"], plan["length"], fallback=True)
+    await writer.drain()
+
+async def _http_dispatch(method, target, headers, raw, writer, peer, keep) -> bool:
+    path = urlparse(target).path
+    if method in ("GET", "HEAD") and not path.startswith("/api/") and not _is_dynamic_page(path):
+        plan = static_plan(path, headers)
+        if plan:
+            await _send_static_async(writer, plan, method == "HEAD", keep)
+            return keep
+    loop = asyncio.get_running_loop()
+    resp = await loop.run_in_executor(HTTP_STATE["executor"], _run_handler, raw, peer)
+    data, keep = _finish_response(resp, keep, method == "HEAD")
+    writer.write(data)
+    await writer.drain()
+    return keep
+
+async def _sse_stream(writer, headers, head_only: bool):
+    if LIVE.clients >= SSE_MAX_CLIENTS:
+        writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nRetry-After: 5\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+        return
+    writer.write(("HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+                  "Cache-Control: no-store\r\nX-Accel-Buffering: no\r\nConnection: close\r\n"
+                  f"Date: {formatdate(usegmt=True)}\r\n\r\n").encode("latin-1"))
+    if head_only:
+        await writer.drain()
+        return
+    seq = _to_number(headers.get("Last-Event-ID") or "-1", int)
+    seq = -1 if seq is None else seq
+    LIVE.clients += 1
+    try:
+        writer.write(b"retry: 3000\n\n")
+        while not writer.is_closing():
+            ev = LIVE.waiter()
+            frames, seq = LIVE.since(seq)
+            if frames:
+                writer.write(b"".join(frames))
+            await writer.drain()
+            try:
+                await asyncio.wait_for(ev.wait(), SSE_PING)
+            except asyncio.TimeoutError:
+                writer.write(b": ping\n\n")
+    finally:
+        LIVE.clients -= 1
+
+async def _http_connection(reader, writer):
+    peer = writer.get_extra_info("peername") or ("", 0)
+    try:
+        for _ in range(HTTP_KEEPALIVE_MAX):
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HTTP_KEEPALIVE)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                return
+            try:
+                line, _, rest = head.partition(b"\r\n")
+                method, target, version = line.decode("latin-1").split()
+                headers = parse_headers(io.BytesIO(rest))
+                length = int(headers.get("Content-Length") or 0)
+            except Exception:
+                writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                await writer.drain()
+                return
+            if length > HTTP_MAX_BODY:
+                writer.write(b"HTTP/1.1 413 Payload Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                await writer.drain()
+                return
+            body = await reader.readexactly(length) if length else b""
+            conn_hdr = (headers.get("Connection") or "").lower()
+            keep = ("close" not in conn_hdr) if version == "HTTP/1.1" else ("keep-alive" in conn_hdr)
+            if urlparse(target).path == "/api/stream" and method in ("GET", "HEAD"):
+                # long-lived, so it does not take a request slot
+                await _sse_stream(writer, headers, method == "HEAD")
+                return
+            async with HTTP_STATE["slots"]:
+                keep = await _http_dispatch(method, target, headers, head + body, writer, peer, keep)
+            if not keep:
+                return
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        try: writer.close()
+        except Exception: pass
+
+async def _serve_http(port: int, ready: threading.Event):
+    from concurrent.futures import ThreadPoolExecutor
+    HTTP_STATE["loop"] = asyncio.get_running_loop()
+    HTTP_STATE["executor"] = ThreadPoolExecutor(max_workers=HTTP_WORKERS, thread_name_prefix="http")
+    HTTP_STATE["slots"] = asyncio.Semaphore(HTTP_MAX_CONCURRENCY)
+    HTTP_STATE["server"] = await asyncio.start_server(_http_connection, host=None, port=port, reuse_address=True)
+    ready.set()
+    # the loop outlives any one listening socket, see _rebind_http
+    await asyncio.get_running_loop().create_future()
+
+async def _rebind_http(port: int):
+    # new listener first; connections already open on the old one finish normally
+    server = await asyncio.start_server(_http_connection, host=None, port=port, reuse_address=True)
+    old, HTTP_STATE["server"] = HTTP_STATE["server"], server
+    if old is not None:
+        old.close()
+
+def _on_http_port(old, new):
+    loop = HTTP_STATE["loop"]
+    if loop is None:
+        return
+    asyncio.run_coroutine_threadsafe(_rebind_http(new.http_port), loop).result(10)
+    print(f"HTTP server moved to port {new.http_port}")
+
+subscribe_config(_on_http_port, "HTTP_PORT")
+
 def start_server():
     os.chdir(BASE_DIR)
-    httpd = ThreadingHTTPServer(("", HTTP_PORT), Handler)
-    th = threading.Thread(target=httpd.serve_forever, daemon=True)
+    ready = threading.Event()
+    th = threading.Thread(target=lambda: asyncio.run(_serve_http(HTTP_PORT, ready)), daemon=True, name="http")
     th.start()
-    print(f"HTTP server running on port {HTTP_PORT} (dir={BASE_DIR})")
+    ready.wait(5)
+    print(f"HTTP server running on port {HTTP_PORT} (dir={BASE_DIR}, asyncio, max {HTTP_MAX_CONCURRENCY} concurrent)")
+    startup_mark("http ready")
 
 # ---------------- NAV bar ----------------
 def nav_html(active: str) -> str:
@@ -1072,6 +3204,7 @@ def nav_html(active: str) -> str:
         '<div class="links">'
         + li("index.html", t("nav_laikai","Passes"), "laikai")
         + li("galerija.html", t("nav_galerija","Gallery"), "galerija")
+        + li("zemelapis.html", t("nav_zemelapis","Map"), "zemelapis")
         + li("nustatymai.html", t("nav_nustatymai","Settings"), "nustatymai")
         + '</div>'
         f'<div class="navclock"><span class="lbl">{t("nav_local_time","Local time")}:</span> '
@@ -1099,6 +3232,67 @@ def nav_css() -> str:
         ".lang.active{background:#0b640b;border-color:#0b640b;color:#dfffdc}"
     )
 
+# ---------------- Run state (crash recovery) ----------------
+# sekti writes what it is doing to run_state.json at every phase change,
+# synchronously, so a restart knows which pass and directory to pick up.
+def save_run_state(**state):
+    state["updated"] = time.time()
+    try:
+        atomic_write_text(RUN_STATE_JSON, json.dumps(state))
+    except Exception as e:
+        print("[ERR] run state:", e)
+
+def load_run_state():
+    # None when the last pass was finished (or nothing was ever tracked)
+    try:
+        with open(RUN_STATE_JSON, "r", encoding="utf-8") as f:
+            st = json.load(f)
+    except Exception:
+        return None
+    if st.get("phase") in (None, "done") or not st.get("id") or not st.get("pass_dir"):
+        return None
+    return st
+
+def _stop_orphan_satdump(pid):
+    # SatDump outlives a killed parent and keeps the SDR busy
+    try:
+        with open(f"/proc/{int(pid)}/cmdline", "rb") as f:
+            if b"satdump" not in f.read():
+                return
+        os.kill(int(pid), signal.SIGTERM)
+        print(f"[RESUME] stopped orphaned SatDump pid {pid}")
+    except Exception:
+        pass
+
+def resume_interrupted_pass(plan):
+    # returns (pass id, satellite, los) of what was picked up, or None
+    st = load_run_state()
+    if not st:
+        return None
+    pass_id, pav, pass_dir = st["id"], st["satellite"], st["pass_dir"]
+    if st.get("satdump_pid"):
+        _stop_orphan_satdump(st["satdump_pid"])
+
+    ts = plan.ts if plan else load.timescale()
+    at = lambda x: ts.from_datetime(datetime.fromtimestamp(x, timezone.utc))
+    if time.time() >= st["los"]:
+        print(f"[RESUME] {pass_id}: pass is over, finishing its products")
+        _finish_pass(pass_id, pass_dir, pav, at(st["aos"]), at(st["los"]))
+        return pass_id, pav, st["los"]
+
+    sat = next((p[3] for p in (plan.passes if plan else ()) if p[2] == pav), None)
+    if sat is None:
+        l1, l2 = gauti_tle(pav)
+        if not l1 or not l2:
+            print(f"[RESUME] {pass_id}: no TLE for {pav}")
+            save_run_state(phase="done", id=pass_id)
+            return None
+        sat = EarthSatellite(l1, l2, pav, ts)
+    vieta = plan.vieta if plan else wgs84.latlon(latitude_degrees=KOORD_LAT, longitude_degrees=KOORD_LON)
+    print(f"[RESUME] {pass_id}: back on track, products into {pass_dir}")
+    sekti(sat, at(st["aos"]), at(st["los"]), vieta, ts, pav, pass_id=pass_id)
+    return pass_id, pav, st["los"]
+
 # ---------------- Conflict logic and tracking ----------------
 def choose_best_id(candidates, pass_index):
     best_pid = None; best_tuple = None
@@ -1119,10 +3313,11 @@ def find_overlappers(pass_id, pass_index):
             out.append(pid)
     return out
 
-def sekti(sat: EarthSatellite, t1, t2, vieta, ts, pav, ser=None, pass_index=None):
+def sekti(sat: EarthSatellite, t1, t2, vieta, ts, pav, pass_index=None, pass_id=None):
+    # pass_id is given when resuming, so products land in the same directory
     local_start = to_local_naive(t1.utc_datetime())
     local_end = to_local_naive(t2.utc_datetime())
-    pass_id = f"{local_start.strftime('%Y%m%d_%H%M')}_{sanitize_name(pav)}"
+    pass_id = pass_id or f"{local_start.strftime('%Y%m%d_%H%M')}_{sanitize_name(pav)}"
     pass_dir = os.path.join(NUOTRAUKU_KATALOGAS, pass_id)
     os.makedirs(pass_dir, exist_ok=True)
     print(f"Candidate: {pav} {local_start.strftime('%H:%M')} - {local_end.strftime('%H:%M')} -> {pass_id}")
@@ -1145,139 +3340,586 @@ def sekti(sat: EarthSatellite, t1, t2, vieta, ts, pav, ser=None, pass_index=None
 
     t_start = (t1.utc_datetime() - timedelta(seconds=20)).replace(tzinfo=None)
     t_end = t2.utc_datetime().replace(tzinfo=None)
-
+    LIVE.publish("phase", phase="waiting", id=pass_id, satellite=pav,
+                 aos=t1.utc_datetime().timestamp(), los=t2.utc_datetime().timestamp())
+
+    # SatDump timing is fixed for the whole pass; rotor link and tick follow CONFIG
+    cfg = CONFIG
+    run = dict(id=pass_id, satellite=pav, pass_dir=pass_dir, mode=cfg.satdump_mode,
+               aos=t1.utc_datetime().timestamp(), los=t2.utc_datetime().timestamp())
+    save_run_state(phase="waiting", **run)
     satdump_proc = None
-    if SATDUMP_MODE == "start":
-        lead = timedelta(seconds=SATDUMP_LEAD)
+    if cfg.satdump_mode == "start":
+        lead = timedelta(seconds=cfg.satdump_lead)
         while datetime.utcnow() < (t_start - lead):
             time.sleep(0.5)
         satdump_proc = satdump_start(pav, pass_dir)
+        if satdump_proc:
+            run["satdump_pid"] = satdump_proc.pid
 
     while datetime.utcnow() < t_start:
         time.sleep(0.5)
 
     set_current_pass(pass_id)
+    save_run_state(phase="tracking", **run)
     print(f"START: {pass_id}")
+    LIVE.publish("phase", phase="tracking", id=pass_id, satellite=pav,
+                 aos=t1.utc_datetime().timestamp(), los=t2.utc_datetime().timestamp())
 
+    actual = None
+    known = {rel for rel, _ in _iter_pass_images(pass_dir, "")}
+    next_scan = time.time() + LIVE_PRODUCT_SCAN
     while datetime.utcnow() < t_end:
         t = ts.now()
         alt, az, _ = (sat - vieta).at(t).altaz()
+        commanded = None
         if alt.degrees >= 0:
             cmd = f"AZ{az.degrees:06.1f} EL{alt.degrees:05.1f}\r\n"
-            if ser:
-                try: ser.write(cmd.encode("ascii"))
-                except Exception as e: print("Serial write error:", e, "cmd:", cmd.strip())
-            else:
-                print(cmd.strip())
-        time.sleep(UPDATE_INTERVAL)
+            commanded = [round(az.degrees, 1), round(alt.degrees, 1)]
+            _, fb = rotor_send(cmd)
+            actual = fb or actual
+        LIVE.publish("track", id=pass_id, az=round(az.degrees, 2), el=round(alt.degrees, 2),
+                     commanded=commanded, actual=actual,
+                     satdump=(None if satdump_proc is None else ("running" if satdump_proc.poll() is None else "exited")))
+        if time.time() >= next_scan:
+            next_scan = time.time() + LIVE_PRODUCT_SCAN
+            known = _publish_new_products(pass_id, pass_dir, known)
+        time.sleep(CONFIG.update_interval)
 
     print(f"STOP: {pass_id}")
+    save_run_state(phase="post", **run)
 
-    if SATDUMP_MODE == "start":
-        time.sleep(SATDUMP_TAIL)
+    if cfg.satdump_mode == "start":
+        LIVE.publish("phase", phase="tail", id=pass_id, satellite=pav)
+        time.sleep(cfg.satdump_tail)
         satdump_stop(satdump_proc)
-    elif SATDUMP_MODE == "end":
+    elif cfg.satdump_mode == "end":
+        LIVE.publish("phase", phase="decoding", id=pass_id, satellite=pav)
         dekoduoti_satdump(pav, t1, t2, pass_dir)
 
-    generate_thumbs_in_place(pass_dir)
-    rasyti_praejo_meta(pass_dir, pav, local_start, local_end)
-
+    _finish_pass(pass_id, pass_dir, pav, t1, t2, known)
     set_current_pass("")
+    LIVE.publish("phase", phase="idle", id="")
+
+def _finish_pass(pass_id, pass_dir, pav, t1, t2, known=frozenset()):
+    LIVE.publish("phase", phase="thumbs", id=pass_id, satellite=pav)
+    os.makedirs(pass_dir, exist_ok=True)
+    thumb_stats = generate_thumbs_in_place(pass_dir)
+    rasyti_praejo_meta(pass_dir, pav, to_local_naive(t1.utc_datetime()), to_local_naive(t2.utc_datetime()),
+                       thumbs=thumb_stats)
+    gallery_index_update(pass_dir)
+    _publish_new_products(pass_id, pass_dir, known)
+    save_run_state(phase="done", id=pass_id)
 
 # ---------------- HTML generation ----------------
-def write_gallery_page(passes):
-    with open(os.path.join(BASE_DIR, "galerija.html"), "w", encoding="utf-8") as f:
-        f.write("<html><head><meta charset='UTF-8'><style>")
-        f.write("body{background:#111;color:#eee;font-family:sans-serif;text-align:center;}")
-        f.write(nav_css())
-        f.write("h2{text-align:center;margin:20px 0 12px;}")
-        f.write(".grid{display:grid;grid-template-columns:repeat(auto-fill,minmax(320px,1fr));gap:16px;width:95%;margin:20px auto;}")
-        f.write(".card{background:#1b1b1b;border:1px solid #333;border-radius:8px;overflow:hidden;box-shadow:0 2px 10px rgba(0,0,0,.3);}")
-        f.write(".thumbwrap{width:100%;height:300px;display:block;overflow:hidden;background:#000;}")
-        f.write(".thumbwrap img{width:100%;height:100%;object-fit:cover;display:block;}")
-        f.write(".meta{padding:10px 12px;font-size:14px;color:#ddd;}")
-        f.write(".meta .title{font-weight:600;color:#fff;margin-bottom:4px;text-align:center;}")
-        f.write(".meta .time{opacity:.8;text-align:center;}")
-        f.write("a{color:#0f0;text-decoration:none}")
-        f.write("</style>")
-        f.write("<script>document.addEventListener('DOMContentLoaded',()=>{"
-                "const tick=()=>{const e=document.getElementById('nav-clock'); if(e){e.textContent=new Date().toLocaleTimeString();}};"
-                "tick(); setInterval(tick,1000);"
-                "});</script></head><body>")
-        f.write(nav_html("galerija"))
-        f.write(f"<h2>{t('gallery_title','Gallery')}</h2>")
-        f.write("<div class='grid'>")
-        for p in passes:
-            thumb_rel = None
-            if p["thumbs"]:
-                thumb_rel = p["thumbs"][0]
-            elif p["images"]:
-                thumb_rel = p["images"][0]
-            if not thumb_rel:
-                continue
-            thumb_rel = os.path.relpath(thumb_rel, BASE_DIR).replace("\\", "/")
-            sat = (p["meta"] or {}).get("satellite", p["name"].split("_", 1)[-1])
-            start_local_str = (p["meta"] or {}).get("start_local", "")
-            pass_page = f"pass-{p['name']}.html"
-            f.write("<div class='card'>")
-            f.write(f"<a class='thumbwrap' href='{pass_page}'><img src='{thumb_rel}' alt='thumb'></a>")
-            f.write("<div class='meta'>")
-            f.write(f"<div class='title'>{sat}</div>")
-            if start_local_str:
-                try:
-                    dt = datetime.fromisoformat(start_local_str)
-                    f.write(f"<div class='time'>{dt.strftime('%Y-%m-%d %H:%M')}</div>")
-                except Exception:
-                    f.write(f"<div class='time'>{start_local_str}</div>")
-            f.write("</div></div>")
-        f.write("</div></body></html>")
-
-def write_settings_page():
-    with open(os.path.join(BASE_DIR, "nustatymai.html"), "w", encoding="utf-8") as f:
-        f.write("<html><head><meta charset='UTF-8'><style>")
-        f.write("body{background:#111;color:#eee;font-family:sans-serif;}")
-        f.write(nav_css())
-        f.write("h2{text-align:center;margin:20px 0 12px;}")
-        f.write("form{width:90%;max-width:900px;margin:10px auto 24px;background:#1b1b1b;border:1px solid #333;border-radius:10px;padding:16px;}")
-        f.write(".row{display:grid;grid-template-columns:1fr 2fr;gap:10px;margin-bottom:10px;align-items:center;}")
-        f.write(".row label{color:#ccc;}")
-        f.write(".row input, .row textarea, .row select{width:100%;padding:8px 10px;border:1px solid #444;border-radius:6px;background:#111;color:#eee;}")
-        f.write(".hint{color:#aaa;font-size:12px;margin-top:-6px;margin-bottom:12px;}")
-        f.write(".actions{display:flex;gap:10px;justify-content:flex-start;margin-top:12px;flex-wrap:wrap}")
-        f.write(".btn{padding:10px 14px;border-radius:8px;border:1px solid #0b640b;background:#0b640b;color:#dfffdc;cursor:pointer;font-weight:700;}")
-        f.write(".btn.secondary{border-color:#444;background:#222;color:#eee}")
-        f.write(".btn.confirm{border-color:#0b640b;background:#0b640b;color:#dfffdc;}")
-        f.write(".note{width:90%;max-width:900px;margin:0 auto;color:#bbb;}")
-        f.write(".panel{width:90%;max-width:900px;margin:0 auto 24px;background:#1b1b1b;border:1px solid #333;border-radius:10px;padding:16px;}")
-        f.write(".panel h3{margin:0 0 12px 0;}")
-        f.write(".sat-grid{display:grid;grid-template-columns:1fr 1fr;gap:16px;}")
-        f.write(".listbox{border:1px solid #333;background:#111;border-radius:8px;min-height:220px;max-height:340px;overflow:auto;padding:8px;}")
-        f.write(".item{display:flex;justify-content:space-between;align-items:center;padding:6px 8px;border-bottom:1px solid #222;}")
-        f.write(".item:last-child{border-bottom:none}")
-        f.write(".item .name{color:#eee;font-size:14px;}")
-        f.write(".item button{border:1px solid #444;background:#222;color:#eee;border-radius:6px;padding:4px 8px;cursor:pointer}")
-        f.write(".item button:hover{background:#333}")
-        f.write(".searchbar{display:flex;gap:8px;margin-bottom:10px}")
-        f.write(".searchbar input{flex:1}")
-        f.write("a{color:#0f0;text-decoration:none}")
-        f.write("</style>")
-        f.write("<script>")
-        f.write("const STR_SAVED="+json.dumps(t("saved_alert","Settings saved. Some changes apply after script restart."))+";")
-        f.write("const STR_SAVEERR="+json.dumps(t("save_err_alert","Failed to save settings."))+";")
-        f.write("const STR_REPLAN_PROC="+json.dumps(t("replan_processing","Replanning..."))+";")
-        f.write("const STR_REPLAN_DONE="+json.dumps(t("replan_done","Replanned"))+";")
-        f.write("const STR_REPLAN_ERR="+json.dumps(t("replan_error","Error"))+";")
-        f.write("const STR_REPLAN_NOTE="+json.dumps(t("replan_note","Open the Passes page."))+";")
-        f.write("const STR_LIST_EMPTY="+json.dumps(t("list_empty","List is empty"))+";")
-        f.write("const STR_NO_MATCHES="+json.dumps(t("no_matches","No matches"))+";")
-        f.write("const STR_CLEAN_DONE="+json.dumps(t("cleanup_done","Deleted folders: {n}"))+";")
-        f.write("const STR_BTN_ADD="+json.dumps(t("btn_add","Add"))+";")
-        f.write("const STR_BTN_REMOVE="+json.dumps(t("btn_remove","Remove"))+";")
-        f.write(r"""
+CARD_SIZES = "(max-width:700px) 95vw, 340px"
+ITEM_SIZES = "(max-width:700px) 95vw, 480px"
+
+# Deep-zoom viewer: draws the already-loaded preview as a backdrop, then only
+# the DZI tiles that intersect the screen at the level matching the zoom.
+DEEPZOOM_JS = r"""
+function openDeepZoom(a){
+  const z=document.getElementById('zoom'), c=document.getElementById('zoom-canvas'), ctx=c.getContext('2d');
+  const W=+a.dataset.w, H=+a.dataset.h, TS=+a.dataset.ts, base=a.dataset.dzi, fmt=a.dataset.fmt;
+  const maxL=Math.ceil(Math.log2(Math.max(W,H)));
+  const back=a.querySelector('img'); const cache=new Map();
+  let s=1, ox=0, oy=0, drag=null;
+  function fit(){ c.width=innerWidth; c.height=innerHeight; s=Math.min(c.width/W,c.height/H); ox=(c.width-W*s)/2; oy=(c.height-H*s)/2; }
+  function tile(l,x,y){ const k=l+'/'+x+'_'+y; let im=cache.get(k); if(!im){ im=new Image(); im.onload=draw; im.src=base+'/'+k+'.'+fmt; cache.set(k,im); } return im; }
+  function draw(){
+    ctx.fillStyle='#000'; ctx.fillRect(0,0,c.width,c.height);
+    if(back && back.complete){ ctx.drawImage(back,ox,oy,W*s,H*s); }
+    const l=Math.max(0,Math.min(maxL,maxL+Math.ceil(Math.log2(s*(window.devicePixelRatio||1)))));
+    const f=Math.pow(2,l-maxL), lw=Math.ceil(W*f), lh=Math.ceil(H*f);
+    const x0=Math.max(0,Math.floor((-ox/s)*f/TS)), x1=Math.min(Math.ceil(lw/TS)-1,Math.floor(((c.width-ox)/s)*f/TS));
+    const y0=Math.max(0,Math.floor((-oy/s)*f/TS)), y1=Math.min(Math.ceil(lh/TS)-1,Math.floor(((c.height-oy)/s)*f/TS));
+    for(let y=y0;y<=y1;y++) for(let x=x0;x<=x1;x++){
+      const im=tile(l,x,y);
+      if(im.complete && im.naturalWidth){ ctx.drawImage(im,ox+x*TS/f*s,oy+y*TS/f*s,im.naturalWidth/f*s,im.naturalHeight/f*s); }
+    }
+  }
+  c.onwheel=e=>{ e.preventDefault(); const k=e.deltaY<0?1.25:0.8; ox=e.offsetX-(e.offsetX-ox)*k; oy=e.offsetY-(e.offsetY-oy)*k; s*=k; draw(); };
+  c.onpointerdown=e=>{ drag=[e.clientX-ox,e.clientY-oy]; c.setPointerCapture(e.pointerId); };
+  c.onpointermove=e=>{ if(drag){ ox=e.clientX-drag[0]; oy=e.clientY-drag[1]; draw(); } };
+  c.onpointerup=()=>{ drag=null; };
+  c.ondblclick=e=>{ c.onwheel({preventDefault(){},deltaY:-1,offsetX:e.offsetX,offsetY:e.offsetY}); c.onwheel({preventDefault(){},deltaY:-1,offsetX:e.offsetX,offsetY:e.offsetY}); };
+  z.classList.add('show'); fit(); draw();
+  window.onresize=()=>{ fit(); draw(); };
+}
+function closeDeepZoom(){ document.getElementById('zoom').classList.remove('show'); window.onresize=null; }
+"""
+
+def _rel(path):
+    return os.path.relpath(path, BASE_DIR).replace("\\", "/")
+
+def _deriv_rel(p, fn, variant):
+    d = (p.get("derivs") or {}).get(fn)
+    if not d or variant not in d:
+        return None
+    return _rel(os.path.join(p["dir"], "_derivs", variant, f"{fn}.{d['ext']}"))
+
+def _srcset(p, fn, variants):
+    d = (p.get("derivs") or {}).get(fn) or {}
+    parts = []
+    for v in variants:
+        if v in d:
+            parts.append(f"{_deriv_rel(p, fn, v)} {d[v][0]}w")
+    return ", ".join(parts)
+
+def card_info(p):
+    cover = p["thumbs"][0] if p["thumbs"] else (p["images"][0] if p["images"] else None)
+    if not cover:
+        return None
+    fn = os.path.basename(cover)
+    start_local_str = (p["meta"] or {}).get("start_local", "")
+    when = start_local_str
+    if start_local_str:
+        try: when = datetime.fromisoformat(start_local_str).strftime('%Y-%m-%d %H:%M')
+        except Exception: pass
+    return {
+        "name": p["name"],
+        "page": f"pass-{p['name']}.html",
+        "src": _deriv_rel(p, fn, "thumb") or _rel(cover),
+        "srcset": _srcset(p, fn, ("thumb", "preview")),
+        "satellite": (p["meta"] or {}).get("satellite", p["name"].split("_", 1)[-1]),
+        "start_local": start_local_str,
+        "time": when,
+    }
+
+def _card_html(p):
+    c = card_info(p)
+    if not c:
+        return ""
+    srcset_attr = f" srcset='{c['srcset']}' sizes='{CARD_SIZES}'" if c["srcset"] else ""
+    out = ["<div class='card'>"]
+    out.append(f"<a class='thumbwrap' href='{c['page']}'><img src='{c['src']}'{srcset_attr} loading='lazy' decoding='async' alt='thumb'></a>")
+    out.append("<div class='meta'>")
+    out.append(f"<div class='title'>{c['satellite']}</div>")
+    if c["time"]:
+        out.append(f"<div class='time'>{c['time']}</div>")
+    out.append("</div></div>")
+    return "".join(out)
+
+# HTML pages are rendered per request (Handler._try_dynamic_page); only the
+# shared assets are written to disk, and only when their bytes change
+# (PAGE_HASHES), through temp + rename.
+PAGES_LOCK = threading.RLock()
+PAGE_HASHES = {}
+STATIC_PAGES = ("index.html", "galerija.html", "nustatymai.html", "zemelapis.html")
+
+def _digest(obj) -> str:
+    if not isinstance(obj, str):
+        obj = json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(obj.encode("utf-8")).hexdigest()
+
+def _publish_page(fname: str, text: str) -> bool:
+    path = os.path.join(BASE_DIR, fname)
+    h = _digest(text)
+    if PAGE_HASHES.get(fname) == h and os.path.isfile(path) and os.path.isfile(path + ".gz"):
+        return False
+    data = text.encode("utf-8")
+    # precompressed siblings first, then stamped with the page mtime: a
+    # sibling older than its page is ignored by static_plan, never served stale
+    siblings = [(".gz", gzip.compress(data, 9))]
+    if brotli is not None:
+        siblings.append((".br", brotli.compress(data)))
+    for suffix, blob in siblings:
+        atomic_write_bytes(path + suffix, blob)
+    atomic_write_bytes(path, data)
+    st = os.stat(path)
+    for suffix, _ in siblings:
+        try: os.utime(path + suffix, ns=(st.st_atime_ns, st.st_mtime_ns))
+        except OSError: pass
+    PAGE_HASHES[fname] = h
+    return True
+
+def drop_static_pages():
+    # older versions wrote every page into BASE_DIR; static_plan would keep
+    # serving those copies for anything the dynamic routes decline (a deleted
+    # pass, the index before the first plan)
+    n = 0
+    try:
+        entries = list(os.scandir(BASE_DIR))
+    except OSError:
+        return 0
+    for e in entries:
+        base = e.name[:-3] if e.name.endswith((".gz", ".br")) else e.name
+        if base in STATIC_PAGES or (base.startswith("pass-") and base.endswith(".html")):
+            try:
+                os.remove(e.path); n += 1
+            except OSError:
+                pass
+    try: os.remove(os.path.join(BASE_DIR, "pages_state.json"))
+    except OSError: pass
+    if n:
+        print(f"[PAGES] removed {n} pre-rendered page file(s)")
+    return n
+
+# Plan chart: elevation curves of the planned passes drawn as SVG from
+# /api/plan. Wheel zooms the time axis, drag pans, double click resets.
+PLAN_CHART_JS = r"""
+(function(){
+  const NS='http://www.w3.org/2000/svg';
+  let data=null, d0=0, d1=1, full=[0,1], drag=null;
+  function el(tag,attrs,parent){ const e=document.createElementNS(NS,tag); for(const k in attrs) e.setAttribute(k,attrs[k]); if(parent) parent.appendChild(e); return e; }
+  function hue(s){ let h=0; for(const c of s) h=(h*31+c.charCodeAt(0))%360; return h; }
+  function hm(t){ return new Date(t*1000).toLocaleTimeString([], {hour:'2-digit',minute:'2-digit'}); }
+  function draw(){
+    const box=document.getElementById('plan-chart'); if(!box||!data) return;
+    box.textContent='';
+    if(!data.passes.length){ box.textContent=STR_PLAN_EMPTY; return; }
+    const W=box.clientWidth||800, H=260, L=34, R=8, T=10, B=22;
+    const x=t=>L+(t-d0)/(d1-d0)*(W-L-R), y=e=>T+(1-Math.max(0,e)/90)*(H-T-B);
+    const svg=el('svg',{width:W,height:H,viewBox:'0 0 '+W+' '+H},box);
+    for(const e of [0,30,60,90]){
+      el('line',{x1:L,x2:W-R,y1:y(e),y2:y(e),stroke:'#333'},svg);
+      el('text',{x:L-4,y:y(e)+4,'text-anchor':'end',fill:'#888','font-size':10},svg).textContent=e+'\u00b0';
+    }
+    const step=[600,1800,3600,7200,10800,21600].find(s=>(d1-d0)/s<=12)||43200;
+    for(let t=Math.ceil(d0/step)*step; t<=d1; t+=step){
+      el('line',{x1:x(t),x2:x(t),y1:T,y2:H-B,stroke:'#262626'},svg);
+      el('text',{x:x(t),y:H-6,'text-anchor':'middle',fill:'#aaa','font-size':10},svg).textContent=hm(t);
+    }
+    const clip=el('clipPath',{id:'plan-clip'},el('defs',{},svg));
+    el('rect',{x:L,y:0,width:W-L-R,height:H},clip);
+    const area=el('g',{'clip-path':'url(#plan-clip)'},svg);
+    for(const p of data.passes){
+      if(p.los<d0||p.aos>d1||p.el.length<2) continue;
+      const dt=(p.los-p.aos)/(p.el.length-1), c='hsl('+hue(p.sat)+',70%,55%)';
+      let d='M'+x(p.aos).toFixed(1)+','+y(0);
+      p.el.forEach((e,i)=>{ d+='L'+x(p.aos+i*dt).toFixed(1)+','+y(e).toFixed(1); });
+      d+='L'+x(p.los).toFixed(1)+','+y(0)+'Z';
+      const g=el('g',{},area);
+      el('path',{d:d,fill:c,'fill-opacity':.25,stroke:c},g);
+      el('title',{},g).textContent=p.sat+'\n'+hm(p.aos)+' - '+hm(p.los)+'\n'+p.max.toFixed(1)+'\u00b0';
+      const X=x(p.tmax), Y=y(0)-3;
+      el('text',{x:X,y:Y,fill:c,'font-size':10,transform:'rotate(-90 '+X+' '+Y+')'},g).textContent=hm(p.aos)+' '+p.sat+' '+Math.round(p.max)+'\u00b0';
+    }
+    const now=Date.now()/1000;
+    if(now>d0&&now<d1) el('line',{x1:x(now),x2:x(now),y1:T,y2:H-B,stroke:'#0f0','stroke-dasharray':'3 3'},svg);
+  }
+  async function load(){
+    try{
+      const j=await (await fetch('/api/plan',{cache:'no-cache'})).json();
+      const first=!data || data.v!==j.v; data=j;
+      if(first && j.passes.length){
+        full=[Math.min(Date.now()/1000, j.passes[0].aos)-600, Math.max(...j.passes.map(p=>p.los))+600];
+        [d0,d1]=full;
+      }
+      draw();
+    }catch(e){}
+  }
+  document.addEventListener('DOMContentLoaded',()=>{
+    const box=document.getElementById('plan-chart'); if(!box) return;
+    box.addEventListener('wheel',e=>{
+      e.preventDefault();
+      const r=box.getBoundingClientRect(), L=34, f=Math.min(1,Math.max(0,(e.clientX-r.left-L)/(r.width-L-8)));
+      const k=e.deltaY<0?0.8:1.25, span=Math.max(600,(d1-d0)*k), piv=d0+(d1-d0)*f;
+      d0=piv-span*f; d1=d0+span; draw();
+    },{passive:false});
+    box.addEventListener('pointerdown',e=>{ drag=[e.clientX,d0,d1]; box.setPointerCapture(e.pointerId); });
+    box.addEventListener('pointermove',e=>{ if(!drag) return; const dt=(drag[0]-e.clientX)/(box.clientWidth-42)*(drag[2]-drag[1]); d0=drag[1]+dt; d1=drag[2]+dt; draw(); });
+    box.addEventListener('pointerup',()=>{ drag=null; });
+    box.addEventListener('dblclick',()=>{ [d0,d1]=full; draw(); });
+    window.addEventListener('resize',draw);
+    load(); setInterval(load,60000); setInterval(draw,30000);
+  });
+})();
+"""
+
+GALLERY_JS = r"""
+document.addEventListener('DOMContentLoaded',()=>{
+  const grid=document.getElementById('gal-grid'), sentinel=document.getElementById('gal-more');
+  if(!grid) return;
+  const fSat=document.getElementById('f-sat'), fFrom=document.getElementById('f-from'), fTo=document.getElementById('f-to');
+  let next=GAL_NEXT, busy=false;
+  function card(c){
+    const d=document.createElement('div'); d.className='card';
+    const a=document.createElement('a'); a.className='thumbwrap'; a.href=c.page;
+    const im=document.createElement('img'); im.src=c.src; im.alt='thumb'; im.loading='lazy'; im.decoding='async';
+    if(c.srcset){ im.srcset=c.srcset; im.sizes=GAL_SIZES; }
+    a.appendChild(im); d.appendChild(a);
+    const m=document.createElement('div'); m.className='meta';
+    const ti=document.createElement('div'); ti.className='title'; ti.textContent=c.satellite; m.appendChild(ti);
+    if(c.time){ const tm=document.createElement('div'); tm.className='time'; tm.textContent=c.time; m.appendChild(tm); }
+    d.appendChild(m); return d;
+  }
+  async function more(){
+    if(busy || next===null) return;
+    busy=true;
+    const q=new URLSearchParams({limit:String(GAL_LIMIT)});
+    if(next) q.set('cursor',next);
+    if(fSat.value) q.set('sat',fSat.value);
+    if(fFrom.value) q.set('from',fFrom.value);
+    if(fTo.value) q.set('to',fTo.value);
+    try{
+      const j=await (await fetch('/api/gallery?'+q.toString(),{cache:'no-store'})).json();
+      (j.items||[]).forEach(c=>grid.appendChild(card(c)));
+      next=j.next||null;
+    }catch(e){}
+    busy=false;
+    if(next!==null && sentinel.getBoundingClientRect().top<innerHeight+600) more();
+  }
+  function reset(){ grid.innerHTML=''; next=''; more(); }
+  [fSat,fFrom,fTo].forEach(el=>el.addEventListener('change',reset));
+  new IntersectionObserver(es=>{ if(es.some(e=>e.isIntersecting)) more(); },{rootMargin:'600px'}).observe(sentinel);
+});
+"""
+
+# ---------------- Shared assets ----------------
+# CSS/JS common to all pages, served as assets/app.<hash>.css|js with an
+# immutable cache header; pages only carry their own small bits inline.
+ASSETS_DIR = os.path.join(BASE_DIR, "assets")
+ASSET_RE = re.compile(r"^app\.[0-9a-f]{12}\.(css|js)$")
+_assets = {}
+
+APP_CSS = (
+    "body{background:#111;color:#eee;font-family:sans-serif;}"
+    "a{color:#0f0;text-decoration:none}"
+    "h2{text-align:center;margin:20px 0 12px;}"
+    ".grid{display:grid;grid-template-columns:repeat(auto-fill,minmax(320px,1fr));gap:16px;width:95%;margin:20px auto;}"
+    ".card{background:#1b1b1b;border:1px solid #333;border-radius:8px;overflow:hidden;box-shadow:0 2px 10px rgba(0,0,0,.3);}"
+    ".thumbwrap{width:100%;height:300px;display:block;overflow:hidden;background:#000;}"
+    ".thumbwrap img{width:100%;height:100%;object-fit:cover;display:block;}"
+    ".meta{padding:10px 12px;font-size:14px;color:#ddd;}"
+    ".meta .title{font-weight:600;color:#fff;margin-bottom:4px;text-align:center;}"
+    ".meta .time{opacity:.8;text-align:center;}"
+    ".filters{display:flex;gap:10px;justify-content:center;flex-wrap:wrap;}"
+    ".filters select,.filters input{padding:6px 8px;border:1px solid #444;border-radius:6px;background:#111;color:#eee;}"
+    ".more{height:1px;}"
+    ".live{display:inline-flex;gap:14px;flex-wrap:wrap;justify-content:center;background:#1b1b1b;border:1px solid #333;border-radius:8px;padding:6px 12px;margin:4px auto 10px;font-family:monospace;font-size:13px;}"
+    ".live .k{color:#9f9;opacity:.85;margin-right:4px;}"
+    ".chart{width:95%;margin:10px auto;background:#161616;border:1px solid #333;border-radius:8px;touch-action:none;user-select:none;min-height:40px;}"
+    "#map{position:relative;width:95%;margin:14px auto;border:1px solid #333;border-radius:8px;overflow:hidden;}"
+    ".map-attr{position:absolute;right:0;bottom:0;padding:1px 6px;font-size:11px;background:rgba(0,0,0,.6);color:#ccc;border-top-left-radius:4px;}"
+    ".map-attr a{color:#9cf;}"
+    ".wrap{width:95%;margin:12px auto 20px;text-align:center;}"
+    ".wrap .title{font-size:22px;font-weight:700;margin:8px 0 2px;}"
+    ".wrap .time{opacity:.85;margin-bottom:16px;}"
+    ".wrap .grid{width:auto;margin:0;}"
+    ".wrap .item{background:#1b1b1b;border:1px solid #333;border-radius:8px;overflow:hidden;}"
+    ".wrap .item img{width:100%;height:auto;display:block;cursor:zoom-in;}"
+    ".wrap .item .orig{display:block;padding:6px;font-size:12px;opacity:.8;}"
+    ".skyplot{width:320px;max-width:90%;margin:0 auto 16px;display:block;border:1px solid #333;border-radius:8px;}"
+    ".viewer{position:fixed;inset:0;background:rgba(0,0,0,.92);display:none;align-items:center;justify-content:center;z-index:9999;}"
+    ".viewer.show{display:flex;}"
+    ".viewer img{max-width:95%;max-height:95%;box-shadow:0 0 24px rgba(0,0,0,.8);}"
+    ".viewer .close{position:absolute;top:14px;right:22px;font-size:20px;cursor:pointer;color:#fff;opacity:.9}"
+    ".zoom{position:fixed;inset:0;background:#000;display:none;z-index:10000;}"
+    ".zoom.show{display:block;}"
+    ".zoom canvas{display:block;cursor:grab;touch-action:none;}"
+    ".zoom .close{position:absolute;top:14px;right:22px;font-size:20px;cursor:pointer;color:#fff;opacity:.9}"
+)
+
+# clock, lightbox and live strip; the page scripts below guard on their elements
+COMMON_JS = r"""
 document.addEventListener('DOMContentLoaded',()=>{
-  const tick=()=>{const el=document.getElementById('nav-clock'); if(el){el.textContent=new Date().toLocaleTimeString();}};
+  const tick=()=>{const e=document.getElementById('nav-clock'); if(e){e.textContent=new Date().toLocaleTimeString();}};
   tick(); setInterval(tick,1000);
+  const v=document.getElementById('viewer'), vi=document.getElementById('viewer-img');
+  if(!v) return;
+  function show(src){vi.src=src;v.classList.add('show');}
+  function hide(){v.classList.remove('show');vi.src='';}
+  document.querySelectorAll('a.img-link').forEach(a=>{
+    a.addEventListener('click',e=>{e.preventDefault();if(a.dataset.dzi){openDeepZoom(a);}else{show(a.getAttribute('href'));}});
+  });
+  v.addEventListener('click',hide);
+  document.querySelector('#zoom .close').addEventListener('click',closeDeepZoom);
+  document.addEventListener('keydown',e=>{if(e.key==='Escape'){hide();closeDeepZoom();}});
+});
+function fmtPos(p){return p?p[0].toFixed(1)+'/'+p[1].toFixed(1):'-';}
+function markTracking(id){document.querySelectorAll('tr[data-id]').forEach(tr=>{tr.classList.toggle('tracking',tr.dataset.id===id);});}
+function startLive(){
+  const es=new EventSource('/api/stream'); const $=id=>document.getElementById(id);
+  es.addEventListener('phase',e=>{const j=JSON.parse(e.data);$('live-phase').textContent=j.phase==='idle'?STR_LIVE_IDLE:j.phase;$('live-pass').textContent=j.satellite||'-';markTracking(j.phase==='tracking'?j.id:'');});
+  es.addEventListener('track',e=>{const j=JSON.parse(e.data);$('live-azel').textContent=j.az.toFixed(1)+'/'+j.el.toFixed(1);$('live-cmd').textContent=fmtPos(j.commanded);$('live-act').textContent=fmtPos(j.actual);if(j.satdump)$('live-sd').textContent=j.satdump;});
+  es.addEventListener('satdump',e=>{$('live-sd').textContent=JSON.parse(e.data).state;});
+  es.addEventListener('product',e=>{const j=JSON.parse(e.data);const a=$('live-prod');a.textContent=j.file;a.href=j.url;});
+}
+"""
 
+def app_assets():
+    # writes the current assets once per process; returns their URLs
+    if _assets:
+        return _assets
+    with PAGES_LOCK:
+        if _assets:
+            return _assets
+        os.makedirs(ASSETS_DIR, exist_ok=True)
+        out, keep = {}, set()
+        for kind, text in (("css", nav_css() + APP_CSS),
+                           ("js", COMMON_JS + DEEPZOOM_JS + PLAN_CHART_JS + GALLERY_JS + MAP_JS)):
+            name = f"app.{_digest(text)[:12]}.{kind}"
+            _publish_page(f"assets/{name}", text)
+            out[kind] = f"/assets/{name}"
+            keep.update({name, name + ".gz", name + ".br"})
+        for e in os.scandir(ASSETS_DIR):
+            if e.name.startswith("app.") and e.name not in keep:
+                try: os.remove(e.path)
+                except OSError: pass
+        _assets.update(out)
+    return _assets
+
+def asset_tags():
+    a = app_assets()
+    return f"<link rel='stylesheet' href='{a['css']}'><script src='{a['js']}' defer></script>"
+
+def _is_asset(full: str) -> bool:
+    return os.path.dirname(full) == os.path.realpath(ASSETS_DIR) and bool(ASSET_RE.match(os.path.basename(full)))
+
+def render_gallery_page():
+    # first page only; the rest is fetched from /api/gallery while scrolling
+    passes, nxt = gallery_query(limit=GALLERY_PAGE_SIZE)
+    sats = gallery_satellites()
+    f = io.StringIO()
+    f.write("<html><head><meta charset='UTF-8'>")
+    f.write(asset_tags())
+    f.write("<style>body{text-align:center;}</style>")
+    f.write(f"<script>const GAL_NEXT={json.dumps(nxt)};const GAL_LIMIT={GALLERY_PAGE_SIZE};const GAL_SIZES={json.dumps(CARD_SIZES)};")
+    f.write("</script></head><body>")
+    f.write(nav_html("galerija"))
+    f.write(f"<h2>{t('gallery_title','Gallery')}</h2>")
+    f.write("<div class='filters'>")
+    f.write(f"<select id='f-sat'><option value=''>{t('filter_all_sats','All satellites')}</option>")
+    for name in sats:
+        f.write(f"<option value='{name}'>{name}</option>")
+    f.write("</select>")
+    f.write(f"<label>{t('filter_from','From')} <input type='date' id='f-from'></label>")
+    f.write(f"<label>{t('filter_to','To')} <input type='date' id='f-to'></label>")
+    f.write("</div>")
+    f.write("<div class='grid' id='gal-grid'>")
+    for p in passes:
+        f.write(_card_html(p))
+    f.write("</div><div id='gal-more' class='more'></div></body></html>")
+    return f.getvalue()
+
+# Map page: Web Mercator SVG, optional raster tiles underneath, data from /api/map.
+MAP_JS = r"""
+(function(){
+  const NS='http://www.w3.org/2000/svg', TS=256;
+  const mx=(lon,z)=>(lon+180)/360*TS*Math.pow(2,z);
+  const my=(lat,z)=>{ const s=Math.sin(Math.max(-85,Math.min(85,lat))*Math.PI/180); return (0.5-Math.log((1+s)/(1-s))/(4*Math.PI))*TS*Math.pow(2,z); };
+  function el(tag,attrs,parent){ const e=document.createElementNS(NS,tag); for(const k in attrs) e.setAttribute(k,attrs[k]); if(parent) parent.appendChild(e); return e; }
+  function hue(s){ let h=0; for(const c of s) h=(h*31+c.charCodeAt(0))%360; return h; }
+  function hm(t){ return new Date(t*1000).toLocaleTimeString([], {hour:'2-digit',minute:'2-digit'}); }
+  let data=null;
+  function draw(){
+    const box=document.getElementById('map'); if(!box||!data) return;
+    box.textContent='';
+    const W=box.clientWidth||800, H=Math.max(320,Math.round(W*0.62));
+    const st=data.features.find(f=>f.properties.kind==='station').geometry.coordinates;
+    let lo0=st[0]-15, lo1=st[0]+15, la0=st[1]-10, la1=st[1]+10;
+    data.features.forEach(f=>{ if(f.properties.kind!=='footprint') return;
+      f.geometry.coordinates[0].forEach(([x,y])=>{ lo0=Math.min(lo0,x); lo1=Math.max(lo1,x); la0=Math.min(la0,y); la1=Math.max(la1,y); }); });
+    let z=1; while(z<10 && mx(lo1,z+1)-mx(lo0,z+1)<=W && my(la0,z+1)-my(la1,z+1)<=H) z++;
+    const ox=(mx(lo0,z)+mx(lo1,z))/2-W/2, oy=(my(la0,z)+my(la1,z))/2-H/2;
+    const P=c=>(mx(c[0],z)-ox).toFixed(1)+','+(my(c[1],z)-oy).toFixed(1);
+    const svg=el('svg',{width:W,height:H,viewBox:'0 0 '+W+' '+H},box);
+    el('rect',{width:W,height:H,fill:'#0d1a26'},svg);
+    if(MAP_TILES){
+      const n=Math.pow(2,z);
+      for(let ty=Math.max(0,Math.floor(oy/TS)); ty<=Math.min(n-1,Math.floor((oy+H)/TS)); ty++)
+        for(let tx=Math.floor(ox/TS); tx<=Math.floor((ox+W)/TS); tx++){
+          const im=el('image',{x:tx*TS-ox,y:ty*TS-oy,width:TS,height:TS,opacity:.55},svg);
+          im.setAttribute('href',MAP_TILES.replace('{z}',z).replace('{x}',((tx%n)+n)%n).replace('{y}',ty));
+        }
+    }
+    for(let g=-180; g<=180; g+=10){ el('path',{d:'M'+P([g,-85])+'L'+P([g,85]),stroke:'#2a3a4a','stroke-width':.6},svg); }
+    for(let g=-80; g<=80; g+=10){ el('path',{d:'M'+P([-180,g])+'L'+P([180,g]),stroke:'#2a3a4a','stroke-width':.6},svg); }
+    data.features.forEach(f=>{
+      const p=f.properties; if(p.kind==='station') return;
+      const c='hsl('+hue(p.sat)+',75%,60%)';
+      if(p.kind==='footprint'){
+        const g=el('path',{d:'M'+f.geometry.coordinates[0].map(P).join('L')+'Z',fill:c,'fill-opacity':.06,stroke:c,'stroke-dasharray':'4 3'},svg);
+        el('title',{},g).textContent=p.sat+' ~'+p.alt_km+' km';
+        return;
+      }
+      const vis=p.kind==='visible';
+      f.geometry.coordinates.forEach(line=>{
+        const g=el('path',{d:'M'+line.map(P).join('L'),fill:'none',stroke:c,'stroke-width':vis?2.5:1,'stroke-opacity':vis?1:.45},svg);
+        el('title',{},g).textContent=p.sat+'\n'+hm(p.aos)+' - '+hm(p.los)+'\n'+p.max.toFixed(1)+'\u00b0';
+      });
+      if(vis){
+        const a=f.geometry.coordinates[0][0], xy=P(a).split(',');
+        el('circle',{cx:xy[0],cy:xy[1],r:3,fill:c},svg);
+        el('text',{x:+xy[0]+5,y:+xy[1]-4,fill:c,'font-size':11},svg).textContent=hm(p.aos)+' '+p.sat;
+      }
+    });
+    const s=P(st).split(',');
+    el('circle',{cx:s[0],cy:s[1],r:5,fill:'#0f0',stroke:'#000'},svg);
+    if(MAP_TILES && MAP_ATTR){
+      const a=document.createElement('div'); a.className='map-attr'; a.innerHTML=MAP_ATTR; box.appendChild(a);
+    }
+  }
+  async function load(){
+    try{ data=await (await fetch('/api/map?n='+document.getElementById('map-n').value,{cache:'no-cache'})).json(); draw(); }catch(e){}
+  }
+  document.addEventListener('DOMContentLoaded',()=>{
+    if(!document.getElementById('map')) return;
+    document.getElementById('map-n').addEventListener('change',load);
+    window.addEventListener('resize',draw);
+    load(); setInterval(load,300000);
+  });
+})();
+"""
+
+def render_map_page():
+    f = io.StringIO()
+    f.write("<html><head><meta charset='UTF-8'><meta name='viewport' content='width=device-width,initial-scale=1'>")
+    f.write(asset_tags())
+    f.write("<style>body{text-align:center;}</style>")
+    f.write(f"<script>const MAP_TILES={json.dumps(MAP_TILE_URL)};const MAP_ATTR={json.dumps(MAP_TILE_ATTRIBUTION)};</script></head><body>")
+    f.write(nav_html("zemelapis"))
+    f.write(f"<h2>{t('map_title','Ground tracks and footprints')}</h2>")
+    f.write(f"<div class='filters'><label>{t('map_passes','Passes per satellite')} <select id='map-n'>")
+    for n in range(1, 6):
+        sel = " selected" if n == MAP_PASSES else ""
+        f.write(f"<option value='{n}'{sel}>{n}</option>")
+    f.write("</select></label></div>")
+    f.write("<div id='map'></div></body></html>")
+    return f.getvalue()
+
+def render_settings_page():
+    f = io.StringIO()
+    f.write("<html><head><meta charset='UTF-8'>")
+    f.write(asset_tags())
+    f.write("<style>")
+    f.write("form{width:90%;max-width:900px;margin:10px auto 24px;background:#1b1b1b;border:1px solid #333;border-radius:10px;padding:16px;}")
+    f.write(".row{display:grid;grid-template-columns:1fr 2fr;gap:10px;margin-bottom:10px;align-items:center;}")
+    f.write(".row label{color:#ccc;}")
+    f.write(".row input, .row textarea, .row select{width:100%;padding:8px 10px;border:1px solid #444;border-radius:6px;background:#111;color:#eee;}")
+    f.write(".hint{color:#aaa;font-size:12px;margin-top:-6px;margin-bottom:12px;}")
+    f.write(".actions{display:flex;gap:10px;justify-content:flex-start;margin-top:12px;flex-wrap:wrap}")
+    f.write(".btn{padding:10px 14px;border-radius:8px;border:1px solid #0b640b;background:#0b640b;color:#dfffdc;cursor:pointer;font-weight:700;}")
+    f.write(".btn.secondary{border-color:#444;background:#222;color:#eee}")
+    f.write(".btn.confirm{border-color:#0b640b;background:#0b640b;color:#dfffdc;}")
+    f.write(".note{width:90%;max-width:900px;margin:0 auto;color:#bbb;}")
+    f.write(".panel{width:90%;max-width:900px;margin:0 auto 24px;background:#1b1b1b;border:1px solid #333;border-radius:10px;padding:16px;}")
+    f.write(".panel h3{margin:0 0 12px 0;}")
+    f.write(".sat-grid{display:grid;grid-template-columns:1fr 1fr;gap:16px;}")
+    f.write(".listbox{border:1px solid #333;background:#111;border-radius:8px;min-height:220px;max-height:340px;overflow:auto;padding:8px;}")
+    f.write(".item{display:flex;justify-content:space-between;align-items:center;padding:6px 8px;border-bottom:1px solid #222;}")
+    f.write(".item:last-child{border-bottom:none}")
+    f.write(".item .name{color:#eee;font-size:14px;}")
+    f.write(".item button{border:1px solid #444;background:#222;color:#eee;border-radius:6px;padding:4px 8px;cursor:pointer}")
+    f.write(".item button:hover{background:#333}")
+    f.write(".searchbar{display:flex;gap:8px;margin-bottom:10px}")
+    f.write(".searchbar input{flex:1}")
+    f.write("</style>")
+    f.write("<script>")
+    f.write("const STR_SAVED="+json.dumps(t("saved_alert","Settings saved and applied."))+";")
+    f.write("const STR_SAVEERR="+json.dumps(t("save_err_alert","Failed to save settings."))+";")
+    f.write("const STR_REPLAN_PROC="+json.dumps(t("replan_processing","Replanning..."))+";")
+    f.write("const STR_REPLAN_DONE="+json.dumps(t("replan_done","Replanned"))+";")
+    f.write("const STR_REPLAN_ERR="+json.dumps(t("replan_error","Error"))+";")
+    f.write("const STR_REPLAN_NOTE="+json.dumps(t("replan_note","Open the Passes page."))+";")
+    f.write("const STR_LIST_EMPTY="+json.dumps(t("list_empty","List is empty"))+";")
+    f.write("const STR_NO_MATCHES="+json.dumps(t("no_matches","No matches"))+";")
+    f.write("const STR_CLEAN_DONE="+json.dumps(t("cleanup_done","Deleted folders: {n}"))+";")
+    f.write("const STR_BTN_ADD="+json.dumps(t("btn_add","Add"))+";")
+    f.write("const STR_BTN_REMOVE="+json.dumps(t("btn_remove","Remove"))+";")
+    f.write(r"""
+document.addEventListener('DOMContentLoaded',()=>{
   function fillForm(data){
     for(const k in data){
       const el=document.querySelector(`[name="${k}"]`);
@@ -1307,7 +3949,10 @@ document.addEventListener('DOMContentLoaded',()=>{
     params.append('USE_MANUAL_TLE', useManual && useManual.checked ? '1' : '0');
 
     const r=await fetch('/api/settings',{method:'POST',headers:{'Content-Type':'application/x-www-form-urlencoded'},body:params});
-    if(r.ok){ await r.json(); alert(STR_SAVED); }
+    if(r.ok){
+      const j = await r.json(); alert(j.ok ? STR_SAVED : STR_SAVEERR + ' ' + (j.error||''));
+      if((j.applied||[]).includes('HTTP_PORT')){ location.port = String(j.saved.HTTP_PORT); }
+    }
     else{ alert(STR_SAVEERR); }
   });
 
@@ -1395,8 +4040,11 @@ document.addEventListener('DOMContentLoaded',()=>{
     });
   }
 
+  let searchSeq=0;
   async function doSearch(){
+    const my=++searchSeq;
     const j = await (await fetch('/api/tle_names?q='+encodeURIComponent((qInput.value||'').trim()),{cache:'no-store'})).json();
+    if(my!==searchSeq) return;  // a newer keystroke already asked
     renderResults(j.names||[]);
   }
 
@@ -1423,10 +4071,15 @@ document.addEventListener('DOMContentLoaded',()=>{
     replanMsg.textContent = '';
     try{
       const r = await fetch('/api/replan?ts='+Date.now(), {cache:'no-store'});
-      const j = await r.json();
-      if(j.ok){
+      let j = await r.json();
+      while(j.ok !== false && j.state !== 'done' && j.state !== 'error'){
+        await new Promise(res=>setTimeout(res, 500));
+        j = await (await fetch('/api/jobs/'+(j.job||j.id), {cache:'no-store'})).json();
+        if(j.stage) replanMsg.textContent = j.stage + '... ' + j.elapsed.toFixed(1) + ' s';
+      }
+      if(j.state === 'done'){
         replanBtn.textContent = """ + json.dumps(t("replan_done","Replanned")) + r""";
-        replanMsg.textContent = 'Passes: ' + j.count + '. ' + """ + json.dumps(t("replan_note","Open the Passes page.")) + r""";
+        replanMsg.textContent = 'Passes: ' + j.result + ' (' + j.elapsed.toFixed(1) + ' s). ' + """ + json.dumps(t("replan_note","Open the Passes page.")) + r""";
       }else{
         replanBtn.textContent = """ + json.dumps(t("replan_error","Error")) + r""";
         replanMsg.textContent = 'Failed: ' + (j.error||'');
@@ -1461,148 +4114,152 @@ document.addEventListener('DOMContentLoaded',()=>{
   });
 
 });
-        """)
-        f.write("</script></head><body>")
-        f.write(nav_html("nustatymai"))
-        f.write(f"<h2>{t('settings_title','Settings')}</h2>")
-
-        # Settings form
-        f.write("<form id='settings-form' novalidate>")
-
-        def row(name,label,input_html, hint=""):
-            f.write("<div class='row'>")
-            f.write(f"<label for='{name}'>{label}</label>")
-            f.write(input_html)
-            f.write("</div>")
-            if hint:
-                f.write(f"<div class='hint'>{hint}</div>")
-
-        row("LANG", t("lang_label","Language"),
-            "<select id='LANG' name='LANG'>"
-            f"<option value='lt'>{t('lang_lt','Lithuanian')}</option>"
-            f"<option value='en'>{t('lang_en','English')}</option>"
-            "</select>","")
-
-        row("TLE_URL", t("tle_url_label","TLE URL"),
-            "<input type='text' id='TLE_URL' name='TLE_URL' required>",
-            "URL or local path")
-
-        row("USE_MANUAL_TLE", t("use_manual_tle","Use manual TLE (do not download from URL)"),
-            "<input type='checkbox' id='USE_MANUAL_TLE' name='USE_MANUAL_TLE'>","")
-
-        row("KOORD_LAT", t("coord_lat","Coordinate LAT"),
-            "<input type='text' id='KOORD_LAT' name='KOORD_LAT' inputmode='decimal' pattern='[-+]?[0-9]*[.,]?[0-9]+' required>",
-            "e.g., 55.57 or 55,57")
-
-        row("KOORD_LON", t("coord_lon","Coordinate LON"),
-            "<input type='text' id='KOORD_LON' name='KOORD_LON' inputmode='decimal' pattern='[-+]?[0-9]*[.,]?[0-9]+' required>",
-            "e.g., 24.25 or 24,25")
-
-        row("SERIAL_PORT", t("serial_port","Serial port"),
-            "<input type='text' id='SERIAL_PORT' name='SERIAL_PORT' required>","/dev/ttyACM0")
-
-        row("BAUDRATE", t("baudrate","BAUDRATE"),
-            "<input type='number' id='BAUDRATE' name='BAUDRATE' step='1' required>","9600, etc.")
-
-        row("UPDATE_INTERVAL", t("upd_interval","Update interval (s)"),
-            "<input type='number' id='UPDATE_INTERVAL' name='UPDATE_INTERVAL' step='1' required>","")
-
-        row("ALTITUDE_LIMIT", t("alt_limit","Horizon limit (deg)"),
-            "<input type='text' id='ALTITUDE_LIMIT' name='ALTITUDE_LIMIT' inputmode='decimal' pattern='[-+]?[0-9]*[.,]?[0-9]+' required>",
-            "0.0 = from horizon")
-
-        row("HTTP_PORT", t("http_port","HTTP port"),
-            "<input type='number' id='HTTP_PORT' name='HTTP_PORT' step='1' required>","")
-
-        row("NUOTRAUKU_KATALOGAS", t("out_dir","Output directory (images)"),
-            "<input type='text' id='NUOTRAUKU_KATALOGAS' name='NUOTRAUKU_KATALOGAS' required>","")
-
-        row("SATDUMP_SOURCE", t("sd_source","SatDump source"),
-            "<input type='text' id='SATDUMP_SOURCE' name='SATDUMP_SOURCE' required>",
-            "rtlsdr, rtl_tcp, airspy ...")
-
-        row("SATDUMP_RATE", t("sd_rate","SatDump sample rate (S/s)"),
-            "<input type='number' id='SATDUMP_RATE' name='SATDUMP_RATE' step='1' required>","e.g., 2400000")
-
-        row("SATDUMP_DEVICE_ARGS", t("sd_devargs","SatDump device-args"),
-            "<input type='text' id='SATDUMP_DEVICE_ARGS' name='SATDUMP_DEVICE_ARGS' required>",
-            "index=0,ppm=0,gain=49.6")
-
-        row("SATDUMP_MODE", t("sd_mode","SatDump mode"),
-            "<input type='text' id='SATDUMP_MODE' name='SATDUMP_MODE' required>",
-            t("mode_hint","start (during pass) or end (after pass)"))
-
-        row("SATDUMP_LEAD", t("sd_lead","SatDump lead (s)"),
-            "<input type='number' id='SATDUMP_LEAD' name='SATDUMP_LEAD' step='1' required>","")
-
-        row("SATDUMP_TAIL", t("sd_tail","SatDump tail (s)"),
-            "<input type='number' id='SATDUMP_TAIL' name='SATDUMP_TAIL' step='1' required>","")
-
-        # Gallery cleanup controls
-        f.write("<div class='panel'>")
-        f.write(f"<h3>{t('cleanup_title','Gallery cleanup')}</h3>")
-        row("GALLERY_KEEP_DAYS", t("cleanup_keep","Keep (days)"),
-            "<select id='GALLERY_KEEP_DAYS' name='GALLERY_KEEP_DAYS'>"
-            f"<option value='0'>{t('cleanup_off','Off')}</option>"
-            + "".join([f"<option value='{i}'>{i}</option>" for i in range(1,11)])
-            + "</select>",
-            "* If set > 0, older passes are deleted on startup and on Replan."
-        )
-        f.write("<div class='actions'>"
-                f"<button class='btn' id='btn-clean-now' type='button'>{t('cleanup_now','Clean now')}</button>"
-                "<span id='clean-status' style='margin-left:10px;color:#ccc;'></span>"
-                "</div>")
+    """)
+    f.write("</script></head><body>")
+    f.write(nav_html("nustatymai"))
+    f.write(f"<h2>{t('settings_title','Settings')}</h2>")
+
+    # Settings form
+    f.write("<form id='settings-form' novalidate>")
+
+    def row(name,label,input_html, hint=""):
+        f.write("<div class='row'>")
+        f.write(f"<label for='{name}'>{label}</label>")
+        f.write(input_html)
         f.write("</div>")
+        if hint:
+            f.write(f"<div class='hint'>{hint}</div>")
 
-        f.write("<div class='actions'>"
-                f"<button class='btn' type='submit'>{t('btn_save','Save')}</button>"
-                "</div>")
-        f.write("</form>")
-
-        # Manual TLE editor
-        f.write("<div class='panel'>")
-        f.write(f"<h3>{t('manual_tle_title','Manual TLE')}</h3>")
-        f.write(f"<div class='hint'>{t('manual_tle_hint','Pick a file or edit text. After saving, manual mode is enabled. Then click Replan.')}</div>")
-        f.write("<div class='row'><label>File</label>"
-                "<div class='actions'>"
-                "<input type='file' id='tle-file' accept='.txt' style='display:none'>"
-                f"<button class='btn secondary' id='tle-upload' type='button'>{t('manual_tle_upload','Upload TLE file...')}</button>"
-                "<span id='tle-status' style='margin-left:10px;color:#ccc;'></span>"
-                "</div></div>")
-        f.write("<div class='row'><label for='tle-text'>TLE</label>"
-                "<textarea id='tle-text' name='TLE_TEXT' rows='12' spellcheck='false' style='font-family:monospace;'></textarea></div>")
-        f.write("<div class='actions'>"
-                f"<button class='btn' id='tle-save' type='button'>{t('manual_tle_save_text','Save TLE (from text)')}</button>"
-                "</div>")
-        f.write("</div>")
+    row("LANG", t("lang_label","Language"),
+        "<select id='LANG' name='LANG'>"
+        f"<option value='lt'>{t('lang_lt','Lithuanian')}</option>"
+        f"<option value='en'>{t('lang_en','English')}</option>"
+        "</select>","")
 
-        # Satellite selection + Replan
-        f.write("<div class='panel'>")
-        f.write(f"<h3>{t('satlist_title','Satellite list (laikai.txt)')}</h3>")
-        f.write("<div class='sat-grid'>")
-        f.write("<div>")
-        f.write(f"<div class='searchbar'><input id='sat-q' type='text' placeholder='{t('search_placeholder','Search TLE name...')}'></div>")
-        f.write("<div id='sat-results' class='listbox'></div>")
-        f.write("</div>")
-        f.write("<div>")
-        f.write(f"<div style='margin-bottom:10px;color:#ccc;'>{t('current_list_label','Current list (stored to laikai.txt)')}</div>")
-        f.write("<div id='sat-chosen' class='listbox'></div>")
-        f.write("</div>")
-        f.write("</div>")
-        f.write("<div class='actions' style='margin-top:14px;'>"
-                f"<button class='btn' id='btn-replan-settings' type='button'>{t('replan_button','Replan')}</button>"
-                "<span id='replan-status' style='margin-left:10px;color:#ccc;'></span>"
-                "</div>")
-        f.write("</div>")
+    row("TLE_URL", t("tle_url_label","TLE URL"),
+        "<input type='text' id='TLE_URL' name='TLE_URL' required>",
+        "URLs or local paths, comma separated")
 
-        f.write(f"<div class='note'>{t('note_text','* After changes, click Replan to refresh Passes page.')}</div>")
-        f.write("</body></html>")
+    row("USE_MANUAL_TLE", t("use_manual_tle","Use manual TLE (do not download from URL)"),
+        "<input type='checkbox' id='USE_MANUAL_TLE' name='USE_MANUAL_TLE'>","")
 
-def atnaujinti_galerija(langai, ts, vieta):
-    os.makedirs(NUOTRAUKU_KATALOGAS, exist_ok=True)
-    now_local = to_local_naive(now_utc())
-    passes = nuskaityti_praejimus()
+    row("KOORD_LAT", t("coord_lat","Coordinate LAT"),
+        "<input type='text' id='KOORD_LAT' name='KOORD_LAT' inputmode='decimal' pattern='[-+]?[0-9]*[.,]?[0-9]+' required>",
+        "e.g., 55.57 or 55,57")
+
+    row("KOORD_LON", t("coord_lon","Coordinate LON"),
+        "<input type='text' id='KOORD_LON' name='KOORD_LON' inputmode='decimal' pattern='[-+]?[0-9]*[.,]?[0-9]+' required>",
+        "e.g., 24.25 or 24,25")
+
+    row("SERIAL_PORT", t("serial_port","Serial port"),
+        "<input type='text' id='SERIAL_PORT' name='SERIAL_PORT' required>","/dev/ttyACM0")
+
+    row("BAUDRATE", t("baudrate","BAUDRATE"),
+        "<input type='number' id='BAUDRATE' name='BAUDRATE' step='1' required>","9600, etc.")
+
+    row("UPDATE_INTERVAL", t("upd_interval","Update interval (s)"),
+        "<input type='number' id='UPDATE_INTERVAL' name='UPDATE_INTERVAL' step='1' required>","")
+
+    row("ALTITUDE_LIMIT", t("alt_limit","Horizon limit (deg)"),
+        "<input type='text' id='ALTITUDE_LIMIT' name='ALTITUDE_LIMIT' inputmode='decimal' pattern='[-+]?[0-9]*[.,]?[0-9]+' required>",
+        "0.0 = from horizon")
 
+    row("HTTP_PORT", t("http_port","HTTP port"),
+        "<input type='number' id='HTTP_PORT' name='HTTP_PORT' step='1' required>","")
+
+    row("NUOTRAUKU_KATALOGAS", t("out_dir","Output directory (images)"),
+        "<input type='text' id='NUOTRAUKU_KATALOGAS' name='NUOTRAUKU_KATALOGAS' required>","")
+
+    row("SATDUMP_SOURCE", t("sd_source","SatDump source"),
+        "<input type='text' id='SATDUMP_SOURCE' name='SATDUMP_SOURCE' required>",
+        "rtlsdr, rtl_tcp, airspy ...")
+
+    row("SATDUMP_RATE", t("sd_rate","SatDump sample rate (S/s)"),
+        "<input type='number' id='SATDUMP_RATE' name='SATDUMP_RATE' step='1' required>","e.g., 2400000")
+
+    row("SATDUMP_DEVICE_ARGS", t("sd_devargs","SatDump device-args"),
+        "<input type='text' id='SATDUMP_DEVICE_ARGS' name='SATDUMP_DEVICE_ARGS' required>",
+        "index=0,ppm=0,gain=49.6")
+
+    row("SATDUMP_MODE", t("sd_mode","SatDump mode"),
+        "<input type='text' id='SATDUMP_MODE' name='SATDUMP_MODE' required>",
+        t("mode_hint","start (during pass) or end (after pass)"))
+
+    row("SATDUMP_LEAD", t("sd_lead","SatDump lead (s)"),
+        "<input type='number' id='SATDUMP_LEAD' name='SATDUMP_LEAD' step='1' required>","")
+
+    row("SATDUMP_TAIL", t("sd_tail","SatDump tail (s)"),
+        "<input type='number' id='SATDUMP_TAIL' name='SATDUMP_TAIL' step='1' required>","")
+
+    # Gallery cleanup controls
+    f.write("<div class='panel'>")
+    f.write(f"<h3>{t('cleanup_title','Gallery cleanup')}</h3>")
+    row("GALLERY_KEEP_DAYS", t("cleanup_keep","Keep (days)"),
+        "<select id='GALLERY_KEEP_DAYS' name='GALLERY_KEEP_DAYS'>"
+        f"<option value='0'>{t('cleanup_off','Off')}</option>"
+        + "".join([f"<option value='{i}'>{i}</option>" for i in range(1,11)])
+        + "</select>",
+        "* If set > 0, older passes are deleted on startup and on Replan."
+    )
+    row("TILES_ENABLE", t("tiles_enable","Deep-zoom tiles"),
+        "<select id='TILES_ENABLE' name='TILES_ENABLE'>"
+        f"<option value='0'>{t('cleanup_off','Off')}</option>"
+        f"<option value='1'>{t('tiles_on','On')}</option>"
+        "</select>",
+        t("tiles_hint","Tile pyramid for images larger than 2048 px (more SD card space)."))
+    f.write("<div class='actions'>"
+            f"<button class='btn' id='btn-clean-now' type='button'>{t('cleanup_now','Clean now')}</button>"
+            "<span id='clean-status' style='margin-left:10px;color:#ccc;'></span>"
+            "</div>")
+    f.write("</div>")
+
+    f.write("<div class='actions'>"
+            f"<button class='btn' type='submit'>{t('btn_save','Save')}</button>"
+            "</div>")
+    f.write("</form>")
+
+    # Manual TLE editor
+    f.write("<div class='panel'>")
+    f.write(f"<h3>{t('manual_tle_title','Manual TLE')}</h3>")
+    f.write(f"<div class='hint'>{t('manual_tle_hint','Pick a file or edit text. After saving, manual mode is enabled. Then click Replan.')}</div>")
+    f.write("<div class='row'><label>File</label>"
+            "<div class='actions'>"
+            "<input type='file' id='tle-file' accept='.txt' style='display:none'>"
+            f"<button class='btn secondary' id='tle-upload' type='button'>{t('manual_tle_upload','Upload TLE file...')}</button>"
+            "<span id='tle-status' style='margin-left:10px;color:#ccc;'></span>"
+            "</div></div>")
+    f.write("<div class='row'><label for='tle-text'>TLE</label>"
+            "<textarea id='tle-text' name='TLE_TEXT' rows='12' spellcheck='false' style='font-family:monospace;'></textarea></div>")
+    f.write("<div class='actions'>"
+            f"<button class='btn' id='tle-save' type='button'>{t('manual_tle_save_text','Save TLE (from text)')}</button>"
+            "</div>")
+    f.write("</div>")
+
+    # Satellite selection + Replan
+    f.write("<div class='panel'>")
+    f.write(f"<h3>{t('satlist_title','Satellite list (laikai.txt)')}</h3>")
+    f.write("<div class='sat-grid'>")
+    f.write("<div>")
+    f.write(f"<div class='searchbar'><input id='sat-q' type='text' placeholder='{t('search_placeholder','Search TLE name...')}'></div>")
+    f.write("<div id='sat-results' class='listbox'></div>")
+    f.write("</div>")
+    f.write("<div>")
+    f.write(f"<div style='margin-bottom:10px;color:#ccc;'>{t('current_list_label','Current list (stored to laikai.txt)')}</div>")
+    f.write("<div id='sat-chosen' class='listbox'></div>")
+    f.write("</div>")
+    f.write("</div>")
+    f.write("<div class='actions' style='margin-top:14px;'>"
+            f"<button class='btn' id='btn-replan-settings' type='button'>{t('replan_button','Replan')}</button>"
+            "<span id='replan-status' style='margin-left:10px;color:#ccc;'></span>"
+            "</div>")
+    f.write("</div>")
+
+    f.write(f"<div class='note'>{t('note_text','* After changes, click Replan to refresh Passes page.')}</div>")
+    f.write("</body></html>")
+    return f.getvalue()
+
+def render_index_page(langai, recent):
+    now_local = to_local_naive(now_utc())
     rows = []
     for t1, t2, pav, sat, tculm, max_elev in langai:
         start_local = to_local_naive(t1.utc_datetime())
@@ -1630,194 +4287,247 @@ def atnaujinti_galerija(langai, ts, vieta):
 
     selected_now = set(get_selected_ids())
 
-    # index.html
-    with open(os.path.join(BASE_DIR, "index.html"), "w", encoding="utf-8") as f:
-        f.write("<html><head><meta charset='UTF-8'><style>")
-        f.write("body{background:#111;color:#eee;font-family:sans-serif;text-align:center;}")
-        f.write(nav_css())
-        f.write("h2{text-align:center;margin:20px 0 6px;}")
-        f.write(".legend{font-size:12px;opacity:.9;margin-bottom:10px;}")
-        f.write(".legend .swatch{display:inline-block;width:10px;height:10px;border-radius:50%;background:#ffd54f;margin:0 6px -1px 0;box-shadow:0 0 8px rgba(255,213,79,.5);}")
-        f.write("table{margin:auto;border-collapse:collapse;width:95%;}")
-        f.write("th,td{border:1px solid #444;padding:8px;}th{background:#333;}")
-        f.write(".visible{background:#223322;transition:background .3s,color .3s;}")
-        f.write(".tracking{background:#0b640b;color:#dfffdc;font-weight:bold;}")
-        f.write(".chosen{outline:2px solid #0f0;}")
-        f.write(".past{opacity:0.45;transition:opacity .3s;}")
-        f.write("td:nth-child(2),td:nth-child(3),td:nth-child(4),th:nth-child(2),th:nth-child(3),th:nth-child(4){text-align:center;}")
-        f.write(".pick{display:inline-flex;align-items:center;gap:6px;margin-right:8px;font-size:12px;opacity:.9}")
-        f.write(".badge-warn{display:inline-flex;align-items:center;gap:6px;background:#ffd54f;color:#111;font-weight:700;border-radius:999px;padding:2px 8px;font-size:11px;box-shadow:0 0 8px rgba(255,213,79,.5);margin-right:8px;}")
-        f.write(".grid{display:grid;grid-template-columns:repeat(auto-fill,minmax(320px,1fr));gap:16px;width:95%;margin:20px auto;}")
-        f.write(".card{background:#1b1b1b;border:1px solid #333;border-radius:8px;overflow:hidden;box-shadow:0 2px 10px rgba(0,0,0,.3);}")
-        f.write(".thumbwrap{width:100%;height:300px;display:block;overflow:hidden;background:#000;}")
-        f.write(".thumbwrap img{width:100%;height:100%;object-fit:cover;display:block;}")
-        f.write(".meta{padding:10px 12px;font-size:14px;color:#ddd;}")
-        f.write(".meta .title{font-weight:600;color:#fff;margin-bottom:4px;text-align:center;}")
-        f.write(".meta .time{opacity:.8;text-align:center;}")
-        f.write("a{color:#0f0;text-decoration:none}")
-        f.write("</style>")
-        f.write("<script>")
-        f.write("function updateClock(){var el=document.getElementById('nav-clock'); if(el){el.textContent=new Date().toLocaleTimeString();}}")
-        f.write("function updateRows(){const now=Date.now();document.querySelectorAll('tr[data-start][data-end]').forEach(tr=>{const t1=Date.parse(tr.dataset.start);const t2=Date.parse(tr.dataset.end);tr.classList.remove('visible','past');if(now>=t1&&now<=t2){tr.classList.add('visible')}else if(now>t2){tr.classList.add('past')}});}")
-        f.write("async function pollTracking(){try{const r=await fetch('current.json?ts='+Date.now(),{cache:'no-store'});const j=await r.json();const id=(j&&j.id)||'';document.querySelectorAll('tr[data-id]').forEach(tr=>{tr.classList.toggle('tracking',tr.dataset.id===id);});}catch(e){}}")
-        f.write("async function pollSelection(){try{const r=await fetch('selection.json?ts='+Date.now(),{cache:'no-store'});const j=await r.json();const ids=(j&&j.ids)||[];document.querySelectorAll('tr[data-id]').forEach(tr=>{tr.classList.toggle('chosen',ids.includes(tr.dataset.id));});document.addEventListener('change',onPick);document.querySelectorAll('input.choose').forEach(cb=>{cb.checked=ids.includes(cb.dataset.id);});}catch(e){}}")
-        f.write("async function onPick(e){const cb=e.target; if(!cb || !cb.matches('input.choose')) return; const id=cb.dataset.id; const op=cb.checked?'add':'remove'; try{const resp=await fetch('/api/select?op='+op+'&id='+encodeURIComponent(id),{cache:'no-store'}); if(!resp.ok) throw new Error('HTTP '+resp.status);}catch(err){alert('Save failed');} }")
-        f.write("document.addEventListener('DOMContentLoaded',()=>{updateClock();updateRows();pollTracking();pollSelection();setInterval(updateClock,1000);setInterval(updateRows,1000);setInterval(pollTracking,2000);setInterval(pollSelection,2000);});")
-        f.write("</script></head><body>")
-        f.write(nav_html("laikai"))
-        f.write(f"<h2>{t('h2_laikai','Pass windows (local time)')}</h2>")
-        f.write(f"<div class='legend'><span class='swatch'></span> {t('legend_conflict','Conflicting time')}</div>")
-        f.write("<table>")
-        f.write(f"<tr><th>{t('tbl_satellite','Satellite')}</th><th>{t('tbl_aos','AOS')}</th><th>{t('tbl_los','LOS')}</th><th>{t('tbl_maxelev','Max elevation')}</th></tr>")
-
-        for r in rows:
-            cls = ""
-            if r["st_loc"] <= now_local <= r["en_loc"]:
-                cls = "visible"
-            elif r["en_loc"] < now_local:
-                cls = "past"
-            chosen_cls = " chosen" if r["id"] in selected_now else ""
-            f.write(f'<tr class="{cls}{chosen_cls}" data-id="{r["id"]}" data-start="{r["st_iso"]}" data-end="{r["en_iso"]}">')
-            if r["id"] in overlap_ids:
-                checked_attr = ' checked' if r["id"] in selected_now else ''
-                f.write("<td>")
-                f.write(f'<span class="badge-warn" title="{t("badge_conflict","Conflict")}">[!] {t("badge_conflict","Conflict")}</span>')
-                f.write(f'<label class="pick"><input class="choose" type="checkbox" data-id="{r["id"]}"{checked_attr}> {t("follow","Follow")}</label>')
-                f.write(f"{r['pav']}</td>")
-            else:
-                f.write(f"<td>{r['pav']}</td>")
-            f.write(f"<td>{r['st_loc'].strftime('%H:%M')}</td>")
-            f.write(f"<td>{r['en_loc'].strftime('%H:%M')}</td>")
-            f.write(f"<td>{r['max']:.0f}</td>")
-            f.write("</tr>")
-
-        f.write("</table>")
-        f.write("<img src='palydovai_elevacijos_grafikas.png' style='margin-top:10px;max-width:95%;'>")
-
-        f.write(f"<h2 style='margin-top:20px'>{t('recent_passes','Recent passes')}</h2>")
-        f.write("<div class='grid'>")
-        for p in passes[:8]:
-            thumb_rel = None
-            if p["thumbs"]:
-                thumb_rel = p["thumbs"][0]
-            elif p["images"]:
-                thumb_rel = p["images"][0]
-            if not thumb_rel:
-                continue
-            thumb_rel = os.path.relpath(thumb_rel, BASE_DIR).replace("\\", "/")
-            sat = (p["meta"] or {}).get("satellite", p["name"].split("_", 1)[-1])
-            start_local_str = (p["meta"] or {}).get("start_local", "")
-            pass_page = f"pass-{p['name']}.html"
-            f.write("<div class='card'>")
-            f.write(f"<a class='thumbwrap' href='{pass_page}'><img src='{thumb_rel}' alt='thumb'></a>")
-            f.write("<div class='meta'>")
-            f.write(f"<div class='title'>{sat}</div>")
-            if start_local_str:
-                try:
-                    dt = datetime.fromisoformat(start_local_str)
-                    f.write(f"<div class='time'>{dt.strftime('%Y-%m-%d %H:%M')}</div>")
-                except Exception:
-                    f.write(f"<div class='time'>{start_local_str}</div>")
-            f.write("</div></div>")
-        f.write("</div></body></html>")
-
-    # gallery + settings
-    write_gallery_page(passes)
-    write_settings_page()
+    f = io.StringIO()
+    f.write("<html><head><meta charset='UTF-8'>")
+    f.write(asset_tags())
+    f.write("<style>")
+    f.write("body{text-align:center;}")
+    f.write("h2{margin:20px 0 6px;}")
+    f.write(".legend{font-size:12px;opacity:.9;margin-bottom:10px;}")
+    f.write(".legend .swatch{display:inline-block;width:10px;height:10px;border-radius:50%;background:#ffd54f;margin:0 6px -1px 0;box-shadow:0 0 8px rgba(255,213,79,.5);}")
+    f.write("table{margin:auto;border-collapse:collapse;width:95%;}")
+    f.write("th,td{border:1px solid #444;padding:8px;}th{background:#333;}")
+    f.write(".visible{background:#223322;transition:background .3s,color .3s;}")
+    f.write(".tracking{background:#0b640b;color:#dfffdc;font-weight:bold;}")
+    f.write(".chosen{outline:2px solid #0f0;}")
+    f.write(".past{opacity:0.45;transition:opacity .3s;}")
+    f.write("td:nth-child(2),td:nth-child(3),td:nth-child(4),th:nth-child(2),th:nth-child(3),th:nth-child(4){text-align:center;}")
+    f.write(".pick{display:inline-flex;align-items:center;gap:6px;margin-right:8px;font-size:12px;opacity:.9}")
+    f.write(".badge-warn{display:inline-flex;align-items:center;gap:6px;background:#ffd54f;color:#111;font-weight:700;border-radius:999px;padding:2px 8px;font-size:11px;box-shadow:0 0 8px rgba(255,213,79,.5);margin-right:8px;}")
+    f.write("</style>")
+    f.write("<script>")
+    f.write("const STR_LIVE_IDLE="+json.dumps(t("live_idle","Idle"))+";")
+    f.write("const STR_PLAN_EMPTY="+json.dumps(t("plan_empty","No planned passes"))+";")
+    f.write("function updateRows(){const now=Date.now();document.querySelectorAll('tr[data-start][data-end]').forEach(tr=>{const t1=Date.parse(tr.dataset.start);const t2=Date.parse(tr.dataset.end);tr.classList.remove('visible','past');if(now>=t1&&now<=t2){tr.classList.add('visible')}else if(now>t2){tr.classList.add('past')}});}")
+    f.write("async function pollTracking(){try{const r=await fetch('current.json?ts='+Date.now(),{cache:'no-store'});const j=await r.json();const id=(j&&j.id)||'';document.querySelectorAll('tr[data-id]').forEach(tr=>{tr.classList.toggle('tracking',tr.dataset.id===id);});}catch(e){}}")
+    f.write("async function pollSelection(){try{const r=await fetch('selection.json?ts='+Date.now(),{cache:'no-store'});const j=await r.json();const ids=(j&&j.ids)||[];document.querySelectorAll('tr[data-id]').forEach(tr=>{tr.classList.toggle('chosen',ids.includes(tr.dataset.id));});document.addEventListener('change',onPick);document.querySelectorAll('input.choose').forEach(cb=>{cb.checked=ids.includes(cb.dataset.id);});}catch(e){}}")
+    f.write("async function onPick(e){const cb=e.target; if(!cb || !cb.matches('input.choose')) return; const id=cb.dataset.id; const op=cb.checked?'add':'remove'; try{const resp=await fetch('/api/select?op='+op+'&id='+encodeURIComponent(id),{cache:'no-store'}); if(!resp.ok) throw new Error('HTTP '+resp.status);}catch(err){alert('Save failed');} }")
+    f.write("document.addEventListener('DOMContentLoaded',()=>{updateRows();pollTracking();pollSelection();setInterval(updateRows,1000);if(window.EventSource){startLive();}else{setInterval(pollTracking,2000);}setInterval(pollSelection,2000);});")
+    f.write("</script></head><body>")
+    f.write(nav_html("laikai"))
+    f.write(f"<h2>{t('h2_laikai','Pass windows (local time)')}</h2>")
+    f.write(f"<div class='legend'><span class='swatch'></span> {t('legend_conflict','Conflicting time')}</div>")
+    f.write(f"<div class='live'><span><span class='k'>{t('live_title','Live')}:</span><span id='live-phase'>{t('live_idle','Idle')}</span></span>"
+            "<span id='live-pass'>-</span><span><span class='k'>az/el</span><span id='live-azel'>-</span></span>"
+            "<span><span class='k'>cmd</span><span id='live-cmd'>-</span></span><span><span class='k'>act</span><span id='live-act'>-</span></span>"
+            "<span><span class='k'>SatDump</span><span id='live-sd'>-</span></span><a id='live-prod' href='#'></a></div>")
+    f.write("<table>")
+    f.write(f"<tr><th>{t('tbl_satellite','Satellite')}</th><th>{t('tbl_aos','AOS')}</th><th>{t('tbl_los','LOS')}</th><th>{t('tbl_maxelev','Max elevation')}</th></tr>")
+
+    for r in rows:
+        cls = ""
+        if r["st_loc"] <= now_local <= r["en_loc"]:
+            cls = "visible"
+        elif r["en_loc"] < now_local:
+            cls = "past"
+        chosen_cls = " chosen" if r["id"] in selected_now else ""
+        f.write(f'<tr class="{cls}{chosen_cls}" data-id="{r["id"]}" data-start="{r["st_iso"]}" data-end="{r["en_iso"]}">')
+        if r["id"] in overlap_ids:
+            checked_attr = ' checked' if r["id"] in selected_now else ''
+            f.write("<td>")
+            f.write(f'<span class="badge-warn" title="{t("badge_conflict","Conflict")}">[!] {t("badge_conflict","Conflict")}</span>')
+            f.write(f'<label class="pick"><input class="choose" type="checkbox" data-id="{r["id"]}"{checked_attr}> {t("follow","Follow")}</label>')
+            f.write(f"{r['pav']}</td>")
+        else:
+            f.write(f"<td>{r['pav']}</td>")
+        f.write(f"<td>{r['st_loc'].strftime('%H:%M')}</td>")
+        f.write(f"<td>{r['en_loc'].strftime('%H:%M')}</td>")
+        f.write(f"<td><a href='/api/skyplot/{r['id']}.svg' target='_blank' title='{t('skyplot','Sky plot')}'>{r['max']:.0f}</a></td>")
+        f.write("</tr>")
+
+    f.write("</table>")
+    f.write("<div id='plan-chart' class='chart'></div>")
+
+    f.write(f"<h2 style='margin-top:20px'>{t('recent_passes','Recent passes')}</h2>")
+    f.write("<div class='grid'>")
+    for p in recent:
+        f.write(_card_html(p))
+    f.write("</div></body></html>")
+    return f.getvalue()
+
+def render_pass_page(p):
+    sat = (p["meta"] or {}).get("satellite", p["name"].split("_", 1)[-1])
+    start_local_str = (p["meta"] or {}).get("start_local", p["name"][:13])
+    imgs = p["images"]
+    f2 = io.StringIO()
+    f2.write("<html><head><meta charset='UTF-8'>")
+    f2.write(asset_tags())
+    f2.write("</head><body>")
+    f2.write(nav_html("galerija"))
+    f2.write("<div class='wrap'>")
+    f2.write(f"<div class='title'>{sat}</div>")
+    f2.write(f"<div class='time'>{start_local_str}</div>")
+    f2.write(f"<img class='skyplot' src='/api/skyplot/{p['name']}.svg' loading='lazy' alt='{t('skyplot','Sky plot')}' onerror=\"this.remove()\">")
+    f2.write("<div class='grid'>")
+    for img in imgs:
+        rel = _rel(img)
+        fn = os.path.basename(img)
+        preview = _deriv_rel(p, fn, "preview")
+        if preview:
+            srcset = _srcset(p, fn, ("thumb", "preview", "large"))
+            big = _deriv_rel(p, fn, "large") or preview
+            dzi = p["derivs"][fn].get("dzi")
+            zoom_attr = ""
+            if dzi:
+                files = _rel(os.path.join(p["dir"], "_tiles", f"{fn}_files"))
+                zoom_attr = (f" data-dzi='{files}' data-w='{dzi[0]}' data-h='{dzi[1]}'"
+                             f" data-ts='{TILE_SIZE}' data-fmt='{p['derivs'][fn]['ext']}'")
+            f2.write(f"<div class='item'><a href='{big}' class='img-link'{zoom_attr}>"
+                     f"<img src='{preview}' srcset='{srcset}' sizes='{ITEM_SIZES}' loading='lazy' decoding='async' alt='img'></a>"
+                     f"<a class='orig' href='{rel}' target='_blank'>{t('original_link','Original')}</a></div>")
+        else:
+            thumb = os.path.join(p["dir"], "_thumbs", fn)
+            small = _rel(thumb) if thumb in p["thumbs"] else rel
+            f2.write(f"<div class='item'><a href='{rel}' class='img-link'><img src='{small}' loading='lazy' decoding='async' alt='img'></a></div>")
+    f2.write("</div></div>")
+    f2.write("<div id='viewer' class='viewer'><span class='close'>x</span><img id='viewer-img' src=''></div>")
+    f2.write("<div id='zoom' class='zoom'><canvas id='zoom-canvas'></canvas><span class='close'>x</span></div>")
+    f2.write("</body></html>")
+    return f2.getvalue()
+
+PLAN_CURVE_POINTS = 24
+
+def render_plan_json():
+    # compact plan for the browser chart: epoch seconds, elevation samples
+    # evenly spaced between AOS and LOS, one vectorized propagation per pass
+    plan = current_plan()
+    langai, ts, vieta = (plan.passes, plan.ts, plan.vieta) if plan else ((), None, None)
+    passes = []
+    for t1, t2, pav, sat, tculm, max_elev in langai:
+        st_loc = to_local_naive(t1.utc_datetime())
+        try:
+            alt, _, _ = (sat - vieta).at(ts.linspace(t1, t2, PLAN_CURVE_POINTS)).altaz()
+            curve = [round(float(e), 1) for e in alt.degrees]
+        except Exception:
+            curve = []
+        passes.append({
+            "id": f"{st_loc.strftime('%Y%m%d_%H%M')}_{sanitize_name(pav)}",
+            "sat": pav,
+            "aos": int(t1.utc_datetime().timestamp()),
+            "los": int(t2.utc_datetime().timestamp()),
+            "tmax": int(tculm.utc_datetime().timestamp()),
+            "max": round(float(max_elev), 1),
+            "el": curve,
+        })
+    return json.dumps({"v": plan.version if plan else 0,
+                       "lat": plan.lat if plan else KOORD_LAT, "lon": plan.lon if plan else KOORD_LON,
+                       "passes": passes}, separators=(",", ":"))
+
+# ---------------- Daemon ----------------
+# main() never returns: it always follows the newest published plan, so a
+# replan from the web UI reaches the tracker before its next pass, and TLEs
+# are refreshed on a timer instead of by restarting the script.
+TLE_REFRESH_HOURS = 12
+PLAN_MIN_AHEAD = 6 * 3600   # replan early when the plan runs out sooner than this
+PLAN_RETRY = 30 * 60        # minimum gap between scheduled replans
+DAEMON_IDLE = 60            # longest sleep between checks, seconds
+DAEMON_WAKE_EARLY = 30      # hand over to sekti this long before its own window
+
+def next_pass(plan, done, now):
+    # first pass of the plan that is not over and not already handled
+    for p in plan.passes if plan else ():
+        t1, t2, pav = p[0], p[1], p[2]
+        pid = f"{to_local_naive(t1.utc_datetime()).strftime('%Y%m%d_%H%M')}_{sanitize_name(pav)}"
+        if pid in done or t2.utc_datetime().timestamp() <= now:
+            continue
+        return pid, p
+    return None, None
 
-    # pass pages with lightbox
-    for p in passes:
-        pass_page = os.path.join(BASE_DIR, f"pass-{p['name']}.html")
-        sat = (p["meta"] or {}).get("satellite", p["name"].split("_", 1)[-1])
-        start_local_str = (p["meta"] or {}).get("start_local", p["name"][:13])
-        imgs = p["images"]
-        with open(pass_page, "w", encoding="utf-8") as f2:
-            f2.write("<html><head><meta charset='UTF-8'><style>")
-            f2.write("body{background:#111;color:#eee;font-family:sans-serif;}")
-            f2.write(nav_css())
-            f2.write("a{color:#0f0;text-decoration:none}")
-            f2.write(".wrap{width:95%;margin:12px auto 20px;text-align:center;}")
-            f2.write(".title{font-size:22px;font-weight:700;margin:8px 0 2px;}")
-            f2.write(".time{opacity:.85;margin-bottom:16px;}")
-            f2.write(".grid{display:grid;grid-template-columns:repeat(auto-fill,minmax(320px,1fr));gap:16px;}")
-            f2.write(".item{background:#1b1b1b;border:1px solid #333;border-radius:8px;overflow:hidden;}")
-            f2.write(".item img{width:100%;height:auto;display:block;cursor:zoom-in;}")
-            f2.write(".viewer{position:fixed;inset:0;background:rgba(0,0,0,.92);display:none;align-items:center;justify-content:center;z-index:9999;}")
-            f2.write(".viewer.show{display:flex;}")
-            f2.write(".viewer img{max-width:95%;max-height:95%;box-shadow:0 0 24px rgba(0,0,0,.8);}")
-            f2.write(".viewer .close{position:absolute;top:14px;right:22px;font-size:20px;cursor:pointer;color:#fff;opacity:.9}")
-            f2.write("</style>")
-            f2.write("<script>")
-            f2.write("document.addEventListener('DOMContentLoaded',function(){")
-            f2.write("  const v=document.getElementById('viewer');")
-            f2.write("  const vi=document.getElementById('viewer-img');")
-            f2.write("  function show(src){vi.src=src;v.classList.add('show');}")
-            f2.write("  function hide(){v.classList.remove('show');vi.src='';}")
-            f2.write("  document.querySelectorAll('a.img-link').forEach(a=>{")
-            f2.write("    a.addEventListener('click',e=>{e.preventDefault();show(a.getAttribute('href'));});")
-            f2.write("  });")
-            f2.write("  v.addEventListener('click',hide);")
-            f2.write("  document.addEventListener('keydown',e=>{if(e.key==='Escape')hide();});")
-            f2.write("  const tick=()=>{const e=document.getElementById('nav-clock'); if(e){e.textContent=new Date().toLocaleTimeString();}};")
-            f2.write("  tick(); setInterval(tick,1000);")
-            f2.write("});")
-            f2.write("</script></head><body>")
-            f2.write(nav_html("galerija"))
-            f2.write("<div class='wrap'>")
-            f2.write(f"<div class='title'>{sat}</div>")
-            f2.write(f"<div class='time'>{start_local_str}</div>")
-            f2.write("<div class='grid'>")
-            for img in imgs:
-                rel = os.path.relpath(img, BASE_DIR).replace("\\", "/")
-                f2.write(f"<div class='item'><a href='{rel}' class='img-link'><img src='{rel}' alt='img'></a></div>")
-            f2.write("</div></div>")
-            f2.write("<div id='viewer' class='viewer'><span class='close'>x</span><img id='viewer-img' src=''></div>")
-            f2.write("</body></html>")
-
-def nubraizyti_elevaciju_grafika(langai, ts, vieta):
-    if not langai:
-        fig, ax = plt.subplots(figsize=(12, 5))
-        ax.set_title("No planned passes")
-        plt.tight_layout()
-        plt.savefig(os.path.join(BASE_DIR, "palydovai_elevacijos_grafikas.png"))
-        plt.close()
-        return
+def _refresh_due(plan, now):
+    if plan is None:
+        return "no plan"
+    if now - plan.created >= TLE_REFRESH_HOURS * 3600:
+        return "scheduled TLE refresh"
+    last = plan.passes[-1][1].utc_datetime().timestamp() if plan.passes else 0
+    if last < now + PLAN_MIN_AHEAD and now - plan.created >= PLAN_RETRY:
+        return "plan running out"
+    return None
+
+def run_daemon():
+    done = set()
+    seen_version = 0
+    next_refresh = 0.0
+    announced = None
+    resumed = None
+    try:
+        resumed = resume_interrupted_pass(current_plan())
+    except Exception as e:
+        print("[RESUME] error:", e)
+    while True:
+        try:
+            PLAN_EVENT.clear()
+            now = time.time()
+            plan = current_plan()
+            if plan and plan.version != seen_version:
+                seen_version = plan.version
+                done &= set(plan.index)
+                print(f"[DAEMON] following plan v{plan.version} ({len(plan.passes)} passes)")
+
+            reason = _refresh_due(plan, now)
+            if reason and now >= next_refresh:
+                job_id, coalesced = submit_job("replan", replan_and_refresh)
+                next_refresh = now + PLAN_RETRY
+                print(f"[DAEMON] {reason} -> replan job {job_id}{' (joined)' if coalesced else ''}")
+
+            pid, p = next_pass(plan, done, now)
+            if p is not None and resumed and p[2] == resumed[1] \
+                    and p[0].utc_datetime().timestamp() < resumed[2]:
+                # the same pass under a fresh TLE; it was already resumed
+                done.add(pid)
+                continue
+            if p is None:
+                PLAN_EVENT.wait(DAEMON_IDLE)
+                continue
+            t1, t2, pav, sat, tculm, max_elev = p
+            cfg = CONFIG
+            lead = cfg.satdump_lead if cfg.satdump_mode == "start" else 0
+            hand_over = t1.utc_datetime().timestamp() - 20 - lead - DAEMON_WAKE_EARLY
+            if hand_over > now:
+                if announced != pid:
+                    announced = pid
+                    print(f"[DAEMON] next: {pid} in {int(hand_over - now)} s")
+                PLAN_EVENT.wait(min(DAEMON_IDLE, hand_over - now))
+                continue
 
-    times = []; sats = []; elevs = []
-    for t1, t2, pav, sat, tculm, max_elev in langai:
-        times.append(to_local_naive(t1.utc_datetime()).strftime("%H:%M"))
-        sats.append(pav)
-        elevs.append(max_elev)
-
-    x = np.arange(len(elevs))
-    fig, ax = plt.subplots(figsize=(12, 5))
-    bars = ax.bar(x, elevs, width=0.6)
-    ax.set_xticks(x)
-    ax.set_xticklabels([f"{t}\n{s}" for t, s in zip(times, sats)], fontsize=10, rotation=90)
-    ax.set_ylabel("Max elevation (deg)")
-    ax.set_title("Pass start times and their max elevation")
-    ax.set_ylim(0, max(elevs) + 10)
-    for bar, elev in zip(bars, elevs):
-        height = bar.get_height()
-        ax.annotate(f"{elev:.1f}", xy=(bar.get_x() + bar.get_width() / 2, height),
-                    xytext=(0, 3), textcoords="offset points", ha="center", va="bottom")
-    plt.tight_layout()
-    plt.savefig(os.path.join(BASE_DIR, "palydovai_elevacijos_grafikas.png"))
-    plt.close()
+            done.add(pid)
+            sekti(sat, t1, t2, plan.vieta, plan.ts, pav, pass_index=plan.index)
+        except Exception as e:
+            print("[DAEMON] error:", e)
+            time.sleep(DAEMON_IDLE)
 
 # ---------------- MAIN ----------------
+HEADLESS = "--headless" in sys.argv[1:] or os.environ.get("T40_HEADLESS") == "1"
+
 def main():
+    # no terminal (systemd, nohup) means nobody can answer the menu
+    headless = HEADLESS or not sys.stdin.isatty()
+    # systemctl stop sends SIGTERM, which would skip atexit (STATE.flush) and
+    # the rotor_close below; leave through SystemExit instead
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
     ensure_language_files()
     cfg = load_settings_file()
     apply_settings(cfg)
 
     os.makedirs(NUOTRAUKU_KATALOGAS, exist_ok=True)
+    gallery_index_open()
+    drop_static_pages()
 
     http_thread = threading.Thread(target=start_server, daemon=True)
     http_thread.start()
     set_current_pass("")
 
-    if GALLERY_KEEP_DAYS and GALLERY_KEEP_DAYS > 0:
+    # headless leaves the cleanup to the background replan
+    if not headless and GALLERY_KEEP_DAYS and GALLERY_KEEP_DAYS > 0:
         cleanup_gallery(GALLERY_KEEP_DAYS)
 
     prev_list = load_selected_list_from_file()
@@ -1827,43 +4537,30 @@ def main():
     else:
         set_selected_ids([])
 
-    atsisiusti_tle()
-    selected = pasirinkti_palydovus()
-
-    ts = load.timescale()
-    vieta = wgs84.latlon(latitude_degrees=KOORD_LAT, longitude_degrees=KOORD_LON)
-
-    all_passes = []
-    for name in selected:
-        l1, l2 = gauti_tle(name)
-        if not l1 or not l2:
-            print("No TLE for:", name)
-            continue
-        sat = EarthSatellite(l1, l2, name, ts)
-        all_passes.extend(rasti_langus(sat, ts, vieta, name))
-
-    all_passes.sort(key=lambda x: x[0].utc_datetime())
-    pass_index = build_pass_index(all_passes)
+    if headless:
+        # cached plan (or local TLEs) now; download and replan in the background
+        print("[STARTUP] headless: no menu, TLE refresh in background")
+        threading.Thread(target=rotor_open, daemon=True, name="rotor-open").start()
+        plan = load_plan_cache()
+        if plan is None and os.path.exists(TLE_FILENAME):
+            plan = build_plan()
+        if plan is not None:
+            publish_plan(plan)
+            startup_mark("plan ready")
+        submit_job("replan", replan_and_refresh)
+    else:
+        if not atsisiusti_tle() and not os.path.exists(TLE_FILENAME):
+            print("No local TLE file. Exiting.")
+            sys.exit(1)
+        selected = pasirinkti_palydovus()
 
-    nubraizyti_elevaciju_grafika(all_passes, ts, vieta)
-    atnaujinti_galerija(all_passes, ts, vieta)
+        publish_plan(build_plan(selected))
+        rotor_open()
 
-    ser = None
     try:
-        ser = serial.Serial(SERIAL_PORT, BAUDRATE, timeout=1)
-        time.sleep(2)
-        print(f"Serial open {SERIAL_PORT} @ {BAUDRATE}")
-    except Exception as e:
-        print("Cannot open serial:", e)
-        print("Will track without sending.")
-
-    for t1, t2, pav, sat, tculm, max_elev in all_passes:
-        sekti(sat, t1, t2, vieta, ts, pav, ser, pass_index=pass_index)
-        atnaujinti_galerija(all_passes, ts, vieta)
-        nubraizyti_elevaciju_grafika(all_passes, ts, vieta)
-
-    if ser:
-        ser.close()
+        run_daemon()
+    finally:
+        rotor_close()
 
 if __name__ == "__main__":
     main()